@@ -0,0 +1,104 @@
+# benchmarks/meal_plan_benchmark.py
+"""Benchmark /meal-plan: kualitas plan terhadap time budget solver.
+
+Untuk setiap budget, semua profil (mood x kondisi kesehatan) diplan lewat
+FoodRecommender.meal_plan di katalog asli (atau katalog sintetis --rows). Budget 0 = hanya
+greedy. Per budget dilaporkan objective rata-rata, gap terhadap objective terbaik yang
+ditemukan untuk profil yang sama (di budget mana pun), deviasi total harian dari target,
+dan latency (termasuk mengambil kandidat).
+
+    python benchmarks/meal_plan_benchmark.py --budgets 0 5 10 20 40 100 500 --days 7
+    python benchmarks/meal_plan_benchmark.py --days 31 --snacks 3 --output benchmarks/meal_plan_history.jsonl
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+MOODS = ('energizing', 'relaxing', 'focusing', 'neutral')
+CONDITIONS = (None, ['diabetes'], ['hipertensi'], ['kolesterol', 'obesitas'])
+
+
+def load_recommender(rows, seed):
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import main
+    if not rows:
+        return main, main.load_food_recommender(precompute=False)
+    from synthetic_catalog import load_template, synthetic_catalog
+    recommender = main.FoodRecommender()
+    recommender.food_df = synthetic_catalog(rows, load_template(), seed)
+    return main, recommender
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0, 2, 5, 10, 20, 40, 100, 500],
+                        help="time budget solver (ms)")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--snacks', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help="run per profil per budget")
+    parser.add_argument('--rows', type=int, help="pakai katalog sintetis N baris (default: katalog asli)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="tambahkan hasil (JSON per baris) ke file ini")
+    args = parser.parse_args()
+
+    main_module, recommender = load_recommender(args.rows, args.seed)
+    profiles = list(itertools.product(MOODS, CONDITIONS))
+    for mood, conditions in profiles:  # warm-up: kandidat masuk cache seperti di server
+        recommender.meal_plan(mood, args.days, conditions, args.snacks, budget=0)
+
+    runs = {}  # budget -> [(profil, objective, deviasi, latency ms, converged)]
+    for budget in args.budgets:
+        for (mood, conditions), _ in itertools.product(profiles, range(args.repeat)):
+            started = time.perf_counter()
+            candidates, plan, _, targets = recommender.meal_plan(mood, args.days, conditions, args.snacks,
+                                                                 budget=budget / 1000)
+            latency = (time.perf_counter() - started) * 1000
+            nutrients = candidates[list(main_module.MEAL_PLAN_NUTRIENTS)].to_numpy()
+            deviation = abs(nutrients[plan.items].sum(axis=1) / targets - 1)  # (hari, nutrisi)
+            runs.setdefault(budget, []).append(((mood, str(conditions)), plan.objective, deviation,
+                                                latency, plan.converged))
+
+    best = {}
+    for results in runs.values():
+        for profile, objective, *_ in results:
+            best[profile] = min(best.get(profile, objective), objective)
+
+    for budget, results in runs.items():
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'budget_ms': budget,
+            'days': args.days,
+            'snacks': args.snacks,
+            'rows': args.rows,
+            'runs': len(results),
+            'objective_mean': round(statistics.mean(r[1] for r in results), 4),
+            'gap_to_best_mean': round(statistics.mean(r[1] - best[r[0]] for r in results), 4),
+            'deviation_mean': round(statistics.mean(float(r[2].mean()) for r in results), 4),
+            'deviation_max': round(max(float(r[2].max()) for r in results), 4),
+            'converged': round(sum(r[4] for r in results) / len(results), 3),
+            'latency_mean_ms': round(statistics.mean(r[3] for r in results), 2),
+            'latency_p99_ms': round(percentile([r[3] for r in results], 0.99), 2),
+        }
+        line = json.dumps(result)
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
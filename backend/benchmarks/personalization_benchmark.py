@@ -0,0 +1,155 @@
+# benchmarks/personalization_benchmark.py
+"""Benchmark personalisasi /recommend (user_id): overhead per request dan throughput load profil.
+
+Store SQLite sementara diisi riwayat sintetis: tiap user menyukai/mengonsumsi beberapa makanan
+dan pernah ditampilkan beberapa makanan lain (diambil dari kandidat recommend_for_mood).
+Semua profil dimuat ke cache dulu (seperti setelah refresh background), lalu untuk tiap
+request dibandingkan latency rekomendasi biasa dengan jalur personalisasi lengkap
+(lookup profil, kandidat, personalize, catat yang ditampilkan). 'overhead' = bagian
+personalisasi saja (tanpa mengambil kandidat). Throughput load diukur untuk batch
+USER_LOAD_BATCH user (refresh background) dan untuk satu user (cache miss).
+
+    python benchmarks/personalization_benchmark.py --users 2000 --requests 5000
+    python benchmarks/personalization_benchmark.py --rows 300000 --output benchmarks/personalization_history.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+MOODS = ('energizing', 'relaxing', 'focusing', 'neutral')
+CONDITIONS = (None, ['diabetes'], ['hipertensi'], ['kolesterol', 'obesitas'])
+
+
+def load_recommender(rows, seed):
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import main
+    if not rows:
+        return main, main.load_food_recommender(precompute=True)
+    from synthetic_catalog import load_template, synthetic_catalog
+    recommender = main.FoodRecommender()
+    recommender.food_df = synthetic_catalog(rows, load_template(), seed)
+    recommender.enable_result_table()
+    return main, recommender
+
+
+def fill_store(store, recommender, users, liked, shown, rng):
+    """Riwayat sintetis: `liked` makanan disukai/dikonsumsi dan `shown` makanan ditampilkan per user"""
+    pool = sorted({name for mood in MOODS for name in recommender.recommend_for_mood(mood, 200)['name']})
+    now = time.time()
+    records = []
+    for user in range(users):
+        for i, name in enumerate(rng.sample(pool, liked + shown)):
+            is_liked = int(i < liked)
+            records.append((f'user-{user}', name, rng.choice(MOODS), 0.5, is_liked, is_liked and rng.random() < 0.5,
+                            now - rng.random() * 86400))
+    store.record(records)
+    return len(records)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summary(values):
+    return {'p50': round(percentile(values, 0.5), 3), 'p99': round(percentile(values, 0.99), 3),
+            'mean': round(statistics.mean(values), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--liked', type=int, default=10, help="makanan disukai/dikonsumsi per user")
+    parser.add_argument('--shown', type=int, default=30, help="makanan yang pernah ditampilkan per user")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--rows', type=int, help="pakai katalog sintetis N baris (default: katalog asli)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="tambahkan hasil (JSON per baris) ke file ini")
+    args = parser.parse_args()
+
+    main_module, recommender = load_recommender(args.rows, args.seed)
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp(prefix='nutrimood-users-')
+    try:
+        store = main_module.UserStore(os.path.join(directory, 'user_store.sqlite'))
+        history_rows = fill_store(store, recommender, args.users, args.liked, args.shown, rng)
+        user_ids = [f'user-{user}' for user in range(args.users)]
+
+        started = time.perf_counter()
+        for start in range(0, len(user_ids), main_module.USER_LOAD_BATCH):
+            store.load(user_ids[start:start + main_module.USER_LOAD_BATCH])
+        batch_load_s = time.perf_counter() - started
+        single = []
+        for user_id in rng.sample(user_ids, min(200, len(user_ids))):
+            started = time.perf_counter()
+            store.load([user_id])
+            single.append((time.perf_counter() - started) * 1000)
+
+        # Cache hangat: profil dimuat dan di-resolve seperti oleh refresh background
+        preferences = main_module.UserPreferences(store, maxsize=max(args.users, 1), refresh_seconds=0)
+        for user_id in user_ids:
+            preferences.get(user_id)
+        preferences.refresh(recommender)
+        for mood in MOODS:  # kandidat masuk cache seperti di server
+            for conditions in CONDITIONS:
+                recommender.recommend_for_mood(mood, main_module.PERSONALIZATION_CANDIDATES, conditions)
+
+        plain, personalized, overhead = [], [], []
+        for _ in range(args.requests):
+            mood, conditions, user_id = rng.choice(MOODS), rng.choice(CONDITIONS), rng.choice(user_ids)
+            started = time.perf_counter()
+            recommender.recommend_for_mood(mood, args.top_n, conditions)
+            plain.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            profile = preferences.get(user_id)
+            fetched = time.perf_counter()
+            candidates = recommender.recommend_for_mood(
+                mood, max(args.top_n, main_module.PERSONALIZATION_CANDIDATES), conditions)
+            ranked = time.perf_counter()
+            result = recommender.personalize(candidates, profile, args.top_n)
+            preferences.record_shown(profile, mood, result['name'].tolist(), result['similarity_score'].tolist())
+            finished = time.perf_counter()
+            personalized.append((finished - started) * 1000)
+            overhead.append((fetched - started + finished - ranked) * 1000)
+        preferences.flush()
+
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'rows': args.rows,
+            'users': args.users,
+            'history_rows': history_rows,
+            'requests': args.requests,
+            'top_n': args.top_n,
+            'candidates': main_module.PERSONALIZATION_CANDIDATES,
+            'plain_ms': summary(plain),
+            'personalized_ms': summary(personalized),
+            'overhead_ms': summary(overhead),
+            'batch_load_users_per_s': round(args.users / batch_load_s, 1),
+            'single_load_ms': summary(single),
+            'written': preferences.written,
+        }
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    line = json.dumps(result)
+    print(line, flush=True)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,508 @@
+# benchmarks/pipeline_benchmark.py
+"""Benchmark pipeline rekomendasi dengan katalog sintetis berbagai ukuran.
+
+Setiap ukuran katalog diukur di proses Python baru (agar peak memory tidak tercampur):
+generate katalog, build indeks, recommend_for_mood untuk semua mood x subset kondisi kesehatan
+(dihitung, LRU hit, tabel hasil), mode 'ann' (FeatureIndex: build, recall@10 terhadap exact,
+recommend tanpa cache), /recommend end-to-end lewat client ASGI in-process, pickle/unpickle
+dan save/load artifact, serta peak RSS. Hasil ditulis sebagai JSON.
+
+    pip install httpx   # client ASGI (juga dipakai TestClient)
+    python benchmarks/pipeline_benchmark.py --sizes 1000,10000,100000 --output results.json
+    python benchmarks/pipeline_benchmark.py --baseline benchmarks/baseline.json
+    python benchmarks/pipeline_benchmark.py --golden-only
+
+Golden check (selalu dijalankan kecuali --no-golden) membandingkan top 10 semua profil di
+katalog asli dengan benchmarks/golden_rankings.json, lewat jalur hitung dan tabel hasil.
+Setelah perubahan yang memang mengubah ranking, perbarui dengan --update-golden.
+
+Update check (bersama golden check) menerapkan batch upsert/delete kecil ke katalog asli lewat
+apply_updates (tabel hasil dan daftar tetangga inkremental), lalu membandingkan semua profil
+tabel hasil dan daftar tetangga setiap mood dengan recommender yang dibangun ulang penuh dari
+food_df hasil update.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+GOLDEN_PATH = os.path.join(BENCHMARK_DIR, 'golden_rankings.json')
+STAGES = ('recommend', 'ann', 'table', 'update', 'e2e', 'pickle', 'artifact')
+# Metrics dengan nilai lebih besar = lebih buruk; dibandingkan terhadap baseline. Regresi hanya
+# jika naik lebih dari --tolerance dan lebih dari noise floor absolut (ms / MB)
+COMPARED_SUFFIXES = ('_s', '_ms', '_mb')
+UNFLAGGED_SUFFIXES = ('max_ms', 'total_s')  # terlalu berisik / redundan dengan mean
+NOISE_FLOOR = {'_s': 1e-3, '_ms': 1.0, '_mb': 5.0}
+TOP_N = 10
+E2E_CONCURRENCY = 64
+E2E_ROUNDS = 8
+UPDATE_BATCH = 10000  # upsert per batch stage 'update' (paling banyak 10% katalog)
+
+
+def profiles():
+    """Semua mood x subset kondisi kesehatan (urutan tetap)"""
+    import main
+    conditions = ["diabetes", "hipertensi", "kolesterol", "obesitas", "alergi_gluten", "vegetarian"]
+    for mood in main.VALID_REQUEST_MOODS:
+        for r in range(len(conditions) + 1):
+            for subset in itertools.combinations(conditions, r):
+                yield mood, list(subset) or None
+
+
+def profile_key(mood, conditions):
+    return f"{mood}|{','.join(conditions or [])}"
+
+
+def latency_summary(seconds):
+    seconds = sorted(seconds)
+    return {
+        'calls': len(seconds),
+        'total_s': round(sum(seconds), 6),
+        'mean_ms': round(statistics.mean(seconds) * 1e3, 4),
+        'p50_ms': round(seconds[len(seconds) // 2] * 1e3, 4),
+        'p95_ms': round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1e3, 4),
+        'max_ms': round(seconds[-1] * 1e3, 4),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KiB, macOS: byte
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def rankings(recommender, record_latency=None):
+    """{profil: [[nama, skor], ...]} top TOP_N untuk semua profil"""
+    out = {}
+    for mood, conditions in profiles():
+        start = time.perf_counter()
+        result = recommender.recommend_for_mood(mood, TOP_N, conditions)
+        if record_latency is not None:
+            record_latency(time.perf_counter() - start)
+        out[profile_key(mood, conditions)] = [
+            [name, float(score)] for name, score in zip(result['name'], result['similarity_score'])
+        ]
+    return out
+
+
+def rankings_digest(ranked):
+    return hashlib.sha256(json.dumps(ranked, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def bench_recommend(recommender, result):
+    """recommend_for_mood tanpa cache (setiap profil dihitung) lalu dari LRU cache"""
+    compute = []
+    def uncached(seconds):
+        compute.append(seconds)
+        recommender.invalidate_results()  # profil berikutnya (mis. multi_category = neutral) tetap dihitung
+    ranked = rankings(recommender, uncached)
+    rankings(recommender)  # isi LRU cache
+    lru = []
+    rankings(recommender, lru.append)
+    result['recommend_compute'] = latency_summary(compute)
+    result['recommend_lru_hit'] = latency_summary(lru)
+    result['rankings_digest'] = rankings_digest(ranked)
+
+
+def bench_table(recommender, result):
+    recommender.invalidate_results()
+    _, result['result_table_build_s'] = timed(recommender.enable_result_table)
+    hits = []
+    rankings(recommender, hits.append)
+    result['recommend_table_hit'] = latency_summary(hits)
+
+
+def update_items(recommender, rows, names):
+    """Upsert berisi nilai dasar baris `rows` katalog dengan nama `names`"""
+    import main
+    schema = dict(recommender.frame_schema())
+    columns = [name for name in main.FoodUpsert.model_fields if name in schema and name != 'name']
+    frame = recommender.food_df.iloc[rows][columns]
+    items = frame.to_dict('records')
+    for item, name in zip(items, names):
+        item['name'] = name
+    return items
+
+
+def bench_update(recommender, result):
+    """apply_updates (katalog, partisi, indeks nama, tabel hasil inkremental) dengan batch
+    UPDATE_BATCH makanan: hanya insert, lalu setengah mengganti makanan lama + 10% delete"""
+    import numpy as np
+    if recommender._result_table is None:
+        recommender.enable_result_table()
+    recommender.name_index()  # seperti snapshot yang melayani: indeks nama sudah dibangun/dimuat
+    rng = np.random.default_rng(0)
+    n = recommender.catalog_size()
+    batch = max(1, min(UPDATE_BATCH, n // 10))
+    names = recommender._catalog.names(range(n))
+    inserts = update_items(recommender, rng.choice(n, batch), [f'Makanan benchmark {i}' for i in range(batch)])
+    existing = rng.choice(n, batch // 2 + batch // 10, replace=False)
+    replaced = update_items(recommender, rng.choice(n, batch // 2), [names[i] for i in existing[:batch // 2]])
+    deletes = [names[i] for i in existing[batch // 2:]]
+
+    result['update_batch'] = batch
+    (updated, _), result['update_insert_s'] = timed(recommender.apply_updates, inserts)
+    _, result['update_name_index_s'] = timed(updated.name_index)  # digabung malas setelah update
+    (_, stats), result['update_mixed_s'] = timed(
+        recommender.apply_updates, replaced + inserts[:batch - batch // 2], deletes)
+    result['update_mixed_rankings'] = dict(stats['rankings'])
+
+
+async def _e2e(app):
+    import httpx
+    bodies = [{'mood': mood, 'health_conditions': conditions, 'top_n': TOP_N} for mood, conditions in profiles()]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def post(body):
+            start = time.perf_counter()
+            response = await client.post('/recommend', json=body)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        await post(bodies[0])  # pool executor dibuat di request pertama
+        sequential = [await post(body) for body in bodies]
+
+        start = time.perf_counter()
+        for round_ in range(E2E_ROUNDS):
+            batch = [bodies[(round_ * E2E_CONCURRENCY + i) % len(bodies)] for i in range(E2E_CONCURRENCY)]
+            await asyncio.gather(*(post(body) for body in batch))
+        elapsed = time.perf_counter() - start
+    return sequential, E2E_ROUNDS * E2E_CONCURRENCY / elapsed
+
+
+def bench_e2e(recommender, result):
+    """/recommend lewat aplikasi FastAPI penuh (middleware, executor, micro-batching, serialisasi)"""
+    import main
+    main.SNAPSHOT = main.ModelSnapshot(recommender, None, main.snapshot_version(recommender, None),
+                                       'benchmark', time.time())
+    try:
+        sequential, throughput = asyncio.run(_e2e(main.app))
+    finally:
+        for executor in main.EXECUTORS:
+            executor.shutdown()
+    result['e2e_sequential'] = latency_summary(sequential)
+    result['e2e_concurrent_rps'] = round(throughput, 1)
+
+
+def bench_pickle(recommender, result):
+    data, result['pickle_dump_s'] = timed(pickle.dumps, recommender, protocol=pickle.HIGHEST_PROTOCOL)
+    result['pickle_size_mb'] = round(len(data) / 1e6, 2)
+    # Termasuk membangun ulang indeks mood (__setstate__), seperti startup dari pickle lama
+    loaded, result['unpickle_s'] = timed(pickle.loads, data)
+    del data
+    _, result['unpickle_first_recommend_s'] = timed(loaded.recommend_for_mood, 'energizing', TOP_N, ['diabetes'])
+
+
+def bench_artifact(recommender, result):
+    import main
+    directory = tempfile.mkdtemp(prefix='nutrimood-bench-')
+    try:
+        path = os.path.join(directory, 'food_recommender')
+        _, result['artifact_save_s'] = timed(recommender.save_artifact, path)
+        result['artifact_size_mb'] = round(sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+        ) / 1e6, 2)
+        loaded, result['artifact_load_s'] = timed(main.FoodRecommender.load_artifact, path)
+        _, result['artifact_first_recommend_s'] = timed(loaded.recommend_for_mood, 'energizing', TOP_N, ['diabetes'])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_ann(recommender, result):
+    """Mode 'ann': build FeatureIndex, recall@TOP_N terhadap exact, recommend tanpa cache"""
+    recommender.set_search_mode('ann')
+    try:
+        _, result['ann_index_build_s'] = timed(recommender.build_feature_indexes)
+        recall = recommender.index_recall(TOP_N)
+        result['ann_recall_mean'] = recall['mean']
+        result['ann_recall_min'] = recall['min']
+        result['ann_cells'] = recall['cells']
+        compute = []
+        def uncached(seconds):
+            compute.append(seconds)
+            recommender.invalidate_results()
+        rankings(recommender, uncached)
+        result['recommend_ann_compute'] = latency_summary(compute)
+    finally:
+        recommender.set_search_mode('exact')
+
+
+def run_size(rows, seed, stages):
+    """Dijalankan di proses anak: semua pengukuran untuk satu ukuran katalog"""
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import main
+    from synthetic_catalog import load_template, synthetic_catalog
+
+    result = {'rows': rows, 'seed': seed}
+    template = load_template()
+    catalog, result['generate_s'] = timed(synthetic_catalog, rows, template, seed)
+    del template
+
+    recommender = main.FoodRecommender()
+    recommender.food_df = catalog
+    del catalog
+    _, result['index_build_s'] = timed(recommender.catalog_size)
+    result['catalog_mb'] = round(recommender._catalog.nbytes / 1e6, 2)
+    result['rss_after_index_mb'] = round(main.process_rss_bytes() / 1e6, 1) if main.process_rss_bytes() else None
+
+    for stage in STAGES:
+        if stage in stages:
+            globals()[f'bench_{stage}'](recommender, result)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def golden_rankings():
+    """Top 10 semua profil di katalog asli, lewat jalur hitung dan tabel hasil"""
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    recommender = main.load_food_recommender(precompute=False)
+    recommender.invalidate_results()
+    computed = rankings(recommender, lambda _: recommender.invalidate_results())
+    recommender.enable_result_table()
+    return computed, rankings(recommender)
+
+
+def equivalence_updates(recommender, rng):
+    """Batch deterministik: hapus/ganti makanan top-K tabel hasil (jalur isi ulang), sisipkan
+    makanan baru, semua dengan nilai dasar baris katalog lain agar batas normalisasi tetap"""
+    n = recommender.catalog_size()
+    names = recommender._catalog.names(range(n))
+    top = sorted({int(rows[0]) for rows, _, fallback in recommender._result_table.values()
+                  if fallback is None and len(rows)})
+    chosen = rng.choice(top, min(len(top), 6), replace=False)
+    deletes = [names[i] for i in chosen[:3]]
+    replaced = update_items(recommender, rng.choice(n, len(chosen) - 3), [names[i] for i in chosen[3:]])
+    inserts = update_items(recommender, rng.choice(n, 4), [f'Makanan update check {i}' for i in range(4)])
+    return replaced + inserts, deletes
+
+
+def update_equivalence(tolerance=1e-6):
+    """Perbedaan tabel hasil / daftar tetangga setelah apply_updates dibanding build ulang penuh"""
+    import numpy as np
+    import main
+    recommender = main.load_food_recommender(precompute=False)
+    recommender.enable_result_table()
+    recommender.build_neighbour_lists()
+    upserts, deletes = equivalence_updates(recommender, np.random.default_rng(0))
+    updated, stats = recommender.apply_updates(upserts, deletes)
+    updated.build_neighbour_lists()
+
+    rebuilt = main.load_food_recommender(precompute=False)
+    rebuilt.food_df = updated.food_df.copy()
+    rebuilt.enable_result_table()
+    rebuilt.build_neighbour_lists()
+
+    problems = []
+    for key, (rows, scores, fallback) in rebuilt._result_table.items():
+        got = updated._result_table.get(key)
+        if got is None or fallback != got[2] or not np.array_equal(rows, got[0]):
+            problems.append(f"update {key}: urutan berbeda")
+        elif not np.allclose(scores, got[1], rtol=0, atol=tolerance):
+            problems.append(f"update {key}: skor berbeda")
+    for mood in rebuilt._mood_index:
+        expected, got = rebuilt.neighbour_lists(mood), updated.neighbour_lists(mood)
+        if not np.array_equal(expected.rows, got.rows):
+            problems.append(f"update tetangga {mood}: urutan berbeda")
+        elif not np.array_equal(expected.scores, got.scores):
+            problems.append(f"update tetangga {mood}: skor berbeda")
+    return {'profiles': len(rebuilt._result_table), 'moods': len(rebuilt._mood_index),
+            'rankings': stats['rankings'], 'problems': problems}
+
+
+def compare_golden(expected, actual, label, tolerance=1e-9):
+    """Daftar perbedaan (nama atau skor) per profil"""
+    problems = []
+    for key, rows in expected.items():
+        got = actual.get(key)
+        if got is None or [name for name, _ in rows] != [name for name, _ in got]:
+            problems.append(f"{label} {key}: urutan berbeda")
+        elif any(abs(a - b) > tolerance for (_, a), (_, b) in zip(rows, got)):
+            problems.append(f"{label} {key}: skor berbeda")
+    return problems
+
+
+def run_child(args):
+    stages = set(args.stages.split(',')) if args.stages else set(STAGES)
+    if args.child == 'golden':
+        computed, table = golden_rankings()
+        print(json.dumps({'computed': computed, 'table': table, 'update': update_equivalence()}))
+    else:
+        print(json.dumps(run_size(int(args.child), args.seed, stages)))
+
+
+def spawn(child, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(child), '--seed', str(args.seed)]
+    if args.stages:
+        command += ['--stages', args.stages]
+    env = dict(os.environ, NUTRIMOOD_LOG_LEVEL='WARNING')
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"Benchmark {child} gagal (exit {completed.returncode})")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def median_result(runs):
+    """Gabungkan beberapa run satu ukuran: median untuk setiap angka"""
+    first = runs[0]
+    merged = {}
+    for key, value in first.items():
+        if isinstance(value, dict):
+            merged[key] = median_result([run[key] for run in runs])
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ('rows', 'seed'):
+            merged[key] = statistics.median(run[key] for run in runs)
+        else:
+            merged[key] = value
+    return merged
+
+
+def flatten(result, prefix=''):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        else:
+            yield f'{prefix}{key}', value
+
+
+def compare_baseline(baseline, current, tolerance):
+    """Cetak perbandingan per metric; kembalikan daftar regresi"""
+    regressions = []
+    for size, result in current['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if base is None:
+            print(f"[{size}] tidak ada di baseline")
+            continue
+        base_metrics = dict(flatten(base))
+        for metric, value in flatten(result):
+            old = base_metrics.get(metric)
+            if metric == 'rankings_digest' and old is not None and old != value:
+                print(f"[{size}] ranking berubah (digest {old} -> {value}) REGRESI")
+                regressions.append(f"[{size}] ranking berubah")
+            if metric.startswith('ann_recall') and old is not None and value is not None and value < old:
+                print(f"[{size}] {metric} turun {old:.4f} -> {value:.4f} REGRESI")
+                regressions.append(f"[{size}] {metric} turun")
+            if not metric.endswith(COMPARED_SUFFIXES) or not old or value is None:
+                continue
+            ratio = value / old
+            floor = next(floor for suffix, floor in NOISE_FLOOR.items() if metric.endswith(suffix))
+            regressed = ratio > 1 + tolerance and value - old > floor and not metric.endswith(UNFLAGGED_SUFFIXES)
+            flag = ' REGRESI' if regressed else ''
+            print(f"[{size}] {metric:40s} {old:>12.4f} -> {value:>12.4f}  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append(f"[{size}] {metric} x{ratio:.2f}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="ukuran katalog, dipisah koma (mis. 1000,100000,10000000)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="run per ukuran; hasil = median per metric")
+    parser.add_argument('--stages', help=f"subset dari {','.join(STAGES)} (default semua)")
+    parser.add_argument('--output', help="tulis hasil JSON ke file ini")
+    parser.add_argument('--baseline', help="bandingkan dengan hasil JSON sebelumnya")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="kenaikan relatif yang dianggap regresi (default 0.25 = 25%%)")
+    parser.add_argument('--no-golden', action='store_true', help="lewati golden check")
+    parser.add_argument('--golden-only', action='store_true', help="hanya golden check")
+    parser.add_argument('--update-golden', action='store_true', help=f"tulis ulang {os.path.relpath(GOLDEN_PATH)}")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from importlib.metadata import version
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'numpy': version('numpy'),
+        'pandas': version('pandas'),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+    failures = []
+
+    if not args.no_golden or args.update_golden:
+        golden = spawn('golden', args)
+        if args.update_golden:
+            with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+                json.dump(golden['computed'], f, indent=0, ensure_ascii=False)
+            print(f"Golden ditulis ke {GOLDEN_PATH} ({len(golden['computed'])} profil)")
+        with open(GOLDEN_PATH, encoding='utf-8') as f:
+            expected = json.load(f)
+        problems = (compare_golden(expected, golden['computed'], 'hitung')
+                    + compare_golden(expected, golden['table'], 'tabel'))
+        report['golden'] = {'profiles': len(expected), 'mismatches': len(problems)}
+        print(f"Golden check: {len(expected)} profil, {len(problems)} perbedaan")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        failures += problems
+
+        update = golden['update']
+        report['update_check'] = {'profiles': update['profiles'], 'moods': update['moods'],
+                                  'rankings': update['rankings'], 'mismatches': len(update['problems'])}
+        print(f"Update check: {update['profiles']} profil, {update['moods']} daftar tetangga "
+              f"({update['rankings']}), {len(update['problems'])} perbedaan")
+        for problem in update['problems'][:20]:
+            print(f"  {problem}")
+        failures += update['problems']
+
+    if not args.golden_only:
+        for size in (int(size) for size in args.sizes.split(',')):
+            start = time.perf_counter()
+            report['sizes'][str(size)] = median_result([spawn(size, args) for _ in range(args.repeat)])
+            print(f"[{size}] selesai dalam {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if args.baseline and report['sizes']:
+        with open(args.baseline) as f:
+            failures += compare_baseline(json.load(f), report, args.tolerance)
+
+    if failures:
+        raise SystemExit(f"{len(failures)} masalah: golden/update check berbeda atau regresi terhadap baseline")
+
+
+if __name__ == '__main__':
+    main()
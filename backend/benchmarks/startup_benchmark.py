@@ -0,0 +1,110 @@
+# benchmarks/startup_benchmark.py
+"""Benchmark cold start: waktu import, load model, siap melayani dan request pertama.
+
+Setiap run memakai proses Python baru. Hasil dicetak sebagai satu baris JSON dan bisa
+ditambahkan ke file (--output) untuk dibandingkan antar rilis.
+
+    python benchmarks/startup_benchmark.py --runs 5 --output benchmarks/startup_history.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dijalankan di proses baru; mencetak satu baris JSON
+CHILD = r'''
+import json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t_started = time.perf_counter() - t0
+    response = client.post('/recommend', json={'mood': 'energizing', 'health_conditions': ['diabetes'], 'top_n': 5})
+    t_first = time.perf_counter() - t0
+    while 'caches_warmed' not in main.READINESS.reached and main.READINESS.error is None \
+            and time.perf_counter() - t0 < 120:
+        time.sleep(0.01)
+    t_warm = time.perf_counter() - t0
+print(json.dumps({
+    'import_s': t_import,
+    'startup_s': t_started,
+    'first_request_s': t_first,
+    'first_request_status': response.status_code,
+    'caches_warmed_s': t_warm,
+    'model_load_s': main.MODEL_LOAD_SECONDS.get('model'),
+    'modules_loaded': __import__('sys').modules.__len__(),
+}))
+'''
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once():
+    env = dict(os.environ, NUTRIMOOD_LOG_LEVEL='WARNING')
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit):
+    """Modul dengan waktu import kumulatif terbesar (python -X importtime)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=BACKEND_DIR,
+                            env=dict(os.environ, NUTRIMOOD_LOG_LEVEL='WARNING'), capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|', 2)
+        # Import langsung dari main: satu level indentasi di bawah 'main'
+        if len(name) - len(name.lstrip(' ')) == 3:
+            rows.append((int(cumulative_us), name.strip()))
+    return [{'module': name, 'cumulative_ms': us / 1000} for us, name in sorted(rows, reverse=True)[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help="tambahkan hasil (JSON per baris) ke file ini")
+    parser.add_argument('--imports', type=int, default=0, metavar='N', help="sertakan N import paling lambat")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'artifact': os.path.exists(os.path.join(BACKEND_DIR, 'models', 'food_recommender', 'manifest.json')),
+        'runs': args.runs,
+    }
+    for key in ('import_s', 'startup_s', 'first_request_s', 'caches_warmed_s', 'model_load_s'):
+        values = [run[key] for run in runs if run[key] is not None]
+        if values:
+            summary[f'{key}_median'] = round(statistics.median(values), 4)
+            summary[f'{key}_max'] = round(max(values), 4)
+    summary['modules_loaded'] = runs[-1]['modules_loaded']
+    if any(run['first_request_status'] != 200 for run in runs):
+        summary['first_request_failed'] = True
+    if args.imports:
+        summary['slowest_imports'] = slowest_imports(args.imports)
+
+    line = json.dumps(summary)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
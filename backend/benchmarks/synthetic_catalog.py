@@ -0,0 +1,65 @@
+# benchmarks/synthetic_catalog.py
+"""Katalog makanan sintetis berskema sama dengan food_df model (nutrimood_combined_dataset.csv
+setelah preprocessing notebook), untuk benchmark dari 1 ribu sampai 10 juta baris.
+
+Baris diambil acak (dengan pengembalian) dari katalog asli sehingga distribusi mood, kategori
+dan kombinasinya tetap sama; nilai nutrisi diberi noise kecil agar tidak semuanya kembar, dan
+setiap nama diberi sufiks unik. Hasil deterministik untuk (rows, seed) yang sama.
+
+    python benchmarks/synthetic_catalog.py 100000 /tmp/catalog_100k.csv [--seed 0]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Kolom nutrisi ternormalisasi 0-1 yang diberi noise; kolom kategori/mood disalin apa adanya
+NUTRIENT_COLUMNS = ('calories', 'proteins', 'fat', 'carbohydrate',
+                    'vitamin_a', 'vitamin_c', 'vitamin_b', 'iron', 'calcium')
+JITTER = 0.02  # noise multiplikatif maksimum (+-2%)
+
+
+def load_template():
+    """food_df dari model yang sedang dipakai API (artifact, atau pickle lama)"""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import main
+    cwd = os.getcwd()
+    os.chdir(BACKEND_DIR)  # path model relatif terhadap backend/
+    try:
+        return main.load_food_recommender(precompute=False).food_df
+    finally:
+        os.chdir(cwd)
+
+
+def synthetic_catalog(rows, template, seed=0):
+    """DataFrame `rows` baris dengan kolom dan dtype sama seperti template"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(template), rows)
+    df = template.iloc[picks].reset_index(drop=True)
+    for column in NUTRIENT_COLUMNS:
+        if column in df.columns:
+            noise = rng.uniform(1 - JITTER, 1 + JITTER, rows)
+            df[column] = np.clip(df[column].to_numpy() * noise, 0.0, 1.0)
+    df['name'] = df['name'].str.strip() + ' #' + pd.Series(np.arange(rows)).astype(str)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buat katalog makanan sintetis (CSV)")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_catalog(args.rows, load_template(), args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"{len(df)} baris ditulis ke {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# benchmarks/worker_benchmark.py
+"""Benchmark multi-worker gunicorn: memori (RSS/PSS/private) dan req/s per jumlah worker.
+
+Untuk setiap jumlah worker, server dijalankan dengan gunicorn.conf.py (preload, atau
+--no-preload untuk pembanding), lalu dibebani beberapa proses klien yang mengirim
+POST /recommend dengan campuran profil mood x kondisi selama --duration detik.
+Memori diambil dari /proc/<pid>/smaps_rollup master dan semua worker (khusus Linux).
+
+    python benchmarks/worker_benchmark.py --workers 1 2 4 8 --rows 300000 --output benchmarks/worker_history.jsonl
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MOODS = ('energizing', 'relaxing', 'focusing', 'neutral', 'multi_category')
+CONDITIONS = ([], ['diabetes'], ['hipertensi'], ['kolesterol'], ['diabetes', 'hipertensi'])
+
+
+def build_artifact(rows, seed, directory):
+    """Artifact dari katalog sintetis `rows` baris (lihat synthetic_catalog.py)"""
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import main
+    from synthetic_catalog import load_template, synthetic_catalog
+
+    recommender = main.FoodRecommender()
+    recommender.food_df = synthetic_catalog(rows, load_template(), seed)
+    path = os.path.join(directory, 'food_recommender')
+    recommender.save_artifact(path)
+    return path
+
+
+def worker_pids(master):
+    with open(f'/proc/{master}/task/{master}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_mb(master):
+    """Jumlah Rss/Pss/Private (MB) master + worker, dan Private per worker"""
+    def rollup(pid):
+        values = {}
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                    values[parts[0][:-1]] = int(parts[1]) / 1024
+        return {'rss': values['Rss'], 'pss': values['Pss'],
+                'private': values['Private_Clean'] + values['Private_Dirty']}
+
+    master_mb = rollup(master)
+    worker_mb = [rollup(pid) for pid in worker_pids(master)]
+    total = {key: round(master_mb[key] + sum(w[key] for w in worker_mb), 1) for key in master_mb}
+    return {
+        'total_rss_mb': total['rss'],
+        'total_pss_mb': total['pss'],
+        'master_private_mb': round(master_mb['private'], 1),
+        'worker_private_mb': [round(w['private'], 1) for w in worker_mb],
+    }
+
+
+def start_server(workers, preload, port, artifact):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               NUTRIMOOD_PRELOAD='1' if preload else '0', NUTRIMOOD_LOG_LEVEL='WARNING')
+    if artifact:
+        env['NUTRIMOOD_ARTIFACT_PATH'] = artifact
+    server = subprocess.Popen(['gunicorn', 'main:app', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+                              cwd=BACKEND_DIR, env=env)
+    started = time.perf_counter()
+    # /readyz dijawab worker mana saja; tunggu sampai semua worker di-fork, lalu beberapa
+    # jawaban siap berturut-turut
+    ready = 0
+    while ready < workers * 4 or len(worker_pids(server.pid)) < workers:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn berhenti (exit {server.returncode})")
+        if time.perf_counter() - started > 600:
+            raise TimeoutError("server tidak siap dalam 600 detik")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=5) as response:
+                ready += response.status == 200
+        except OSError:
+            ready = 0
+            time.sleep(0.2)
+    return server, time.perf_counter() - started
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def client_loop(port, duration, concurrency, offset):
+    import httpx
+    profiles = [{'mood': mood, 'health_conditions': conditions, 'top_n': 10}
+                for mood, conditions in itertools.product(MOODS, CONDITIONS)]
+    deadline = time.perf_counter() + duration
+    counts = {'ok': 0, 'error': 0}
+
+    async def worker(client, index):
+        for profile in itertools.islice(itertools.cycle(profiles), index, None):
+            if time.perf_counter() >= deadline:
+                return
+            try:
+                response = await client.post('/recommend', json=profile)
+                counts['ok' if response.status_code == 200 else 'error'] += 1
+            except httpx.HTTPError:
+                counts['error'] += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client, offset + i) for i in range(concurrency)))
+    return counts
+
+
+def client_process(args):
+    return asyncio.run(client_loop(*args))
+
+
+def drive_load(port, duration, clients, concurrency):
+    """Beban dari `clients` proses (masing-masing `concurrency` koneksi); hasil req/s"""
+    started = time.perf_counter()
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client_process, [(port, duration, concurrency, i * concurrency) for i in range(clients)])
+    elapsed = time.perf_counter() - started
+    ok = sum(r['ok'] for r in results)
+    return {'requests': ok, 'errors': sum(r['error'] for r in results), 'req_per_s': round(ok / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help="setiap worker memuat model sendiri (pembanding)")
+    parser.add_argument('--rows', type=int, help="pakai katalog sintetis N baris (default: artifact repo)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=10.0, help="detik beban per jumlah worker")
+    parser.add_argument('--clients', type=int, default=max(1, min(4, os.cpu_count() or 1)), help="proses klien")
+    parser.add_argument('--concurrency', type=int, default=16, help="koneksi per proses klien")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help="tambahkan hasil (JSON per baris) ke file ini")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='nutrimood-workers-') if args.rows else None
+    try:
+        artifact = None
+        if args.rows:
+            # Di proses anak agar memori build tidak ikut terukur di proses benchmark
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                artifact = pool.apply(build_artifact, (args.rows, args.seed, directory))
+
+        for workers in args.workers:
+            server, ready_s = start_server(workers, args.preload, args.port, artifact)
+            try:
+                result = {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'workers': workers,
+                    'preload': args.preload,
+                    'rows': args.rows,
+                    'cpus': os.cpu_count(),
+                    'ready_s': round(ready_s, 2),
+                    **memory_mb(server.pid),
+                }
+                result.update(drive_load(args.port, args.duration, args.clients, args.concurrency))
+                # Setelah beban: halaman yang tersalin (copy-on-write) saat melayani ikut terhitung
+                result.update({f'{key}_after_load': value for key, value in memory_mb(server.pid).items()})
+            finally:
+                stop_server(server)
+            line = json.dumps(result)
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(line + '\n')
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# convert_model.py
+"""Konversi sekali jalan models/food_recommender.pkl ke artifact berversi.
+
+    python convert_model.py [models/food_recommender.pkl] [models/food_recommender]
+    python convert_model.py --verify models/food_recommender
+"""
+import argparse
+import pickle
+import sys
+import time
+
+from main import ARTIFACT_PATH, ARTIFACT_VERSION, FoodRecommender
+
+
+def convert(pkl_path, artifact_path, include_result_table=True):
+    # Pickle lama mereferensikan __main__.FoodRecommender
+    sys.modules['__main__'].FoodRecommender = FoodRecommender
+    with open(pkl_path, 'rb') as f:
+        recommender = pickle.load(f)
+
+    recommender.save_artifact(artifact_path, include_result_table=include_result_table)
+
+    # Round-trip: hasil artifact harus sama dengan pickle
+    loaded = FoodRecommender.load_artifact(artifact_path)
+    for mood in ['energizing', 'relaxing', 'focusing', 'neutral']:
+        for conditions in [None, ['diabetes'], ['hipertensi', 'kolesterol']]:
+            expected = recommender.recommend_for_mood(mood, 10, conditions)
+            actual = loaded.recommend_for_mood(mood, 10, conditions)
+            if list(expected['name']) != list(actual['name']):
+                raise SystemExit(f"Hasil artifact berbeda untuk {mood} {conditions}")
+    if not loaded.food_df.equals(recommender.food_df):
+        raise SystemExit("food_df dari artifact berbeda dengan pickle")
+
+
+def verify(artifact_path):
+    start = time.perf_counter()
+    recommender = FoodRecommender.load_artifact(artifact_path, verify=True)
+    print(f"OK: artifact v{ARTIFACT_VERSION}, {recommender.catalog_size()} makanan, "
+          f"dimuat dalam {time.perf_counter() - start:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Konversi food_recommender.pkl ke artifact berversi")
+    parser.add_argument('pkl', nargs='?', default='models/food_recommender.pkl')
+    parser.add_argument('output', nargs='?', default=ARTIFACT_PATH)
+    parser.add_argument('--no-result-table', action='store_true',
+                        help="jangan simpan tabel hasil (dibangun saat startup)")
+    parser.add_argument('--verify', metavar='ARTIFACT', help="cek checksum artifact yang sudah ada lalu keluar")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify(args.verify)
+        return
+
+    convert(args.pkl, args.output, include_result_table=not args.no_result_table)
+    verify(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# export_mood_model.py
+"""Export mood_classifier_model.keras ke models/mood_classifier.npz untuk serving tanpa TensorFlow.
+
+    pip install -r requirements-ml.txt
+    python export_mood_model.py [--model models/mood_classifier_model.keras] [--output models/mood_classifier.npz]
+
+StandardScaler dilipat ke Dense pertama dan setiap BatchNormalization (yang berada
+setelah aktivasi relu) dilipat ke Dense berikutnya:
+
+    BN(h) = h * s + t,  s = gamma / sqrt(var + eps),  t = beta - mean * s
+    BN(h) @ W + b = h @ (s[:, None] * W) + (t @ W + b)
+
+Hasil export dicek terhadap model.predict untuk semua kombinasi kategori.
+"""
+import argparse
+import itertools
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from main import MOOD_CATEGORY_MAPPING, MOOD_CLASSIFIER_PATH, MoodClassifier
+
+TOLERANCE = 1e-5  # selisih absolut maksimum probabilitas NumPy vs Keras
+
+
+def fold_layers(model, scaler):
+    """Layer Keras -> (weights, biases) Dense dengan scaler dan BatchNormalization terlipat"""
+    weights, biases = [], []
+    # Affine (s, t) yang menunggu dilipat ke Dense berikutnya; awalnya StandardScaler
+    pending = (1.0 / scaler.scale_, -scaler.mean_ / scaler.scale_)
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        if kind == 'Dense':
+            expected = 'softmax' if layer is model.layers[-1] else 'relu'
+            if config['activation'] != expected:
+                raise ValueError(f"{layer.name}: aktivasi {config['activation']} tidak didukung (butuh {expected})")
+            kernel, bias = (w.astype(np.float64) for w in layer.get_weights())
+            if pending is not None:
+                scale, shift = pending
+                kernel, bias = scale[:, None] * kernel, shift @ kernel + bias
+                pending = None
+            weights.append(kernel)
+            biases.append(bias)
+        elif kind == 'BatchNormalization':
+            params = iter(w.astype(np.float64) for w in layer.get_weights())
+            gamma = next(params) if config['scale'] else 1.0
+            beta = next(params) if config['center'] else 0.0
+            mean, var = next(params), next(params)
+            scale = gamma / np.sqrt(var + config['epsilon'])
+            pending = (scale, beta - mean * scale)
+        elif kind in ('Dropout', 'InputLayer'):
+            continue  # tidak aktif saat inferensi
+        else:
+            raise ValueError(f"Layer {kind} ({layer.name}) tidak didukung")
+    if pending is not None:
+        raise ValueError("BatchNormalization terakhir tidak diikuti Dense")
+    return (tuple(w.astype(np.float32) for w in weights),
+            tuple(b.astype(np.float32) for b in biases))
+
+
+def output_labels(encoder, label_encoder):
+    """Indeks output softmax -> primary_mood (OneHotEncoder atas label hasil LabelEncoder)"""
+    return tuple(str(label_encoder.classes_[int(code)]) for code in encoder.categories_[0])
+
+
+def verify(classifier, model, scaler):
+    """Bandingkan dengan Keras untuk semua kombinasi kategori; kembalikan selisih maksimum"""
+    features = np.array(list(itertools.product(sorted(MOOD_CATEGORY_MAPPING.values()), repeat=4)), dtype=np.float32)
+    scaled = scaler.transform(pd.DataFrame(features, columns=scaler.feature_names_in_))
+    expected = model.predict(scaled.astype(np.float32), verbose=0)
+    actual = classifier.predict_proba(features)
+    diff = float(np.abs(expected - actual).max())
+    if diff > TOLERANCE or (expected.argmax(axis=1) != actual.argmax(axis=1)).any():
+        raise SystemExit(f"Prediksi NumPy berbeda dengan Keras (selisih maksimum {diff:.2e})")
+    return len(features), diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export mood classifier Keras ke bobot NumPy")
+    parser.add_argument('--model', default='models/mood_classifier_model.keras')
+    parser.add_argument('--scaler', default='models/mood_feature_scaler.pkl')
+    parser.add_argument('--encoder', default='models/mood_encoder.pkl')
+    parser.add_argument('--label-encoder', default='models/mood_label_encoder.pkl')
+    parser.add_argument('--output', default=MOOD_CLASSIFIER_PATH)
+    args = parser.parse_args()
+
+    try:
+        import keras
+    except ImportError:
+        sys.exit("Keras tidak terpasang; jalankan pip install -r requirements-ml.txt")
+
+    model = keras.models.load_model(args.model)
+    scaler = joblib.load(args.scaler)
+    weights, biases = fold_layers(model, scaler)
+    classifier = MoodClassifier(
+        weights=weights,
+        biases=biases,
+        labels=output_labels(joblib.load(args.encoder), joblib.load(args.label_encoder))
+    )
+    classifier.save(args.output)
+    reloaded = MoodClassifier.load(args.output)
+    checked, diff = verify(reloaded, model, scaler)
+    print(f"OK: {args.output} ({len(weights)} layer Dense, label {list(reloaded.labels)}), "
+          f"{checked} kombinasi, selisih maksimum vs Keras {diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
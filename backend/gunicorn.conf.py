@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+"""Konfigurasi gunicorn untuk beberapa worker yang berbagi satu snapshot model.
+
+Dengan preload, master mengimpor main dan membangun snapshot (katalog, indeks, tabel hasil)
+sekali sebelum fork; worker mewarisinya lewat copy-on-write dan array artifact di-mmap dari
+page cache yang sama, jadi worker tambahan hampir tidak menambah RSS.
+
+    WEB_CONCURRENCY=4 gunicorn main:app -c gunicorn.conf.py
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = 300
+max_requests = 1000
+max_requests_jitter = 100
+preload_app = os.getenv('NUTRIMOOD_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # Dipanggil di master setelah aplikasi di-import (preload_app) dan sebelum worker di-fork
+    if preload_app:
+        import main
+        main.preload_snapshot()
@@ -1,13 +1,45 @@
 # app.py
-from fastapi import FastAPI, HTTPException
+import time
+IMPORT_STARTED = time.perf_counter()  # awal import modul, untuk READINESS dan benchmark startup
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+from functools import cached_property, partial
+from bisect import bisect_left
+import asyncio
+import base64
+import itertools
+import math
+import gc
+import hashlib
+import hmac
+import json
+import shutil
+import sqlite3
+import threading
+import logging
+import random
+import re
+import unicodedata
+import weakref
 import pandas as pd
 import numpy as np
-import pickle
 import os
-from sklearn.metrics.pairwise import cosine_similarity
+
+logging.basicConfig(
+    level=os.getenv('NUTRIMOOD_LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s %(message)s'
+)
+logger = logging.getLogger('nutrimood')
 
 app = FastAPI(
     title="NutriMood API",
@@ -23,11 +55,486 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Logging terstruktur dan timer per stage
+# Detail hot path dicatat di level DEBUG (mati secara default) atau ke trace jika diminta
+_trace_events = ContextVar('nutrimood_trace', default=None)
+
+def _to_builtin(value):
+    """Konversi nilai numpy agar trace bisa di-serialize ke JSON"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {k: _to_builtin(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(v) for v in value]
+    return value
+
+def tracing():
+    """True jika detail debug perlu dihitung (trace aktif atau log level DEBUG)"""
+    return _trace_events.get() is not None or logger.isEnabledFor(logging.DEBUG)
+
+def log_event(event, level=logging.DEBUG, **fields):
+    """Log terstruktur 'event key=value ...'; ikut masuk trace jika trace aktif"""
+    events = _trace_events.get()
+    if events is not None:
+        events.append({"event": event, **_to_builtin(fields)})
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s %s", event, " ".join(f"{key}={value}" for key, value in fields.items()))
+
+@contextmanager
+def collect_trace():
+    """Kumpulkan semua log_event selama blok ini ke sebuah list"""
+    events = []
+    token = _trace_events.set(events)
+    try:
+        yield events
+    finally:
+        _trace_events.reset(token)
+
+class Histogram:
+    """Histogram dengan bucket tetap (detik) ala Prometheus"""
+    DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # bucket terakhir = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()  # stage timing di-observe dari thread executor
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        cumulative = list(itertools.accumulate(self.counts))
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): n for bound, n in zip(self.buckets + ('+Inf',), cumulative)},
+        }
+
+    def exposition(self, name, labels=''):
+        """Baris format teks Prometheus untuk histogram ini"""
+        sep = ',' if labels else ''
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{bound}"}} {n}'
+            for bound, n in zip(self.buckets + ('+Inf',), itertools.accumulate(self.counts))
+        ]
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}' if labels else f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}' if labels else f'{name}_count {self.count}')
+        return lines
+
+STAGES = ('lookup', 'filter', 'normalize', 'weight', 'score', 'penalize', 'sort', 'serialize')
+STAGE_TIMINGS = {stage: Histogram() for stage in STAGES}
+TIMING_SAMPLE_RATE = float(os.getenv('NUTRIMOOD_TIMING_SAMPLE_RATE', '1.0'))
+
+class StageTimer:
+    """Timer per stage; hanya aktif untuk request yang di-sample atau sedang di-trace"""
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = _trace_events.get() is not None or random.random() < TIMING_SAMPLE_RATE
+        self.enabled = enabled
+        self.timings = {}
+        self._last = time.perf_counter() if self.enabled else 0.0
+
+    def restart(self):
+        """Mulai hitung dari sekarang (lewati waktu di luar stage)"""
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Catat waktu sejak lap sebelumnya sebagai stage ini"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+        STAGE_TIMINGS[stage].observe(elapsed)
+
+    def log(self, event):
+        if self.enabled and self.timings:
+            log_event(event, **{f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in self.timings.items()})
+
+# Metrics per proses worker (gunicorn: tiap worker punya counter sendiri).
+# REQUEST_COUNTS hanya diubah di thread event loop sehingga tidak perlu lock; FALLBACK_COUNTS
+# juga diubah dari thread executor (lihat BoundedExecutor) sehingga memakai FALLBACK_LOCK.
+REQUEST_COUNTS = Counter()   # (method, route, status) -> jumlah request
+REQUEST_LATENCY = {}         # route -> Histogram
+FALLBACK_COUNTS = Counter({'fallback_sorting': 0, 'ultimate_fallback': 0})
+FALLBACK_LOCK = threading.Lock()
+MODEL_LOAD_SECONDS = {}      # tahap startup -> detik
+
+def process_rss_bytes():
+    """Resident set size proses ini, atau None jika /proc tidak tersedia"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Snapshot model (lihat ModelSnapshot) yang di-pin di awal request: request yang sudah berjalan
+# selesai dengan snapshot lama walau reload menukar SNAPSHOT di tengah jalan. Task di thread
+# executor ikut mewarisinya lewat copy_context.
+_pinned_snapshot = ContextVar('nutrimood_snapshot', default=None)
+
+class MetricsMiddleware:
+    """ASGI middleware: jumlah request dan latency per route template, pin snapshot model
+    dan header X-Model-Version"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+        snapshot = SNAPSHOT
+        token = _pinned_snapshot.set(snapshot)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                if snapshot is not None:
+                    message['headers'] = [*message.get('headers', ()), (b'x-model-version', snapshot.version.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _pinned_snapshot.reset(token)
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            REQUEST_COUNTS[(scope['method'], path, status[0])] += 1
+            histogram = REQUEST_LATENCY.get(path)
+            if histogram is None:
+                histogram = REQUEST_LATENCY[path] = Histogram()
+            histogram.observe(time.perf_counter() - start)
+
+app.add_middleware(MetricsMiddleware)
+
+class Readiness:
+    """Tahap startup yang sudah dicapai (detik sejak import modul), untuk /readyz"""
+    STAGES = ('imported', 'catalog_loaded', 'indices_built', 'caches_warmed')
+    REQUIRED = ('catalog_loaded', 'indices_built')  # cukup untuk melayani request
+
+    def __init__(self):
+        self.reached = {}
+        self.error = None
+
+    def mark(self, stage):
+        self.reached[stage] = time.perf_counter() - IMPORT_STARTED
+        logger.info("startup.%s %.3fs", stage, self.reached[stage])
+
+    def fail(self, error):
+        self.error = str(error)
+
+    @property
+    def stage(self):
+        reached = [stage for stage in self.STAGES if stage in self.reached]
+        return reached[-1] if reached else 'starting'
+
+    def is_ready(self):
+        return self.error is None and all(stage in self.reached for stage in self.REQUIRED)
+
+    def snapshot(self):
+        return {
+            "ready": self.is_ready(),
+            "stage": self.stage,
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.reached.items()},
+            "pending": [stage for stage in self.STAGES if stage not in self.reached],
+            "error": self.error,
+        }
+
+READINESS = Readiness()
+
+# Executor untuk kerja CPU-bound (ranking, serialisasi, classifier) agar event loop tetap
+# bebas melayani /health, /livez dan endpoint ringan lain
+EXECUTOR_THREADS = int(os.getenv('NUTRIMOOD_EXECUTOR_THREADS', str(min(4, os.cpu_count() or 1))))
+EXECUTOR_PROCESSES = int(os.getenv('NUTRIMOOD_EXECUTOR_PROCESSES', '0'))  # 0 = tanpa process pool
+EXECUTOR_QUEUE_SIZE = int(os.getenv('NUTRIMOOD_EXECUTOR_QUEUE_SIZE', '64'))
+REQUEST_DEADLINE = float(os.getenv('NUTRIMOOD_REQUEST_DEADLINE', '10'))  # detik; 0 = tanpa deadline
+
+def _timed_call(fn, args):
+    """Jalankan fn di worker; waktu monotonic bisa dibandingkan antar proses"""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+class SnapshotMismatch(Exception):
+    """Worker process memuat snapshot lain dari yang di-pin request (pool di-restart setelah reload)"""
+
+def _process_call(fn, args, version=None):
+    """_timed_call di process pool; delta FALLBACK_COUNTS ikut dikirim ke proses utama.
+    version: snapshot yang di-pin request, harus sama dengan snapshot milik worker"""
+    if version is not None and (SNAPSHOT is None or SNAPSHOT.version != version):
+        raise SnapshotMismatch(version)
+    before = FALLBACK_COUNTS.copy()
+    result, started, finished = _timed_call(fn, args)
+    return result, started, finished, FALLBACK_COUNTS - before
+
+def _worker_version():
+    return SNAPSHOT.version if SNAPSHOT is not None else None
+
+class BoundedExecutor:
+    """Thread/process pool dengan antrean terbatas, deadline per request dan metrics antrean.
+
+    Counter hanya diubah di thread event loop (callback selesai lewat call_soon_threadsafe).
+    Task yang melewati deadline dibatalkan jika belum mulai; yang sudah berjalan dibiarkan
+    selesai dan tetap dihitung in_flight sampai selesai.
+    """
+    def __init__(self, kind, workers, queue_size):
+        self.kind = kind  # 'thread' atau 'process'
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        self.deadline_exceeded = 0
+        self.snapshot_mismatches = 0
+        self.wait_time = Histogram()  # submit -> mulai dikerjakan
+        self.run_time = Histogram()
+        self._pool = None
+
+    @property
+    def queue_depth(self):
+        return max(0, self.in_flight - self.workers)
+
+    def _new_pool(self):
+        if self.kind == 'process':
+            # spawn: tidak fork proses yang sudah punya thread; worker memuat model sendiri
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_process_worker
+            )
+        return ThreadPoolExecutor(self.workers, thread_name_prefix='nutrimood-cpu')
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = self._new_pool()
+        return self._pool
+
+    def _submit(self, fn, args):
+        if self.kind == 'process':
+            snapshot = _pinned_snapshot.get()
+            return self._get_pool().submit(_process_call, fn, args, snapshot.version if snapshot else None)
+        # copy_context: trace (collect_trace) ikut ke thread worker
+        return self._get_pool().submit(copy_context().run, _timed_call, fn, args)
+
+    def start(self):
+        """Spawn worker lebih awal agar request pertama tidak menunggu model dimuat"""
+        for _ in range(self.workers):
+            self._get_pool().submit(int)
+
+    def spawn_pool(self):
+        """Pool baru yang worker-nya sudah memuat model (dipanggil di thread reload, bisa lama);
+        dikembalikan bersama versi snapshot yang dimuat worker"""
+        pool = self._new_pool()
+        versions = {future.result() for future in [pool.submit(_worker_version) for _ in range(self.workers)]}
+        return pool, versions
+
+    def replace_pool(self, pool):
+        """Tukar pool (di thread event loop); task yang sudah di-submit tetap diselesaikan pool lama"""
+        previous, self._pool = self._pool, pool
+        if previous is not None:
+            previous.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args, deadline=REQUEST_DEADLINE):
+        """Jalankan fn(*args) di pool; 503 jika antrean penuh, 504 jika melewati deadline"""
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server sibuk, coba lagi nanti", headers={"Retry-After": "1"})
+
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        try:
+            future = self._submit(fn, args)
+        except BrokenExecutor:
+            logger.error("Pool %s rusak, dibuat ulang", self.kind)
+            self._pool = None
+            future = self._submit(fn, args)
+        self.in_flight += 1
+        future.add_done_callback(partial(self._done_threadsafe, loop, submitted))
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), deadline or None)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            raise HTTPException(status_code=504, detail=f"Request melebihi deadline {deadline:g} detik")
+        except SnapshotMismatch:
+            # Worker pool baru sudah memuat snapshot lain; hitung di thread dengan snapshot yang di-pin
+            self.snapshot_mismatches += 1
+            return await THREAD_EXECUTOR.run(fn, *args, deadline=deadline)
+        return result[0]
+
+    def _done_threadsafe(self, loop, submitted, future):
+        try:
+            loop.call_soon_threadsafe(self._done, submitted, future)
+        except RuntimeError:
+            pass  # event loop sudah ditutup (shutdown)
+
+    def _done(self, submitted, future):
+        self.in_flight -= 1
+        if future.cancelled() or future.exception() is not None:
+            return
+        _, started, finished, *fallbacks = future.result()
+        self.wait_time.observe(max(0.0, started - submitted))
+        self.run_time.observe(finished - started)
+        if fallbacks:
+            with FALLBACK_LOCK:
+                FALLBACK_COUNTS.update(fallbacks[0])
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+            "deadline_exceeded": self.deadline_exceeded,
+            "snapshot_mismatches": self.snapshot_mismatches,
+            "wait_seconds": {"count": self.wait_time.count, "sum": round(self.wait_time.sum, 6)},
+        }
+
+THREAD_EXECUTOR = BoundedExecutor('thread', EXECUTOR_THREADS, EXECUTOR_QUEUE_SIZE)
+PROCESS_EXECUTOR = BoundedExecutor('process', EXECUTOR_PROCESSES, EXECUTOR_QUEUE_SIZE) if EXECUTOR_PROCESSES > 0 else None
+EXECUTORS = [executor for executor in (THREAD_EXECUTOR, PROCESS_EXECUTOR) if executor is not None]
+
+def cpu_executor():
+    """Process pool jika diaktifkan, selain itu thread pool (operasi NumPy melepas GIL)"""
+    return PROCESS_EXECUTOR or THREAD_EXECUTOR
+
+# Micro-batching /recommend: request yang datang berdekatan dinilai bersama lewat recommend_batch
+BATCH_WINDOW_MS = float(os.getenv('NUTRIMOOD_BATCH_WINDOW_MS', '2'))  # 0 = micro-batching mati
+BATCH_MAX_ITEMS = int(os.getenv('NUTRIMOOD_BATCH_MAX_ITEMS', '64'))
+
+class MicroBatcher:
+    """Kumpulkan request /recommend di sisi asyncio lalu hitung sebagai satu batch di executor.
+
+    Jika tidak ada batch yang sedang dihitung, request langsung dikirim (tanpa menunggu window).
+    Selama ada batch berjalan, request baru dikumpulkan sampai window habis, batch penuh, atau
+    batch sebelumnya selesai. Request identik yang masih in-flight berbagi satu hasil.
+    Request yang di-pin ke snapshot berbeda (reload di tengah jalan) tidak pernah berbagi hasil.
+    Hanya diakses dari thread event loop.
+    """
+    def __init__(self, window_ms, max_items):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self.requests = 0
+        self.shared = 0
+        self.batches = 0
+        self.batch_size = Histogram(buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self._pending = {}    # key -> request yang belum dikirim
+        self._in_flight = {}  # key -> future (pending atau sedang dihitung)
+        self._running = 0
+        self._timer = None
+        self._tasks = set()
+
+    @staticmethod
+    def key(request, snapshot=None):
+        # Response ikut memuat health_conditions apa adanya, jadi urutannya bagian dari key
+        conditions = tuple(request.health_conditions) if request.health_conditions is not None else None
+        filters = tuple(sorted(range_filters(request.filters).items())) if request.filters else None
+        return (snapshot, request.mood, request.top_n, conditions, filters)
+
+    async def submit(self, request):
+        self.requests += 1
+        key = self.key(request, _pinned_snapshot.get())
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = self._in_flight[key] = loop.create_future()
+            # Tandai exception sudah diambil walau semua penunggunya batal
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._pending[key] = request
+            if self._running == 0 or len(self._pending) >= self.max_items:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        # shield: request yang dibatalkan tidak membatalkan hasil bersama
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._running += 1
+        self.batches += 1
+        self.batch_size.observe(len(batch))
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        groups = {}  # snapshot -> keys; biasanya hanya satu, dua selama reload
+        for key in batch:
+            groups.setdefault(key[0], []).append(key)
+        try:
+            await asyncio.gather(*(self._run_group(batch, snapshot, keys) for snapshot, keys in groups.items()))
+        finally:
+            self._running -= 1
+        if self._pending and self._running == 0:
+            self._flush()
+
+    async def _run_group(self, batch, snapshot, keys):
+        _pinned_snapshot.set(snapshot)  # context task ini saja (gather membungkus tiap coroutine dalam task)
+        try:
+            responses = await cpu_executor().run(recommend_many_task, [batch[key] for key in keys])
+        except Exception as e:
+            # 503/504 dari executor atau error lain: semua request di grup gagal
+            responses = [e] * len(keys)
+        for key, response in zip(keys, responses):
+            future = self._in_flight.pop(key)
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_items": self.max_items,
+            "requests": self.requests,
+            "shared": self.shared,
+            "batches": self.batches,
+        }
+
+MICRO_BATCHER = MicroBatcher(BATCH_WINDOW_MS, BATCH_MAX_ITEMS) if BATCH_WINDOW_MS > 0 else None
+
 # Pydantic models
+class NutrientRange(BaseModel):
+    # Batas inklusif; None = terbuka. Filter kategori boleh memakai nama ('low', 'medium', ...)
+    min: Optional[Union[float, str]] = None
+    max: Optional[Union[float, str]] = None
+
+def range_filters(filters):
+    """{nama: NutrientRange} request -> {nama: (min, max)} untuk FoodRecommender.range_bounds"""
+    return {name: (limits.min, limits.max) for name, limits in filters.items()}
+
 class RecommendationRequest(BaseModel):
     mood: str  # energizing, relaxing, focusing, neutral
     health_conditions: Optional[List[str]] = None  # diabetes, hipertensi, kolesterol, etc.
     top_n: int = 5
+    filters: Optional[Dict[str, NutrientRange]] = None  # calories, proteins, fat, carbohydrate, *_category
+    user_id: Optional[str] = None  # urutan dipersonalisasi dari riwayat user (lihat UserPreferences)
 
 class FoodItem(BaseModel):
     name: str
@@ -44,6 +551,1781 @@ class RecommendationResponse(BaseModel):
     recommendations: List[FoodItem]
     message: str
 
+class FoodSearchResult(BaseModel):
+    id: Union[int, str]  # label index food_df
+    name: str
+    match: str  # exact, prefix, substring, fuzzy
+    score: float  # similarity trigram nama vs query (0-1)
+    calories: float
+    proteins: float
+    fat: float
+    carbohydrate: float
+    primary_mood: Optional[str]
+
+class FoodSearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[FoodSearchResult]
+
+class FoodQueryRequest(BaseModel):
+    filters: Dict[str, NutrientRange]
+    mood: Optional[str] = None  # tanpa mood: urutan katalog; dengan mood: diurutkan seperti /recommend
+    health_conditions: Optional[List[str]] = None
+    limit: int = 10
+    offset: int = 0
+
+class FoodQueryResult(BaseModel):
+    id: Union[int, str]  # label index food_df
+    name: str
+    calories: float
+    proteins: float
+    fat: float
+    carbohydrate: float
+    primary_mood: Optional[str]
+    similarity_score: Optional[float]  # None tanpa mood
+
+class FoodQueryResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    results: List[FoodQueryResult]
+
+class SimilarFoodsResponse(BaseModel):
+    id: Union[int, str]
+    name: str
+    mood: str  # partisi mood yang dipakai
+    health_conditions: Optional[List[str]]
+    results: List[FoodQueryResult]
+
+class MealPlanRequest(BaseModel):
+    mood: str
+    health_conditions: Optional[List[str]] = None
+    days: int = 7
+    snacks: int = 1
+    targets: Optional[Dict[str, float]] = None  # total per hari, nilai ternormalisasi (bukan kkal/gram): calories, proteins, fat, carbohydrate
+    time_budget_ms: Optional[float] = None      # None = NUTRIMOOD_MEAL_PLAN_BUDGET_MS
+
+class MealPlanMeal(BaseModel):
+    slot: str  # breakfast, lunch, dinner, snack
+    food: FoodQueryResult
+
+class MealPlanDay(BaseModel):
+    day: int
+    meals: List[MealPlanMeal]
+    totals: Dict[str, float]
+    deviation: Dict[str, float]  # (total - target) / target
+
+class MealPlanSolverStats(BaseModel):
+    objective: float  # lebih kecil lebih baik (lihat solve_meal_plan)
+    iterations: int
+    kicks: int
+    converged: bool   # False = dihentikan time budget
+    elapsed_ms: float
+    candidates: int
+
+class MealPlanResponse(BaseModel):
+    mood: str
+    health_conditions: Optional[List[str]]
+    targets: Dict[str, float]
+    days: List[MealPlanDay]
+    solver: MealPlanSolverStats
+
+class RecommendationPageRequest(BaseModel):
+    # Halaman pertama: mood (+ health_conditions); halaman berikutnya: cursor dari response sebelumnya
+    mood: Optional[str] = None
+    health_conditions: Optional[List[str]] = None
+    page_size: int = 20
+    cursor: Optional[str] = None
+
+class RecommendationPage(BaseModel):
+    mood: str
+    health_conditions: Optional[List[str]]
+    recommendations: List[FoodItem]
+    offset: int
+    total: int
+    next_cursor: Optional[str]  # None jika sudah halaman terakhir
+
+class RecommendationStreamRequest(BaseModel):
+    mood: str
+    health_conditions: Optional[List[str]] = None
+    limit: Optional[int] = None  # None = seluruh urutan
+
+class BatchRecommendationItem(BaseModel):
+    index: int
+    status_code: int = 200
+    result: Optional[RecommendationResponse] = None
+    error: Optional[str] = None
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[BatchRecommendationItem]
+    total: int
+    failed: int
+
+class MoodPredictionRequest(BaseModel):
+    # Kategori very_low/low/medium/high/very_high atau angka 0-4; kosong = 'low'
+    calorie_category: Optional[Union[str, int]] = None
+    protein_category: Optional[Union[str, int]] = None
+    fat_category: Optional[Union[str, int]] = None
+    carb_category: Optional[Union[str, int]] = None
+
+class MoodPrediction(BaseModel):
+    mood: str
+    confidence: float
+    probabilities: Dict[str, float]
+
+class BatchMoodPredictionItem(BaseModel):
+    index: int
+    status_code: int = 200
+    result: Optional[MoodPrediction] = None
+    error: Optional[str] = None
+
+class BatchMoodPredictionResponse(BaseModel):
+    results: List[BatchMoodPredictionItem]
+    total: int
+    failed: int
+
+class FoodUpsert(BaseModel):
+    # Nilai dasar satu makanan; kolom turunan (*_num, mood_<m>) dihitung server (FoodRecommender.food_rows)
+    name: str
+    calories: float
+    proteins: float
+    fat: float
+    carbohydrate: float
+    primary_mood: str
+    calorie_category: Optional[str] = None  # very_low/low/medium/high/very_high
+    protein_category: Optional[str] = None
+    fat_category: Optional[str] = None
+    carb_category: Optional[str] = None
+    nutrient_balance: Optional[str] = None  # balanced, high_protein, high_carb, high_fat, other
+    vitamin_a: Optional[float] = None
+    vitamin_c: Optional[float] = None
+    vitamin_b: Optional[float] = None
+    iron: Optional[float] = None
+    calcium: Optional[float] = None
+    has_recipe: Optional[int] = None
+    is_energizing: Optional[int] = None  # kosong = primary_mood == 'energizing'
+    is_relaxing: Optional[int] = None
+    is_focusing: Optional[int] = None
+
+class FoodFeedback(BaseModel):
+    food_name: str            # nama makanan di katalog
+    is_liked: bool = False
+    is_consumed: bool = False
+
+class UserFeedbackRequest(BaseModel):
+    mood: str = 'neutral'     # mood saat makanan direkomendasikan (mood_category)
+    items: List[FoodFeedback]
+
+class CatalogUpdateRequest(BaseModel):
+    upserts: List[FoodUpsert] = []  # tambah, atau ganti makanan bernama sama
+    deletes: List[str] = []         # nama makanan yang dihapus
+    persist: bool = False           # simpan juga ke artifact (dipakai worker lain dan setelah restart)
+
+# Indeks fitur per mood (dibangun sekali saat data dimuat)
+# mood -> (kolom, nilai) untuk filter partisi; mood lain memakai partisi 'neutral'
+MOOD_FILTERS = {
+    'energizing': ('is_energizing', 1),
+    'relaxing': ('is_relaxing', 1),
+    'focusing': ('is_focusing', 1),
+    'neutral': ('primary_mood', 'neutral'),
+}
+SIMILARITY_FEATURES = [
+    'primary_mood_num', 'mood_energizing', 'mood_relaxing', 'mood_focusing',
+    'calorie_category_num', 'protein_category_num', 'fat_category_num',
+    'carb_category_num', 'nutrient_balance_num'
+]
+
+def _min_max_scale(raw, col_min, col_max):
+    """Normalisasi min-max per kolom (float64); kolom konstan = 0.5"""
+    span = col_max - col_min
+    constant = span == 0
+    return np.where(constant, 0.5, (raw - col_min) / np.where(constant, 1.0, span))
+
+@dataclass(frozen=True)
+class MoodPartition:
+    """Partisi makanan untuk satu mood beserta fitur yang sudah dinormalisasi (read-only)"""
+    mood: str
+    row_ids: np.ndarray          # posisi baris (iloc) di food_df
+    feature_cols: Tuple[str, ...]
+    raw: np.ndarray              # fitur mentah (fillna(0), bool -> 0/1), float64
+    features: np.ndarray         # fitur min-max per kolom, float32; kolom konstan = 0.5
+    col_min: np.ndarray
+    col_max: np.ndarray
+    col_is_float: np.ndarray     # dtype kolom asli float (mempengaruhi nilai kolom konstan)
+    col_is_bool: np.ndarray
+    calories: np.ndarray
+
+    ARRAY_FIELDS = ('row_ids', 'raw', 'features', 'col_min', 'col_max', 'col_is_float', 'col_is_bool', 'calories')
+
+    def column(self, name):
+        """Nilai mentah satu kolom fitur untuk semua makanan di partisi"""
+        return self.raw[:, self.feature_cols.index(name)]
+
+    def subset(self, positions):
+        """Partisi berisi baris pada posisi tertentu; normalisasi kolom tetap milik partisi asal"""
+        return replace(self, row_ids=self.row_ids[positions], raw=self.raw[positions],
+                       features=self.features[positions], calories=self.calories[positions])
+
+    def to_artifact(self, writer, prefix):
+        for field in self.ARRAY_FIELDS:
+            writer.add(f'{prefix}/{field}', getattr(self, field))
+        return {'feature_cols': list(self.feature_cols)}
+
+    @classmethod
+    def from_artifact(cls, reader, prefix, meta, mood):
+        arrays = {field: reader.array(f'{prefix}/{field}') for field in cls.ARRAY_FIELDS}
+        return cls(mood=mood, feature_cols=tuple(meta['feature_cols']), **arrays)
+
+    @classmethod
+    def build(cls, mood, food_df, row_ids):
+        """Ekstrak, fillna dan normalisasi fitur untuk baris row_ids"""
+        foods = food_df.iloc[row_ids]
+        feature_cols = tuple(col for col in SIMILARITY_FEATURES if col in food_df.columns)
+
+        raw_cols, is_float, is_bool = [], [], []
+        for col in feature_cols:
+            values = foods[col].fillna(0)
+            is_bool.append(values.dtype == 'bool')
+            is_float.append(values.dtype.kind == 'f')
+            raw_cols.append(values.to_numpy(dtype=np.float64))
+
+        raw = np.column_stack(raw_cols) if raw_cols else np.empty((len(row_ids), 0))
+        col_min = raw.min(axis=0) if len(raw) else np.zeros(raw.shape[1])
+        col_max = raw.max(axis=0) if len(raw) else np.zeros(raw.shape[1])
+        features = _min_max_scale(raw, col_min, col_max)
+
+        arrays = {
+            'row_ids': np.asarray(row_ids, dtype=np.int64),
+            'raw': raw,
+            'features': features.astype(np.float32),
+            'col_min': col_min,
+            'col_max': col_max,
+            'col_is_float': np.array(is_float, dtype=bool),
+            'col_is_bool': np.array(is_bool, dtype=bool),
+            'calories': foods['calories'].to_numpy(dtype=np.float64),
+        }
+        for array in arrays.values():
+            array.setflags(write=False)
+        return cls(mood=mood, feature_cols=feature_cols, **arrays)
+
+    def updated(self, added, take, row_ids):
+        """Partisi setelah update katalog: baris take dari gabungan self dan added (partisi baris baru).
+
+        Min/max kolom dipertahankan: hanya dihitung ulang dari semua baris jika baris yang dibuang
+        memegang batas lama, dan kolom hanya dinormalisasi ulang jika batasnya bergeser; selain
+        itu fitur baris lama dipakai apa adanya. Hasil (partisi, kolom yang dinormalisasi ulang).
+        """
+        n = len(self.row_ids)
+        raw = np.concatenate([self.raw, added.raw])[take]
+        if len(raw) == 0:
+            col_min = col_max = np.zeros(raw.shape[1])
+        else:
+            col_min = np.minimum(self.col_min, added.raw.min(axis=0)) if len(added.raw) else self.col_min.copy()
+            col_max = np.maximum(self.col_max, added.raw.max(axis=0)) if len(added.raw) else self.col_max.copy()
+            removed = np.ones(n, dtype=bool)
+            removed[take[take < n]] = False
+            if removed.any():
+                gone = self.raw[removed]
+                for j in np.flatnonzero((gone == self.col_min).any(axis=0) | (gone == self.col_max).any(axis=0)):
+                    col_min[j], col_max[j] = raw[:, j].min(), raw[:, j].max()
+        moved = np.flatnonzero((col_min != self.col_min) | (col_max != self.col_max))
+
+        features = np.concatenate([
+            self.features, _min_max_scale(added.raw, col_min, col_max).astype(np.float32)
+        ])[take]
+        for j in moved:
+            features[:, j] = _min_max_scale(raw[:, j], col_min[j], col_max[j])
+        arrays = {
+            'row_ids': np.asarray(row_ids, dtype=np.int64),
+            'raw': raw,
+            'features': features,
+            'col_min': col_min,
+            'col_max': col_max,
+            'col_is_float': self.col_is_float,
+            'col_is_bool': self.col_is_bool,
+            'calories': np.concatenate([self.calories, added.calories])[take],
+        }
+        for array in arrays.values():
+            array.setflags(write=False)
+        return replace(self, **arrays), [self.feature_cols[j] for j in moved]
+
+# Mode pencarian similarity: 'exact' menilai semua makanan partisi, 'ann' memakai FeatureIndex
+SEARCH_MODES = ('exact', 'ann')
+SEARCH_MODE = os.getenv('NUTRIMOOD_SEARCH_MODE', 'exact')
+ANN_LEVELS = int(os.getenv('NUTRIMOOD_ANN_LEVELS', '16'))  # tingkat kuantisasi per fitur
+ANN_MIN_ROWS = int(os.getenv('NUTRIMOOD_ANN_MIN_ROWS', '50000'))  # partisi lebih kecil tetap exact
+ANN_OVERFETCH = float(os.getenv('NUTRIMOOD_ANN_OVERFETCH', '4'))  # kandidat = top_k x overfetch baris
+ANN_SCORE_TOLERANCE = 1e-9  # skor sel vs skor baris bisa beda beberapa ulp (urutan operasi BLAS)
+
+@dataclass(frozen=True)
+class FeatureIndex:
+    """Indeks kuantisasi fitur satu partisi mood untuk top-k approximate (mode 'ann').
+
+    Fitur ternormalisasi dibulatkan ke `levels` tingkat per kolom dan baris dengan kode
+    sama dikelompokkan menjadi satu sel. Query menilai centroid sel dengan bobot query,
+    mengambil sel terbaik sampai kandidat cukup, lalu kandidat dinilai ulang secara exact.
+    Baris di dalam sel diurutkan seperti tie-break ranking (calories), jadi dari sel besar
+    hanya baris terdepan yang perlu diambil. Fitur kategori (semua SIMILARITY_FEATURES)
+    punya kode sendiri per nilai, sehingga sel homogen dan hasilnya sama dengan mode exact.
+
+    Atribut features/raw/col_* sama bentuknya dengan MoodPartition (satu baris per sel),
+    jadi fungsi similarity dan penalty dipakai apa adanya.
+    """
+    mood: str
+    levels: int
+    feature_cols: Tuple[str, ...]
+    raw: np.ndarray              # fitur mentah baris pertama tiap sel (untuk penalty)
+    features: np.ndarray         # centroid fitur ternormalisasi per sel, float32
+    col_min: np.ndarray
+    col_max: np.ndarray
+    col_is_float: np.ndarray
+    cell_offsets: np.ndarray     # baris sel i = cell_rows[cell_offsets[i]:cell_offsets[i + 1]]
+    cell_rows: np.ndarray        # posisi baris partisi, per sel urut calories lalu posisi
+
+    def column(self, name):
+        """Nilai mentah satu kolom fitur per sel"""
+        return self.raw[:, self.feature_cols.index(name)]
+
+    @property
+    def cells(self):
+        return len(self.features)
+
+    def candidates(self, cell_scores, wanted):
+        """Posisi baris partisi (urut naik) dari sel dengan skor tertinggi, minimal `wanted` baris.
+
+        Sel yang skornya sama (dalam toleransi pembulatan) dengan sel terakhir yang diambil
+        ikut diambil semua, karena skor seri diurutkan ulang berdasarkan calories. Dari tiap
+        sel diambil paling banyak `wanted` baris terdepan.
+        """
+        order = np.argsort(-cell_scores, kind='stable')
+        filled = np.cumsum(np.diff(self.cell_offsets)[order])
+        last = min(int(np.searchsorted(filled, wanted)), len(order) - 1)
+        cells = np.flatnonzero(cell_scores >= cell_scores[order[last]] - ANN_SCORE_TOLERANCE)
+        offsets = self.cell_offsets
+        rows = np.concatenate([self.cell_rows[offsets[c]:min(offsets[c + 1], offsets[c] + wanted)] for c in cells])
+        rows.sort()
+        return rows
+
+    @classmethod
+    def build(cls, partition, levels=ANN_LEVELS):
+        if levels < 2:
+            raise ValueError(f"ANN levels minimal 2, bukan {levels}")
+        n, d = partition.features.shape
+        codes = np.rint(partition.features * (levels - 1)).astype(np.int64)
+        if d and float(levels) ** d < 2.0 ** 62:
+            # Kode per baris dipadatkan jadi satu int64 (jauh lebih cepat dari unique axis=0)
+            codes = codes @ (np.int64(levels) ** np.arange(d, dtype=np.int64))
+            _, first, inverse, counts = np.unique(codes, return_index=True, return_inverse=True, return_counts=True)
+        else:
+            _, first, inverse, counts = np.unique(codes.reshape(n, d), axis=0, return_index=True,
+                                                  return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+        centroids = np.column_stack([
+            np.bincount(inverse, weights=partition.features[:, j], minlength=len(counts)) / counts
+            for j in range(d)
+        ]) if d else np.empty((len(counts), 0))
+        # Tie-break sama dengan _rank_partition; partisi 'relaxing' hanya melayani mood relaxing
+        calories_key = partition.calories if partition.mood != 'relaxing' else -partition.calories
+
+        arrays = {
+            'raw': partition.raw[first],
+            'features': centroids.astype(np.float32),
+            'cell_offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            'cell_rows': np.lexsort((calories_key, inverse)).astype(np.int64),
+        }
+        for array in arrays.values():
+            array.setflags(write=False)
+        return cls(mood=partition.mood, levels=levels, feature_cols=partition.feature_cols,
+                   col_min=partition.col_min, col_max=partition.col_max,
+                   col_is_float=partition.col_is_float, **arrays)
+
+RESULT_COLUMNS = ['name', 'calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'similarity_score']
+MOOD_FLAG_COLUMNS = {'energizing': 'is_energizing', 'relaxing': 'is_relaxing', 'focusing': 'is_focusing'}
+
+def top_k_order(keys, k):
+    """Posisi k teratas seperti np.lexsort(keys)[:k] (key terakhir = key utama, stabil)
+
+    Hanya kandidat dengan key utama <= nilai ke-k (termasuk seri) yang diurutkan penuh,
+    sehingga biayanya O(n + c log c) alih-alih O(n log n).
+    """
+    primary = keys[-1]
+    n = len(primary)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.lexsort(keys)
+    kth = np.partition(primary, k - 1)[k - 1]
+    if np.isnan(kth):
+        return np.lexsort(keys)[:k]
+    candidates = np.flatnonzero(primary <= kth)
+    order = np.lexsort(tuple(key[candidates] for key in keys))[:k]
+    return candidates[order]
+
+def _encode_strings(values):
+    """Kolom string -> (buffer UTF-8 uint8, offset int64 panjang n + 1, mask null); null jadi ''"""
+    null = pd.isna(values).to_numpy() if isinstance(values, pd.Series) else pd.isna(np.asarray(values, dtype=object))
+    encoded = [b'' if missing else str(value).encode('utf-8') for value, missing in zip(values, null)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, np.asarray(null, dtype=bool)
+
+def _decode_strings(buffer, offsets, null):
+    """Kebalikan _encode_strings; null dikembalikan sebagai NaN seperti read_csv"""
+    data = buffer.tobytes()
+    return np.array([
+        np.nan if missing else data[offsets[i]:offsets[i + 1]].decode('utf-8')
+        for i, missing in enumerate(null)
+    ], dtype=object)
+
+def _take_strings(parts, rows):
+    """(buffer, offsets) string pada posisi rows dari gabungan beberapa (buffer, offsets), tanpa decode"""
+    buffer = np.concatenate([part_buffer for part_buffer, _ in parts])
+    shifts = np.cumsum([0] + [len(part_buffer) for part_buffer, _ in parts[:-1]])
+    offsets = np.concatenate([part_offsets[:-1] + shift for (_, part_offsets), shift in zip(parts, shifts)]
+                             + [[len(buffer)]])
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return buffer[positions], new_offsets
+
+def _fixed_width(buffer, offsets, rows):
+    """String pada posisi rows sebagai array bytes lebar tetap (dtype S) untuk np.searchsorted;
+    urutan byte UTF-8 sama dengan urutan str Python"""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    padded = np.zeros((len(rows), width), dtype=np.uint8)
+    filled = np.arange(width) < lengths[:, np.newaxis]
+    padded[filled] = buffer[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]
+    return padded.view(f'S{width}').ravel()
+
+def _merge_sorted(keys_a, rows_a, keys_b, rows_b):
+    """Urutan gabungan dua deret yang masing-masing terurut menurut (key, baris); hasilnya posisi
+    di concat(a, b). Dipakai untuk menyisipkan baris baru ke daftar terurut tanpa sort ulang."""
+    width = max(keys_a.itemsize, keys_b.itemsize)
+
+    def composite(keys, rows):
+        # key + baris big-endian dalam satu string byte: urutan byte = urutan (key, baris)
+        data = np.zeros((len(keys), width + 8), dtype=np.uint8)
+        data[:, :keys.itemsize] = keys.view(np.uint8).reshape(len(keys), keys.itemsize)
+        data[:, width:] = np.asarray(rows, dtype='>i8').view(np.uint8).reshape(len(keys), 8)
+        return data.view(f'S{width + 8}').ravel()
+
+    positions = np.searchsorted(composite(keys_a, rows_a), composite(keys_b, rows_b))
+    return np.insert(np.arange(len(keys_a)), positions, len(keys_a) + np.arange(len(keys_b)))
+
+def _category_codes(values):
+    """Kode kategori int8 (NaN -> 127 agar tetap terakhir saat diurutkan); float32 jika tidak muat"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    present = values[~missing]
+    if len(present) == 0 or (np.all(present == np.round(present)) and present.min() >= -128 and present.max() < 127):
+        return np.where(missing, 127, values).astype(np.int8)
+    return values.astype(np.float32)
+
+def _float32_to_float(values):
+    """float32 -> float Python dengan representasi desimal terpendek (0.015957447, bukan 0.01595744676...)"""
+    return np.array([float(str(value)) for value in values], dtype=np.float64)
+
+@dataclass(frozen=True)
+class FoodCatalog:
+    """Katalog makanan kolumnar (read-only) untuk ranking dan materialisasi hasil
+
+    Nutrisi disimpan sebagai array float32 kontigu, mood/kategori sebagai kode int8 dan
+    nama sebagai satu buffer UTF-8 dengan offset, sehingga hanya k baris hasil yang
+    pernah dijadikan objek Python.
+    """
+    index: pd.Index
+    name_buffer: np.ndarray      # uint8, UTF-8 semua nama disambung
+    name_offsets: np.ndarray     # int64, panjang n + 1
+    calories: np.ndarray         # float32
+    proteins: np.ndarray
+    fat: np.ndarray
+    carbohydrate: np.ndarray
+    mood_codes: np.ndarray       # int8, indeks ke mood_labels (-1 = kosong)
+    mood_labels: Tuple[Optional[str], ...]
+    mood_flags: np.ndarray       # uint8 bitmask dari kolom is_<mood>
+    mood_bits: Mapping[str, int] # mood -> bit, hanya untuk kolom is_<mood> yang ada
+    categories: Mapping[str, np.ndarray]  # kolom *_category_num -> kode int8
+
+    ARRAY_FIELDS = ('name_buffer', 'name_offsets', 'calories', 'proteins', 'fat', 'carbohydrate',
+                    'mood_codes', 'mood_flags')
+
+    def __len__(self):
+        return len(self.calories)
+
+    @property
+    def nbytes(self):
+        arrays = [getattr(self, field) for field in self.ARRAY_FIELDS] + list(self.categories.values())
+        return sum(array.nbytes for array in arrays)
+
+    def names(self, row_ids):
+        """Decode nama untuk posisi baris row_ids"""
+        offsets, data = self.name_offsets, memoryview(self.name_buffer)
+        return [str(data[offsets[i]:offsets[i + 1]], 'utf-8') for i in row_ids]
+
+    def mood_mask(self, mood, row_ids=None):
+        """Mask makanan (semua, atau hanya row_ids) dengan is_<mood> == 1; None jika kolomnya tidak ada"""
+        bit = self.mood_bits.get(mood)
+        if bit is None:
+            return None
+        flags = self.mood_flags if row_ids is None else self.mood_flags[row_ids]
+        return (flags & bit) != 0
+
+    def filter_mask(self, column, value):
+        """Mask filter partisi MOOD_FILTERS (is_<mood> == 1 atau primary_mood == value); None jika
+        kolomnya tidak ada di katalog"""
+        if column == 'primary_mood':
+            code = self.mood_labels.index(value) if value in self.mood_labels else -2
+            return self.mood_codes == code
+        moods = [mood for mood, flag_column in MOOD_FLAG_COLUMNS.items() if flag_column == column]
+        return self.mood_mask(moods[0]) if moods and value == 1 else None
+
+    def merged(self, added, sources):
+        """Katalog baru berisi baris sources dari gabungan self (posisi 0..n-1) dan added (n..)"""
+        sources = np.asarray(sources, dtype=np.int64)
+        labels = list(self.mood_labels)
+        labels += [label for label in added.mood_labels if label not in labels]
+        # Kode -1 (kosong) tetap -1 lewat elemen terakhir
+        added_codes = np.array([labels.index(label) for label in added.mood_labels] + [-1])[added.mood_codes]
+        mood_codes = np.concatenate([self.mood_codes, added_codes])[sources]
+        categories = {}
+        for column, codes in self.categories.items():
+            added_column = added.categories[column]
+            if codes.dtype == added_column.dtype:
+                categories[column] = np.concatenate([codes, added_column])[sources]
+            else:
+                # int8 dan float32 tercampur: bangun ulang dari nilai (127 = NaN di kode int8)
+                values = [np.where(c == 127, np.nan, c) if c.dtype == np.int8 else c for c in (codes, added_column)]
+                categories[column] = _category_codes(np.concatenate(values)[sources])
+        name_buffer, name_offsets = _take_strings(
+            [(self.name_buffer, self.name_offsets), (added.name_buffer, added.name_offsets)], sources)
+        arrays = {
+            'name_buffer': name_buffer,
+            'name_offsets': name_offsets,
+            'mood_codes': mood_codes.astype(np.int8 if len(labels) < 128 else np.int16),
+            'mood_flags': np.concatenate([self.mood_flags, added.mood_flags])[sources],
+        }
+        for field in ('calories', 'proteins', 'fat', 'carbohydrate'):
+            arrays[field] = np.concatenate([getattr(self, field), getattr(added, field)])[sources]
+        for array in itertools.chain(arrays.values(), categories.values()):
+            array.setflags(write=False)
+        return FoodCatalog(
+            index=pd.RangeIndex(len(sources)),
+            mood_labels=tuple(labels),
+            mood_bits=self.mood_bits,
+            categories=MappingProxyType(categories),
+            **arrays
+        )
+
+    def to_artifact(self, writer, prefix):
+        for field in self.ARRAY_FIELDS:
+            writer.add(f'{prefix}/{field}', getattr(self, field))
+        for column, codes in self.categories.items():
+            writer.add(f'{prefix}/categories/{column}', codes)
+        return {
+            'mood_labels': list(self.mood_labels),
+            'mood_bits': dict(self.mood_bits),
+            'categories': list(self.categories),
+        }
+
+    @classmethod
+    def from_artifact(cls, reader, prefix, meta, index):
+        arrays = {field: reader.array(f'{prefix}/{field}') for field in cls.ARRAY_FIELDS}
+        categories = {column: reader.array(f'{prefix}/categories/{column}') for column in meta['categories']}
+        return cls(
+            index=index,
+            mood_labels=tuple(meta['mood_labels']),
+            mood_bits=MappingProxyType(meta['mood_bits']),
+            categories=MappingProxyType(categories),
+            **arrays
+        )
+
+    @classmethod
+    def build(cls, food_df):
+        name_buffer, name_offsets, _ = _encode_strings(food_df['name'])
+
+        codes, labels = pd.factorize(food_df['primary_mood'])
+        mood_codes = codes.astype(np.int8 if len(labels) < 128 else np.int16)
+
+        mood_flags = np.zeros(len(food_df), dtype=np.uint8)
+        mood_bits = {}
+        for bit, (mood, column) in enumerate(MOOD_FLAG_COLUMNS.items()):
+            if column in food_df.columns:
+                mood_bits[mood] = 1 << bit
+                mood_flags[(food_df[column] == 1).to_numpy()] |= 1 << bit
+
+        categories = {
+            column: _category_codes(food_df[column])
+            for column in food_df.columns if column.endswith('_category_num')
+        }
+        arrays = {
+            'name_buffer': name_buffer,
+            'name_offsets': name_offsets,
+            'calories': food_df['calories'].to_numpy(dtype=np.float32),
+            'proteins': food_df['proteins'].to_numpy(dtype=np.float32),
+            'fat': food_df['fat'].to_numpy(dtype=np.float32),
+            'carbohydrate': food_df['carbohydrate'].to_numpy(dtype=np.float32),
+            'mood_codes': mood_codes,
+            'mood_flags': mood_flags,
+        }
+        for array in itertools.chain(arrays.values(), categories.values()):
+            array.setflags(write=False)
+        return cls(
+            index=food_df.index,
+            mood_labels=tuple(labels),
+            mood_bits=MappingProxyType(mood_bits),
+            categories=MappingProxyType(categories),
+            **arrays
+        )
+
+# Filter rentang nutrisi: nama filter di API -> kolom katalog (kategori dari FoodCatalog.categories)
+RANGE_FILTER_COLUMNS = {
+    'calories': 'calories',
+    'proteins': 'proteins',
+    'fat': 'fat',
+    'carbohydrate': 'carbohydrate',
+    'calorie_category': 'calorie_category_num',
+    'protein_category': 'protein_category_num',
+    'fat_category': 'fat_category_num',
+    'carb_category': 'carb_category_num',
+}
+
+def _sorted_positions(row_ids, rows):
+    """Posisi rows di row_ids (keduanya urut naik); baris yang tidak ada di row_ids dibuang"""
+    if len(row_ids) == 0:
+        return np.zeros(0, dtype=np.intp)
+    positions = np.searchsorted(row_ids, rows)
+    np.minimum(positions, len(row_ids) - 1, out=positions)
+    return positions[row_ids[positions] == rows]
+
+@dataclass(frozen=True)
+class NutrientIndex:
+    """Urutan nilai per kolom nutrisi/kategori katalog untuk filter rentang.
+
+    Rentang satu kolom adalah satu slice urutan (binary search). Filter beberapa kolom
+    diambil dari slice paling kecil lalu kolom lain dicek hanya untuk baris slice itu,
+    jadi biayanya sebanding jumlah hasil, bukan ukuran katalog.
+    """
+    values: Mapping[str, np.ndarray]         # kolom -> nilai per baris katalog (view FoodCatalog)
+    sorted_values: Mapping[str, np.ndarray]
+    sorted_rows: Mapping[str, np.ndarray]    # kolom -> posisi baris urut nilai (stabil, NaN di akhir)
+
+    @classmethod
+    def build(cls, catalog):
+        values = {column: getattr(catalog, column) for column in ('calories', 'proteins', 'fat', 'carbohydrate')}
+        values.update(catalog.categories)
+        dtype = np.int32 if len(catalog) < 2 ** 31 else np.int64
+        sorted_rows = {column: np.argsort(array, kind='stable').astype(dtype) for column, array in values.items()}
+        sorted_values = {column: values[column][order] for column, order in sorted_rows.items()}
+        for array in itertools.chain(sorted_rows.values(), sorted_values.values()):
+            array.setflags(write=False)
+        return cls(values=MappingProxyType(values), sorted_values=MappingProxyType(sorted_values),
+                   sorted_rows=MappingProxyType(sorted_rows))
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in itertools.chain(self.sorted_rows.values(), self.sorted_values.values()))
+
+    def stored_range(self, column):
+        """(min, max) nilai tersimpan kolom (NaN diabaikan); None jika kolom kosong"""
+        values = self.sorted_values[column]
+        if values.dtype.kind == 'f':
+            values = values[:len(values) - int(np.isnan(values).sum())]  # NaN di akhir urutan
+        return (values[0].item(), values[-1].item()) if len(values) else None
+
+    def _bound(self, column, value, default):
+        if value is None:
+            return default
+        # Bandingkan dengan presisi kolom (float32), sama dengan nilai yang ditampilkan di response
+        dtype = self.values[column].dtype
+        return dtype.type(value) if dtype.kind == 'f' else value
+
+    def select(self, bounds):
+        """Posisi baris (urut naik) dengan min <= nilai <= max untuk semua (kolom, min, max); None = terbuka"""
+        slices = []
+        for column, low, high in bounds:
+            low, high = self._bound(column, low, -np.inf), self._bound(column, high, np.inf)
+            values = self.sorted_values[column]
+            start, stop = np.searchsorted(values, low, 'left'), np.searchsorted(values, high, 'right')
+            slices.append((max(stop - start, 0), column, start, stop, low, high))
+        if not slices:
+            raise ValueError("Filter rentang kosong")
+        slices.sort(key=lambda item: item[0])
+        _, column, start, stop, _, _ = slices[0]
+        rows = self.sorted_rows[column][start:max(start, stop)]
+        for _, column, _, _, low, high in slices[1:]:
+            if len(rows) == 0:
+                break
+            values = self.values[column][rows]
+            rows = rows[(values >= low) & (values <= high)]
+        return np.sort(rows).astype(np.intp)
+
+# Makanan serupa (/foods/{id}/similar): daftar tetangga per makanan, dihitung saat build/artifact
+NEIGHBOUR_LIST_SIZE = int(os.getenv('NUTRIMOOD_NEIGHBOURS', '32'))  # tetangga tersimpan per makanan
+NEIGHBOUR_BLOCK_ROWS = 4096  # makanan per blok build (satu task thread pool)
+
+@dataclass(frozen=True)
+class NeighbourLists:
+    """Tetangga terdekat setiap makanan satu partisi mood, di ruang fitur get_food_similarity.
+
+    Urutan: weighted cosine (bobot dasar, tanpa kondisi) menurun, selisih calories, lalu posisi
+    baris. Baris i milik makanan partition.row_ids[i]; disimpan ringkas (int32 + float16) dan
+    ikut artifact, jadi request cukup membaca satu baris.
+    """
+    mood: str
+    rows: np.ndarray    # (makanan partisi, NEIGHBOUR_LIST_SIZE) posisi baris katalog tetangga; -1 = kosong
+    scores: np.ndarray  # float16, sejajar dengan rows
+
+    ARRAY_FIELDS = ('rows', 'scores')
+
+    @property
+    def size(self):
+        return self.rows.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.scores.nbytes
+
+    @classmethod
+    def build(cls, partition, positions, scores):
+        """Dari posisi partisi tetangga (-1 = kosong) dan skornya"""
+        valid = positions >= 0
+        rows = np.where(valid, partition.row_ids[np.maximum(positions, 0)], -1).astype(np.int32)
+        scores = np.where(valid, scores, 0.0).astype(np.float16)
+        rows.setflags(write=False)
+        scores.setflags(write=False)
+        return cls(mood=partition.mood, rows=rows, scores=scores)
+
+    def to_artifact(self, writer, prefix):
+        for field in self.ARRAY_FIELDS:
+            writer.add(f'{prefix}/{field}', getattr(self, field))
+
+    @classmethod
+    def from_artifact(cls, reader, prefix, mood):
+        return cls(mood=mood, **{field: reader.array(f'{prefix}/{field}') for field in cls.ARRAY_FIELDS})
+
+def _row_groups(features):
+    """(posisi pertama, grup per baris) vektor fitur unik, urut leksikografis seperti
+    np.unique(axis=0) tapi lewat kode per kolom (jauh lebih cepat untuk ratusan ribu baris)"""
+    key, size = np.zeros(len(features), dtype=np.int64), 1
+    for column in features.T:
+        codes, uniques = pd.factorize(column, sort=True)
+        if size * len(uniques) >= 2 ** 62:
+            _, key = np.unique(key, return_inverse=True)
+            size = int(key.max()) + 1
+        key, size = key * len(uniques) + codes, size * len(uniques)
+    _, first, group_of = np.unique(key, return_index=True, return_inverse=True)
+    return first, group_of.reshape(-1)
+
+class _NeighbourSpace:
+    """Grup vektor fitur unik satu partisi dan similarity antar grup, untuk NeighbourLists.
+
+    Fitur similarity berupa kategori, jadi jumlah grup kecil dan similarity cukup dihitung per
+    pasangan grup. Di dalam satu grup skornya seri dan urutan ditentukan selisih calories,
+    sehingga dari setiap grup kandidat cukup diambil `wanted` baris terdekat calories-nya di
+    kiri dan kanan (baris grup diurutkan calories sekali per pool).
+    """
+    def __init__(self, group_of, first, vectors, similarity, calories):
+        self.group_of = group_of       # posisi partisi -> grup
+        self.first = first             # posisi partisi wakil tiap grup
+        self.calories = calories       # calories per posisi partisi
+        self.vectors = vectors         # vektor ternormalisasi per grup
+        self.similarity = similarity   # vektor query (n x d) -> similarity ke semua grup (n x grup)
+        self._rows = {}
+
+    @property
+    def groups(self):
+        return len(self.vectors)
+
+    def similarities(self, group):
+        row = self._rows.get(group)
+        if row is None:
+            row = self._rows[group] = self.similarity(self.vectors[group:group + 1])[0]
+        return row
+
+    def pool(self, positions):
+        """Kandidat per grup: (offset, urut calories lalu posisi naik, urut calories naik lalu posisi
+        turun, calories terurut, jumlah per grup)"""
+        groups, calories = self.group_of[positions], self.calories[positions]
+        ascending = positions[np.lexsort((positions, calories, groups))]
+        descending = positions[np.lexsort((-positions, calories, groups))]
+        counts = np.bincount(groups, minlength=self.groups)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return offsets, ascending, descending, self.calories[ascending], counts
+
+    def candidates(self, similarities, calories, pool, wanted, floor=None, allowed=None):
+        """(posisi, skor) kandidat (matriks query x kandidat, -1/-inf = kosong) yang pasti memuat
+        `wanted` tetangga teratas tiap query dari pool. similarities: skor query ke setiap grup
+        (sama untuk semua query), calories: calories tiap query. Grup di bawah floor atau di luar
+        allowed dilewati; tanpa floor diambil grup teratas sampai pool-nya berisi `wanted` baris."""
+        offsets, ascending, descending, sorted_calories, counts = pool
+        if allowed is not None:
+            counts = np.where(allowed, counts, 0)
+        if floor is None:
+            order = np.argsort(-similarities, kind='stable')
+            filled = np.cumsum(counts[order])
+            last = min(int(np.searchsorted(filled, wanted)), len(order) - 1)
+            floor = similarities[order[last]]
+        steps = np.arange(wanted)
+        positions, scores = [], []
+        for candidate in np.flatnonzero((similarities >= floor) & (counts > 0)):
+            start, stop = offsets[candidate], offsets[candidate + 1]
+            split = np.searchsorted(sorted_calories[start:stop], calories)[:, np.newaxis]
+            # Kanan: calories >= milik query, posisi naik; kiri: calories lebih kecil, terdekat dulu
+            for run, index in ((ascending, split + steps), (descending, split - 1 - steps)):
+                valid = (index >= 0) & (index < stop - start)
+                positions.append(np.where(valid, run[start + np.clip(index, 0, stop - start - 1)], -1))
+                scores.append(np.where(valid, similarities[candidate], -np.inf))
+        if not positions:
+            return np.full((len(calories), 0), -1), np.zeros((len(calories), 0))
+        return np.hstack(positions), np.hstack(scores)
+
+    def select(self, members, calories, positions, scores, k):
+        """k tetangga teratas per query dari kandidat; members: posisi query sendiri (dibuang), -1 = bukan anggota"""
+        if positions.shape[1] < k:
+            pad = k - positions.shape[1]
+            positions = np.hstack([positions, np.full((len(members), pad), -1)])
+            scores = np.hstack([scores, np.full((len(members), pad), -np.inf)])
+        scores = np.where(positions == members[:, np.newaxis], -np.inf, scores)
+        distance = np.abs(self.calories[positions] - calories[:, np.newaxis])
+        order = np.lexsort((positions, distance, -scores), axis=-1)[:, :k]
+        positions = np.take_along_axis(positions, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        positions[np.isneginf(scores)] = -1
+        return positions, scores
+
+# Meal plan (/meal-plan): slot harian, bobot objective dan budget waktu solver
+MEAL_PLAN_NUTRIENTS = ('calories', 'proteins', 'fat', 'carbohydrate')
+MEAL_SLOT_SHARES = {'breakfast': 0.25, 'lunch': 0.35, 'dinner': 0.30}  # porsi kalori harian per slot
+MEAL_PLAN_SNACK_SHARE = 0.10      # dibagi rata ke semua snack
+MEAL_PLAN_NUTRIENT_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])  # sejajar MEAL_PLAN_NUTRIENTS; kalori paling penting
+MEAL_PLAN_SLOT_WEIGHT = 0.25      # penalty kalori item yang jauh dari porsi slotnya
+MEAL_PLAN_SCORE_WEIGHT = 0.2      # bonus similarity_score recommend_for_mood
+MEAL_PLAN_BUDGET_MS = float(os.getenv('NUTRIMOOD_MEAL_PLAN_BUDGET_MS', '40'))  # + serialisasi < 50 ms untuk 7 hari
+MEAL_PLAN_CANDIDATES = int(os.getenv('NUTRIMOOD_MEAL_PLAN_CANDIDATES', '200'))  # minimal; naik 2x jumlah item plan
+MEAL_PLAN_STALL_KICKS = 30        # berhenti sebelum budget habis setelah sekian kick tanpa perbaikan
+
+def meal_plan_slots(snacks):
+    """(nama slot, porsi kalori harian per slot) untuk sarapan/makan siang/makan malam + snacks"""
+    names = list(MEAL_SLOT_SHARES) + [f'snack_{i + 1}' if snacks > 1 else 'snack' for i in range(snacks)]
+    shares = np.array(list(MEAL_SLOT_SHARES.values()) + [MEAL_PLAN_SNACK_SHARE / max(snacks, 1)] * snacks)
+    return tuple(names), shares / shares.sum()
+
+@dataclass(frozen=True)
+class MealPlan:
+    """Hasil solve_meal_plan: indeks kandidat per (hari, slot) dan statistik solver"""
+    items: np.ndarray  # (hari, slot) indeks baris nutrients/scores
+    objective: float
+    iterations: int    # langkah local search yang diterapkan
+    kicks: int         # perturbasi (iterated local search) setelah optimum lokal
+    converged: bool    # optimum lokal terakhir tercapai sebelum deadline
+    elapsed: float     # detik
+
+def solve_meal_plan(nutrients, scores, days, shares, deadline, seed=0):
+    """Plan `days` hari x len(shares) slot dari kandidat; dikembalikan plan terbaik sebelum deadline.
+
+    nutrients: (kandidat x MEAL_PLAN_NUTRIENTS) sudah dibagi target harian, jadi hari ideal
+    berjumlah 1 per nutrisi. Objective (lebih kecil lebih baik): deviasi kuadrat total harian
+    dari target, kalori item vs porsi slot, dikurangi skor rekomendasi. Setiap kandidat dipakai
+    paling banyak ceil(item plan / kandidat) kali dan tidak dua kali di hari yang sama.
+
+    Greedy per slot, lalu steepest descent: semua langkah ganti (posisi x kandidat) dan tukar
+    (posisi x posisi) dinilai sekaligus sebagai array, yang terbaik diterapkan. Di optimum lokal
+    beberapa posisi diacak (kick) dan descent diulang selama budget masih ada.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    n, slots = len(nutrients), len(shares)
+    positions = days * slots
+    capacity = -(-positions // n)
+    day_of, slot_of = np.repeat(np.arange(days), slots), np.tile(np.arange(slots), days)
+    weights = MEAL_PLAN_NUTRIENT_WEIGHTS[:nutrients.shape[1]]
+    item_cost = (MEAL_PLAN_SLOT_WEIGHT * (nutrients[:, :1] - shares) ** 2
+                 - MEAL_PLAN_SCORE_WEIGHT * np.asarray(scores, dtype=np.float64)[:, np.newaxis])
+
+    def day_cost(totals):
+        return ((totals - 1.0) ** 2) @ weights
+
+    items = np.empty(positions, dtype=np.intp)
+    counts = np.zeros(n, dtype=np.intp)
+    in_day = np.zeros((days, n), dtype=bool)
+    totals = np.zeros((days, nutrients.shape[1]))
+
+    def place(position, item):
+        day = day_of[position]
+        items[position] = item
+        counts[item] += 1
+        in_day[day, item] = True
+        totals[day] += nutrients[item]
+
+    def take(position):
+        item, day = items[position], day_of[position]
+        counts[item] -= 1
+        in_day[day, item] = False
+        totals[day] -= nutrients[item]
+
+    # Greedy: slot terbesar dulu, menuju target parsial sebanding porsi kalori yang sudah terisi
+    order = np.argsort(-shares, kind='stable')
+    for day in range(days):
+        filled = 0.0
+        for slot in order:
+            filled += shares[slot]
+            cost = day_cost(totals[day] + nutrients + (1.0 - filled)) + item_cost[:, slot]
+            cost[(counts >= capacity) | in_day[day]] = np.inf
+            choice = int(np.argmin(cost))
+            if not np.isfinite(cost[choice]):  # kapasitas habis: kandidat yang paling jarang dipakai
+                choice = int(np.argmin(np.where(in_day[day], np.iinfo(np.intp).max, counts)))
+            place(day * slots + slot, choice)
+
+    def objective():
+        return float(day_cost(totals).sum() + item_cost[items, slot_of].sum())
+
+    best, best_items = objective(), items.copy()
+    iterations = kicks = stalled = 0
+    converged = False
+    same_day = day_of[:, np.newaxis] == day_of[np.newaxis, :]
+    slot_costs = item_cost[:, slot_of].T                  # (posisi, kandidat)
+    squares = (nutrients ** 2) @ weights
+
+    def added_cost(base, added, added_squares):
+        # day_cost(base[p] + added[c]) untuk semua (p, c): kuadrat diuraikan jadi satu perkalian matriks
+        offset = base - 1.0
+        return ((offset ** 2) @ weights)[:, np.newaxis] + 2 * (offset * weights) @ added.T + added_squares
+
+    while time.perf_counter() < deadline:
+        current_days = day_cost(totals)[day_of]
+        current_items = slot_costs[np.arange(positions), items]
+        held = nutrients[items]
+        base = totals[day_of] - held  # total hari posisi tanpa item-nya
+        # Ganti item posisi p dengan kandidat c
+        replace_delta = (added_cost(base, nutrients, squares) - current_days[:, np.newaxis]
+                         + slot_costs - current_items[:, np.newaxis])
+        replace_delta[(counts >= capacity)[np.newaxis, :] | in_day[day_of]] = np.inf
+        # Tukar item posisi p dan q (beda hari: total kedua hari berubah; hari sama: hanya porsi slot)
+        swap_days = added_cost(base, held, squares[items]) - current_days[:, np.newaxis]
+        swap_delta = np.where(same_day, 0.0, swap_days + swap_days.T)
+        moved = slot_costs[:, items] - current_items[np.newaxis, :]  # item q di slot posisi p
+        swap_delta += moved + moved.T
+        duplicate = in_day[day_of][:, items] & ~same_day  # item q sudah ada di hari p
+        swap_delta[(items[:, np.newaxis] == items[np.newaxis, :]) | duplicate | duplicate.T] = np.inf
+
+        replace_at, swap_at = np.argmin(replace_delta), np.argmin(swap_delta)
+        gain = min(replace_delta.flat[replace_at], swap_delta.flat[swap_at])
+        if gain < -1e-12:
+            iterations += 1
+            if replace_delta.flat[replace_at] <= swap_delta.flat[swap_at]:
+                position, item = divmod(int(replace_at), n)
+                take(position)
+                place(position, item)
+            else:
+                first, second = divmod(int(swap_at), positions)
+                a, b = items[first], items[second]
+                take(first)
+                take(second)
+                place(first, b)
+                place(second, a)
+            continue
+
+        # Optimum lokal
+        value = objective()
+        if value < best - 1e-12:
+            best, best_items, stalled = value, items.copy(), 0
+        else:
+            stalled += 1
+        if stalled >= MEAL_PLAN_STALL_KICKS:
+            converged = True
+            break
+        # Kick dari plan terbaik: beberapa posisi diganti kandidat acak yang valid
+        kicks += 1
+        for position in np.flatnonzero(items != best_items):
+            take(position)
+        for position in np.flatnonzero(items != best_items):
+            place(position, best_items[position])
+        for position in rng.choice(positions, size=min(positions, max(2, positions // 10)), replace=False):
+            take(position)
+            valid = np.flatnonzero((counts < capacity) & ~in_day[day_of[position]])
+            place(position, int(rng.choice(valid)) if len(valid) else items[position])
+    else:
+        value = objective()
+        if value < best - 1e-12:
+            best, best_items = value, items.copy()
+
+    return MealPlan(items=best_items.reshape(days, slots), objective=best, iterations=iterations, kicks=kicks,
+                    converged=converged, elapsed=time.perf_counter() - started)
+
+# Pencarian nama makanan
+_NAME_SEPARATORS = re.compile(r'[\W_]+')
+NAME_MATCH_KINDS = ('fuzzy', 'substring', 'prefix', 'exact')  # urutan = peringkat (exact tertinggi)
+NAME_FUZZY_MIN_SHARED = 0.5  # fraksi trigram query yang minimal harus ada di nama untuk hasil fuzzy
+NAME_FUZZY_MAX_EDITS = 2     # typo yang ditoleransi; satu edit menghilangkan paling banyak 3 trigram
+NAME_VERIFY_BELOW = 64       # kandidat substring sebanyak ini langsung dicek dengan `in`
+NAME_INDEX_VERSION = 1       # naikkan jika normalize_name/trigram berubah; indeks lama di artifact dibangun ulang
+
+def normalize_name(text):
+    """Huruf kecil tanpa diakritik dan tanda baca, dipisah satu spasi ('Kacang Merah/Kering' -> 'kacang merah kering')"""
+    text = text or ''
+    if not text.isascii():  # teks ASCII tidak punya diakritik
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NAME_SEPARATORS.sub(' ', text.casefold()).split())
+
+def _name_trigrams(normalized):
+    """Trigram unik nama ter-normalisasi, dengan padding awal/akhir seperti pg_trgm"""
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _trigram_code(gram):
+    """Trigram -> int64 (21 bit per code point) agar daftar trigram bisa disimpan sebagai array terurut"""
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+class _Utf8Strings:
+    """Sequence read-only string dari buffer UTF-8 + offset (opsional lewat urutan order),
+    cukup untuk bisect tanpa menyimpan satu objek str per baris"""
+    def __init__(self, buffer, offsets, order=None):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.order = order
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if self.order is not None:
+            i = self.order[i]
+        return str(memoryview(self.buffer)[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+@dataclass(frozen=True)
+class FoodNameIndex:
+    """Indeks nama makanan untuk /foods/search: prefix (bisect atas nama dan kata yang diurutkan),
+    substring (irisan posting trigram lalu diverifikasi) dan fuzzy (koefisien Dice trigram).
+
+    Seluruhnya array NumPy (nama ter-normalisasi sebagai buffer UTF-8, posting trigram sebagai
+    CSR int32 dengan posisi baris naik), sehingga bisa disimpan di artifact dan di-mmap bersama
+    oleh semua worker. Query hanya menyentuh posting trigram yang ada di query.
+    """
+    name_buffer: np.ndarray        # uint8, nama ter-normalisasi disambung
+    name_offsets: np.ndarray       # int64, panjang n + 1
+    lengths: np.ndarray            # int32, panjang nama ter-normalisasi (karakter)
+    gram_counts: np.ndarray        # int32, jumlah trigram unik per nama
+    sorted_name_rows: np.ndarray   # int32, baris diurutkan menurut nama ter-normalisasi
+    token_buffer: np.ndarray       # uint8, kata (token) terurut disambung
+    token_offsets: np.ndarray      # int64
+    token_rows: np.ndarray         # int32, baris pemilik tiap token
+    gram_codes: np.ndarray         # int64, kode trigram terurut (_trigram_code)
+    posting_offsets: np.ndarray    # int64, panjang len(gram_codes) + 1
+    postings: np.ndarray           # int32, baris per trigram
+
+    ARRAY_FIELDS = ('name_buffer', 'name_offsets', 'lengths', 'gram_counts', 'sorted_name_rows', 'token_buffer',
+                    'token_offsets', 'token_rows', 'gram_codes', 'posting_offsets', 'postings')
+
+    @classmethod
+    def build(cls, names):
+        normalized = [normalize_name(name) for name in names]
+        n = len(normalized)
+        name_buffer, name_offsets, _ = _encode_strings(normalized)
+
+        tokens = sorted({(token, i) for i, name in enumerate(normalized) for token in name.split()})
+        token_buffer, token_offsets, _ = _encode_strings([token for token, _ in tokens])
+
+        # Trigram semua nama sekaligus (sama dengan _name_trigrams/_trigram_code): code point nama
+        # ber-padding disambung, lalu trigram per posisi yang tidak melewati batas nama
+        padded = [f'  {name} ' if name else '' for name in normalized]
+        points = np.frombuffer(''.join(padded).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+        padded_lengths = np.array([len(name) for name in padded], dtype=np.int64)
+        gram_lengths = np.maximum(padded_lengths - 2, 0)
+        shifts = (np.cumsum(padded_lengths) - padded_lengths) - (np.cumsum(gram_lengths) - gram_lengths)
+        positions = np.repeat(shifts, gram_lengths) + np.arange(gram_lengths.sum())
+        gram_codes = (points[positions] << 42) | (points[positions + 1] << 21) | points[positions + 2]
+        gram_rows = np.repeat(np.arange(n), gram_lengths)
+        # Trigram unik per nama, urut per baris
+        order = np.lexsort((gram_codes, gram_rows))
+        gram_codes, gram_rows = gram_codes[order], gram_rows[order]
+        first = np.ones(len(gram_codes), dtype=bool)
+        first[1:] = (gram_codes[1:] != gram_codes[:-1]) | (gram_rows[1:] != gram_rows[:-1])
+        gram_codes, gram_rows = gram_codes[first], gram_rows[first]
+        gram_counts = np.bincount(gram_rows, minlength=n).astype(np.int32)
+        unique_codes, gram_of = np.unique(gram_codes, return_inverse=True)
+        # Urut per trigram, stabil sehingga posisi baris di tiap posting tetap naik
+        by_gram = np.argsort(gram_of, kind='stable')
+        posting_offsets = np.zeros(len(unique_codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_of, minlength=len(unique_codes)), out=posting_offsets[1:])
+
+        return cls(
+            name_buffer=name_buffer,
+            name_offsets=name_offsets,
+            lengths=np.array([len(name) for name in normalized], dtype=np.int32),
+            gram_counts=gram_counts,
+            sorted_name_rows=np.array(sorted(range(n), key=normalized.__getitem__), dtype=np.int32),
+            token_buffer=token_buffer,
+            token_offsets=token_offsets,
+            token_rows=np.array([i for _, i in tokens], dtype=np.int32),
+            gram_codes=unique_codes,
+            posting_offsets=posting_offsets,
+            postings=gram_rows.astype(np.int32)[by_gram],
+        )
+
+    def merged(self, added, sources):
+        """Indeks untuk baris sources dari gabungan self (posisi 0..n-1) dan added (n..) tanpa build
+        ulang: nama dan kata terurut digabung (merge), posting trigram disisipkan. Baris self harus
+        tetap berurutan naik di sources (baris added boleh di mana saja); hasilnya sama dengan build().
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        n, total = len(self), len(sources)
+        if total == 0:
+            return FoodNameIndex.build([])
+        new_of = np.full(n + len(added), -1, dtype=np.int64)
+        new_of[sources] = np.arange(total)
+        self_rows, added_rows = new_of[:n], new_of[n:]
+
+        def merge(sides):
+            # sides: (key S per entri terurut, posisi string per entri, jumlah string, baris baru per
+            # entri) untuk self dan added; hasil (posisi string di gabungan keduanya, baris baru) terurut
+            keys, rows, positions, shift = [], [], [], 0
+            for entry_keys, entries, strings, entry_rows in sides:
+                keep = entry_rows >= 0
+                keys.append(entry_keys[keep])
+                rows.append(entry_rows[keep])
+                positions.append(entries[keep] + shift)
+                shift += strings
+            # Baris added bisa berpindah urutan di sources: urutkan ulang sisinya (kecil)
+            order = np.lexsort((rows[1], keys[1]))
+            keys[1], rows[1], positions[1] = keys[1][order], rows[1][order], positions[1][order]
+            order = _merge_sorted(keys[0], rows[0], keys[1], rows[1])
+            return np.concatenate(positions)[order], np.concatenate(rows)[order], np.concatenate(keys)[order]
+
+        _, sorted_name_rows, sorted_name_keys = merge([
+            (index._sorted_name_keys, index.sorted_name_rows, len(index), rows[index.sorted_name_rows])
+            for index, rows in ((self, self_rows), (added, added_rows))
+        ])
+        token_positions, token_rows, token_keys = merge([
+            (index._sorted_token_keys, np.arange(len(index.token_rows)), len(index.token_rows), rows[index.token_rows])
+            for index, rows in ((self, self_rows), (added, added_rows))
+        ])
+        token_buffer, token_offsets = _take_strings(
+            [(self.token_buffer, self.token_offsets), (added.token_buffer, added.token_offsets)], token_positions)
+
+        # Posting self (baris dipetakan, yang dihapus dibuang) tetap urut per (trigram, baris); baris
+        # added disisipkan di posisinya, dicari lewat key trigram * total + baris
+        gram_codes = np.union1d(self.gram_codes, added.gram_codes)
+        counts = np.zeros(len(gram_codes), dtype=np.int64)
+        entries = []
+        for index, rows in ((self, self_rows), (added, added_rows)):
+            grams = np.repeat(np.searchsorted(gram_codes, index.gram_codes), np.diff(index.posting_offsets))
+            entry_rows = rows[index.postings]
+            keep = entry_rows >= 0
+            if not keep.all():
+                grams, entry_rows = grams[keep], entry_rows[keep]
+            counts += np.bincount(grams, minlength=len(gram_codes))
+            entries.append((grams, entry_rows))
+        (self_grams, self_entries), (added_grams, added_entries) = entries
+        order = np.lexsort((added_entries, added_grams))
+        positions = np.searchsorted(self_grams * total + self_entries, added_grams[order] * total + added_entries[order])
+        postings = np.insert(self_entries.astype(np.int32), positions, added_entries[order].astype(np.int32))
+        present = counts > 0
+        posting_offsets = np.zeros(int(present.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[present], out=posting_offsets[1:])
+
+        name_buffer, name_offsets = _take_strings(
+            [(self.name_buffer, self.name_offsets), (added.name_buffer, added.name_offsets)], sources)
+        merged = FoodNameIndex(
+            name_buffer=name_buffer,
+            name_offsets=name_offsets,
+            lengths=np.concatenate([self.lengths, added.lengths])[sources],
+            gram_counts=np.concatenate([self.gram_counts, added.gram_counts])[sources],
+            sorted_name_rows=sorted_name_rows.astype(np.int32),
+            token_buffer=token_buffer,
+            token_offsets=token_offsets,
+            token_rows=token_rows.astype(np.int32),
+            gram_codes=gram_codes[present],
+            posting_offsets=posting_offsets,
+            postings=postings,
+        )
+        # Key terurut sudah ada dari merge: update berikutnya tidak perlu menghitungnya ulang
+        object.__setattr__(merged, '_sorted_name_keys', sorted_name_keys)
+        object.__setattr__(merged, '_sorted_token_keys', token_keys)
+        return merged
+
+    def find_exact(self, queries):
+        """Rentang (lo, hi) di sorted_name_rows untuk nama ter-normalisasi yang sama persis dengan
+        tiap query ter-normalisasi; satu searchsorted untuk semua query"""
+        keys = self._sorted_name_keys
+        encoded = [query.encode('utf-8') for query in queries]
+        wanted = np.array(encoded, dtype=keys.dtype)
+        lo = np.searchsorted(keys, wanted, side='left')
+        hi = np.searchsorted(keys, wanted, side='right')
+        # Query lebih panjang dari nama terpanjang terpotong di array S; pasti tidak ada
+        too_long = np.array([len(value) > keys.itemsize for value in encoded], dtype=bool)
+        hi[too_long] = lo[too_long]
+        return lo, hi
+
+    def to_artifact(self, writer, prefix):
+        for field in self.ARRAY_FIELDS:
+            writer.add(f'{prefix}/{field}', getattr(self, field))
+        return {'version': NAME_INDEX_VERSION}
+
+    @classmethod
+    def from_artifact(cls, reader, prefix):
+        return cls(**{field: reader.array(f'{prefix}/{field}') for field in cls.ARRAY_FIELDS})
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def normalized(self, rows):
+        """Nama ter-normalisasi untuk posisi baris rows (satu decode per nama, tanpa salinan buffer)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        data = memoryview(self.name_buffer)
+        return [str(data[start:end], 'utf-8')
+                for start, end in zip(self.name_offsets[rows].tolist(), self.name_offsets[rows + 1].tolist())]
+
+    @cached_property
+    def _length_span(self):
+        return int(self.lengths.max(initial=0)) + 1
+
+    @cached_property
+    def _sorted_name_keys(self):
+        """Nama ter-normalisasi terurut sebagai array bytes lebar tetap (find_exact, merged)"""
+        return _fixed_width(self.name_buffer, self.name_offsets, self.sorted_name_rows)
+
+    @cached_property
+    def _sorted_token_keys(self):
+        return _fixed_width(self.token_buffer, self.token_offsets, np.arange(len(self.token_rows)))
+
+    @property
+    def _sorted_names(self):
+        return _Utf8Strings(self.name_buffer, self.name_offsets, self.sorted_name_rows)
+
+    @property
+    def _sorted_tokens(self):
+        return _Utf8Strings(self.token_buffer, self.token_offsets)
+
+    def _postings(self, grams):
+        """Posting tiap trigram di grams (None untuk trigram yang tidak ada di katalog)"""
+        codes = np.array([_trigram_code(gram) for gram in grams], dtype=np.int64)
+        gram_ids = np.searchsorted(self.gram_codes, codes)
+        found = gram_ids < len(self.gram_codes)
+        found[found] = self.gram_codes[gram_ids[found]] == codes[found]
+        starts, ends = self.posting_offsets[gram_ids[found]].tolist(), self.posting_offsets[gram_ids[found] + 1].tolist()
+        bounds = iter(zip(starts, ends))
+        return [self.postings[slice(*next(bounds))] if ok else None for ok in found.tolist()]
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + '\U0010ffff')
+
+    def _substring_rows(self, query):
+        """Baris yang nama ter-normalisasinya mengandung query"""
+        if len(query) < 3:
+            # Terlalu pendek untuk trigram: cocokkan awal kata
+            lo, hi = self._prefix_range(self._sorted_tokens, query)
+            return np.unique(self.token_rows[lo:hi])
+        postings = self._postings({query[i:i + 3] for i in range(len(query) - 2)})
+        if any(posting is None for posting in postings):
+            return np.empty(0, dtype=np.int32)
+        if len(query) == 3:
+            return postings[0]  # satu trigram = query itu sendiri
+        postings.sort(key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            if len(rows) <= NAME_VERIFY_BELOW:
+                break  # kandidat tinggal sedikit: lebih murah dicek langsung di bawah
+            found = np.searchsorted(posting, rows)
+            found[found == len(posting)] = 0
+            rows = rows[posting[found] == rows]
+        # Trigram lengkap belum menjamin urutan (mis. 'ana' + 'nas' di nama berbeda posisi)
+        return rows[np.array([query in name for name in self.normalized(rows)], dtype=bool)].astype(np.int32)
+
+    def similarity(self, query, rows):
+        """Koefisien Dice trigram antara query ter-normalisasi dan nama di rows"""
+        grams = _name_trigrams(query)
+        shared = [len(grams & _name_trigrams(name)) for name in self.normalized(rows)]
+        return 2.0 * np.array(shared, dtype=np.float64) / (len(grams) + self.gram_counts[rows])
+
+    def _fuzzy_rows(self, query):
+        """(baris, Dice) untuk nama yang berbagi cukup banyak trigram dengan query.
+
+        Minimal trigram sama: NAME_FUZZY_MIN_SHARED dari trigram query, dan untuk query panjang
+        semua kecuali yang bisa hilang karena NAME_FUZZY_MAX_EDITS typo.
+        """
+        grams = _name_trigrams(query)
+        postings = sorted((p for p in self._postings(grams) if p is not None), key=len)
+        need = max(1, math.ceil(NAME_FUZZY_MIN_SHARED * len(grams)), len(grams) - 3 * NAME_FUZZY_MAX_EDITS)
+        # Baris dengan >= need trigram sama pasti muncul di salah satu (len(postings) - need + 1)
+        # posting terpendek; posting sisanya (trigram umum) hanya di-probe untuk kandidat yang
+        # masih mungkin lolos
+        probe = len(postings) - need + 1
+        if probe <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        candidates, shared = np.unique(np.concatenate(postings[:probe]), return_counts=True)
+        remaining = len(postings) - probe
+        for posting in postings[probe:]:
+            alive = shared + remaining >= need
+            candidates, shared = candidates[alive], shared[alive]
+            found = np.searchsorted(posting, candidates)
+            found[found == len(posting)] = 0
+            shared += posting[found] == candidates
+            remaining -= 1
+        keep = shared >= need
+        candidates, shared = candidates[keep], shared[keep]
+        return candidates, 2.0 * shared / (len(grams) + self.gram_counts[candidates])
+
+    def search(self, query, limit=10, offset=0, fuzzy=True):
+        """Cari nama; hasil (posisi baris, jenis match, similarity, total) terurut dari yang terbaik.
+
+        Peringkat: exact > prefix nama > substring, nama terpendek dulu. Hasil fuzzy (similarity
+        trigram tertinggi dulu) hanya dicari jika tidak ada hasil exact/prefix/substring sama
+        sekali, mis. query dengan typo. limit=None = semua hasil.
+        """
+        query = normalize_name(query)
+        if not query:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int8), np.empty(0), 0
+        wanted = None if limit is None else offset + limit
+
+        # exact ⊂ prefix nama ⊂ substring: cukup tandai jenis match di hasil substring
+        rows = self._substring_rows(query)
+        total = len(rows)
+        lo, hi = self._prefix_range(self._sorted_names, query)
+        exact_count = bisect_left(self._sorted_names, query + '\0', lo, hi) - lo
+        prefix_rows = self.sorted_name_rows[lo:hi]
+        if wanted is not None and len(prefix_rows) >= wanted:
+            # Halaman ini seluruhnya terisi prefix/exact (query pendek/umum): substring tak perlu diurutkan
+            rows = prefix_rows
+            kinds = np.full(len(rows), 2, dtype=np.int8)
+            kinds[:exact_count] = 3
+        else:
+            kinds = np.ones(len(rows), dtype=np.int8)
+            kinds[np.searchsorted(rows, prefix_rows)] = 2
+            kinds[np.searchsorted(rows, prefix_rows[:exact_count])] = 3
+        use_fuzzy = fuzzy and total == 0
+        k = total if wanted is None or use_fuzzy else min(total, wanted)
+        # Satu key utama (jenis match, lalu panjang) agar partisi top_k_order efektif walau jenisnya seri
+        rank = (len(NAME_MATCH_KINDS) - kinds).astype(np.int64) * self._length_span + self.lengths[rows]
+        top = top_k_order((rows, rank), k)
+        rows, kinds = rows[top], kinds[top]
+
+        if use_fuzzy:
+            fuzzy_rows, fuzzy_sim = self._fuzzy_rows(query)
+            fresh = ~np.isin(fuzzy_rows, rows)
+            fuzzy_rows, fuzzy_sim = fuzzy_rows[fresh], fuzzy_sim[fresh]
+            order = np.lexsort((fuzzy_rows, self.lengths[fuzzy_rows], -fuzzy_sim))
+            rows = np.concatenate([rows, fuzzy_rows[order]])
+            kinds = np.concatenate([kinds, np.zeros(len(order), dtype=np.int8)])
+            total += len(order)
+
+        rows, kinds = rows[offset:wanted], kinds[offset:wanted]
+        return rows, kinds, self.similarity(query, rows), total
+
+RESULT_TABLE_TOP_K = 10  # get_food_similarity selalu memotong hasil ke 10 teratas
+RESULT_CACHE_SIZE = int(os.getenv('NUTRIMOOD_RESULT_CACHE_SIZE', '1024'))
+RANKING_CACHE_SIZE = int(os.getenv('NUTRIMOOD_RANKING_CACHE_SIZE', '32'))  # urutan lengkap untuk pagination
+
+class LRUCache:
+    """LRU cache berukuran tetap dengan penghitung hit/miss"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def replace(self, key, fn):
+        """Ganti nilai key dengan fn(nilai lama) secara atomik, tanpa mengubah urutan LRU maupun
+        hit/miss; nilai baru, atau None jika key tidak ada"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            value = self._data[key] = fn(self._data[key])
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def values(self):
+        """Salinan semua nilai (tanpa mengubah urutan LRU maupun hit/miss)"""
+        with self._lock:
+            return list(self._data.values())
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+@dataclass(frozen=True)
+class SimilarityQuery:
+    """User profile yang sudah diproses terhadap satu partisi mood"""
+    target_mood: str
+    partition: Optional[MoodPartition]  # None jika tidak ada fitur yang cocok
+    row_ids: np.ndarray
+    selected: Tuple[int, ...]
+    user_scaled: Optional[np.ndarray]
+    weights: Optional[np.ndarray]
+    health_conditions: List[str]
+
+# Aturan kondisi kesehatan di luar health_mapping model (health_mapping berisi constraint profil).
+# Nutrisi prioritas -> (fitur yang bobotnya dikali, faktor)
+HEALTH_PRIORITY_WEIGHTS = {
+    'calories': ('calorie_category_num', 2.0),
+    'carbohydrate': ('carb_category_num', 2.0),
+    'fat': ('fat_category_num', 2.0),
+    'proteins': ('protein_category_num', 1.5),
+}
+# Kondisi -> ((kolom, ambang, penalty), ...): skor makanan dengan kolom >= ambang dikurangi penalty
+HEALTH_PENALTIES = {
+    'diabetes': (('carb_category_num', 3, 0.1),),      # karbohidrat tinggi
+    'hipertensi': (('fat_category_num', 3, 0.1),),     # lemak tinggi
+    'kolesterol': (('fat_category_num', 3, 0.15),),    # lemak tinggi
+    'obesitas': (('calorie_category_num', 3, 0.1),),   # kalori tinggi
+}
+HEALTH_CONDITION_DESCRIPTIONS = {
+    "diabetes": "Kondisi diabetes mellitus",
+    "hipertensi": "Tekanan darah tinggi",
+    "kolesterol": "Kolesterol tinggi",
+    "obesitas": "Kelebihan berat badan",
+    "alergi_gluten": "Alergi terhadap gluten",
+    "vegetarian": "Diet vegetarian",
+}
+HEALTH_RULES_PATH = os.getenv('NUTRIMOOD_HEALTH_RULES_PATH')  # JSON kondisi tambahan/override; kosong = bawaan
+HEALTH_PROFILE_CACHE_SIZE = 4096  # kombinasi kondisi yang constraint gabungannya disimpan
+
+def load_health_rules(path):
+    """Kondisi dari file JSON {"conditions": {nama: {description, constraints, priority_nutrients,
+    penalties: [{column, min, penalty}]}}}; {} jika path kosong. ValueError jika tidak valid"""
+    if not path:
+        return {}
+    with open(path) as f:
+        conditions = json.load(f).get('conditions', {})
+    fields = {'description', 'constraints', 'priority_nutrients', 'penalties'}
+    for condition, rule in conditions.items():
+        unknown = set(rule) - fields
+        if unknown:
+            raise ValueError(f"Field {sorted(unknown)} tidak dikenal untuk kondisi '{condition}'")
+        if not isinstance(rule.get('constraints', {}), dict):
+            raise ValueError(f"constraints kondisi '{condition}' harus berupa object")
+        nutrients = [n for n in rule.get('priority_nutrients', []) if n not in HEALTH_PRIORITY_WEIGHTS]
+        if nutrients:
+            raise ValueError(f"priority_nutrients {nutrients} tidak dikenal untuk kondisi '{condition}' "
+                             f"(pilih {', '.join(HEALTH_PRIORITY_WEIGHTS)})")
+        for penalty in rule.get('penalties', []):
+            if set(penalty) != {'column', 'min', 'penalty'} or not isinstance(penalty['column'], str) \
+                    or not all(isinstance(penalty[key], (int, float)) for key in ('min', 'penalty')):
+                raise ValueError(f"Penalty kondisi '{condition}' harus berupa {{column, min, penalty}}: {penalty}")
+            if penalty['column'] not in SIMILARITY_FEATURES:
+                raise ValueError(f"Kolom penalty '{penalty['column']}' kondisi '{condition}' bukan fitur similarity "
+                                 f"(pilih {', '.join(SIMILARITY_FEATURES)})")
+    return conditions
+
+HEALTH_RULES = load_health_rules(HEALTH_RULES_PATH)
+
+class HealthRules:
+    """Tabel aturan kondisi kesehatan yang dikompilasi sekali per model.
+
+    Constraint profil dan priority_nutrients berasal dari health_mapping model, penalty dari
+    HEALTH_PENALTIES; config (NUTRIMOOD_HEALTH_RULES_PATH) bisa mengganti keduanya atau
+    menambah kondisi baru. Faktor bobot per fitur dan mask penalty per partisi mood disiapkan
+    sekali, jadi satu set kondisi cukup beberapa operasi vektor. Urutan kondisi dan duplikat
+    tetap berpengaruh seperti sebelumnya (min pertama, perkalian dan penjumlahan berurutan).
+    """
+    def __init__(self, health_mapping, config=None):
+        self.constraints, self.priority_nutrients = {}, {}
+        for condition, mapping in health_mapping.items():
+            self.constraints[condition] = {key: value for key, value in mapping.items() if key != 'priority_nutrients'}
+            self.priority_nutrients[condition] = tuple(mapping.get('priority_nutrients', ()))
+        self.penalties = dict(HEALTH_PENALTIES)
+        for condition, rule in (config or {}).items():
+            self.constraints[condition] = dict(rule.get('constraints', self.constraints.get(condition, {})))
+            self.priority_nutrients[condition] = tuple(rule.get('priority_nutrients',
+                                                                self.priority_nutrients.get(condition, ())))
+            if 'penalties' in rule:
+                self.penalties[condition] = tuple((p['column'], p['min'], p['penalty']) for p in rule['penalties'])
+        self.conditions = tuple(sorted(self.constraints))  # domain kanonik tabel hasil
+        self.fingerprint = hashlib.blake2b(json.dumps(
+            [self.constraints, self.priority_nutrients, self.penalties, HEALTH_PRIORITY_WEIGHTS],
+            sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
+        self._profile_cache = {}
+        self._weight_factors = {}   # feature_cols -> (bobot dasar, {kondisi: faktor per fitur})
+        self._partition_masks = {}  # mood -> (partisi, {(kolom, ambang): mask})
+
+    def profile_constraints(self, conditions):
+        """Constraint profil gabungan; untuk fitur yang sama dipakai nilai paling ketat (min)"""
+        key = tuple(conditions)
+        aggregated = self._profile_cache.get(key)
+        if aggregated is None:
+            aggregated = {}
+            for condition in key:
+                for feature, value in self.constraints.get(condition, {}).items():
+                    aggregated[feature] = min(aggregated[feature], value) if feature in aggregated else value
+            if len(self._profile_cache) < HEALTH_PROFILE_CACHE_SIZE:
+                self._profile_cache[key] = aggregated
+        return aggregated
+
+    def feature_weights(self, feature_cols, conditions):
+        """Bobot fitur (rata-rata 1): fitur mood x2, fitur nutrisi prioritas tiap kondisi x faktornya"""
+        feature_cols = tuple(feature_cols)
+        compiled = self._weight_factors.get(feature_cols)
+        if compiled is None:
+            priority = {feature: (nutrient, factor) for nutrient, (feature, factor) in HEALTH_PRIORITY_WEIGHTS.items()}
+            factors = {}
+            for condition, nutrients in self.priority_nutrients.items():
+                factor = np.array([priority[f][1] if f in priority and priority[f][0] in nutrients else 1.0
+                                   for f in feature_cols])
+                if (factor != 1.0).any():
+                    factors[condition] = factor
+            base = np.array([2.0 if 'mood_' in feature else 1.0 for feature in feature_cols])
+            compiled = self._weight_factors[feature_cols] = (base, factors)
+        weights, factors = compiled
+        for condition in conditions:
+            factor = factors.get(condition)
+            if factor is not None:
+                weights = weights * factor
+        return weights / np.sum(weights) * len(weights)
+
+    def check_columns(self, partition):
+        """ValueError jika kolom penalty tidak ada di fitur partisi (penalize akan gagal dan setiap
+        request dengan kondisi itu jatuh ke ultimate fallback)"""
+        missing = sorted({(condition, column) for condition, rules in self.penalties.items()
+                          for column, _, _ in rules if column not in partition.feature_cols})
+        if missing:
+            raise ValueError(f"Kolom penalty tidak ada di fitur partisi mood {partition.mood}: "
+                             + ", ".join(f"{condition}.{column}" for condition, column in missing))
+
+    def partition_masks(self, partition):
+        """Mask (kolom >= ambang) semua penalty untuk satu partisi mood, disiapkan sekali"""
+        cached = self._partition_masks.get(partition.mood)
+        if cached is not None and cached[0] is partition:
+            return cached[1]
+        masks = {}
+        for rules in self.penalties.values():
+            for column, threshold, _ in rules:
+                if column in partition.feature_cols and (column, threshold) not in masks:
+                    masks[(column, threshold)] = partition.column(column) >= threshold
+        self._partition_masks[partition.mood] = (partition, masks)
+        return masks
+
+    def penalize(self, partition, similarities, conditions, masks=None):
+        """similarities dikurangi penalty semua kondisi; masks: hasil partition_masks(partition)"""
+        penalties = np.zeros(len(similarities))
+        for condition in conditions:
+            for column, threshold, amount in self.penalties.get(condition, ()):
+                mask = masks.get((column, threshold)) if masks is not None else None
+                if mask is None:
+                    mask = partition.column(column) >= threshold
+                np.add(penalties, amount, out=penalties, where=mask)
+        return similarities - penalties
+
+    def allowed(self, partition, conditions, positions):
+        """Mask posisi partisi yang tidak terkena penalty satu pun kondisi"""
+        allowed = np.ones(len(positions), dtype=bool)
+        for condition in conditions:
+            for column, threshold, amount in self.penalties.get(condition, ()):
+                if amount > 0 and column in partition.feature_cols:
+                    allowed &= partition.column(column)[positions] < threshold
+        return allowed
+
+# Artifact model: manifest.json + array .npy (bisa di-mmap dan dibagi antar worker lewat page cache)
+ARTIFACT_FORMAT = 'nutrimood-food-recommender'
+ARTIFACT_VERSION = 1
+ARTIFACT_PATH = os.getenv('NUTRIMOOD_ARTIFACT_PATH', 'models/food_recommender')
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class _ArtifactWriter:
+    """Tulis array ke <root>/<name>.npy dan catat dtype, shape serta checksum-nya"""
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+
+    def add(self, name, array):
+        array = np.ascontiguousarray(array)
+        path = os.path.join(self.root, name + '.npy')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, array, allow_pickle=False)
+        self.files[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'sha256': _sha256(path)}
+
+class _ArtifactReader:
+    """Baca array artifact (read-only, mmap jika diminta) dan cek checksum/dtype/shape"""
+    def __init__(self, root, files, mmap=True, verify=True):
+        self.root = root
+        self.files = files
+        self.mmap = mmap
+        self.verify = verify
+
+    def array(self, name):
+        entry = self.files[name]
+        path = os.path.join(self.root, name + '.npy')
+        if self.verify and _sha256(path) != entry['sha256']:
+            raise ValueError(f"Checksum artifact tidak cocok: {name}")
+        # File berisi array kosong tidak bisa di-mmap
+        mmap_mode = 'r' if self.mmap and int(np.prod(entry['shape'])) > 0 else None
+        array = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != entry['dtype'] or list(array.shape) != entry['shape']:
+            raise ValueError(f"Array artifact {name} tidak sesuai manifest")
+        if mmap_mode is None:
+            array.setflags(write=False)
+        return array
+
+def _index_to_artifact(writer, index):
+    if isinstance(index, pd.RangeIndex):
+        return {'type': 'range', 'start': index.start, 'stop': index.stop, 'step': index.step}
+    if index.dtype.kind in 'iu':
+        writer.add('index', index.to_numpy())
+        return {'type': 'array'}
+    raise ValueError(f"Tipe index {type(index).__name__} ({index.dtype}) tidak didukung artifact")
+
+def _index_from_artifact(reader, meta):
+    if meta['type'] == 'range':
+        return pd.RangeIndex(meta['start'], meta['stop'], meta['step'])
+    return pd.Index(reader.array('index'))
+
+def _frame_to_artifact(writer, df):
+    """Simpan kolom food_df (numerik, bool, string) agar bisa dibangun ulang untuk endpoint debug"""
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        key = f'frame/{i}'
+        if values.dtype.kind in 'biuf':
+            writer.add(key, values.to_numpy())
+            kind = 'array'
+        elif values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+            buffer, offsets, null = _encode_strings(values)
+            writer.add(f'{key}/buffer', buffer)
+            writer.add(f'{key}/offsets', offsets)
+            writer.add(f'{key}/null', null)
+            kind = 'strings'
+        else:
+            raise ValueError(f"Kolom '{column}' ({values.dtype}) tidak didukung artifact")
+        columns.append({'name': column, 'key': key, 'kind': kind})
+    return {'columns': columns}
+
+def _frame_from_artifact(reader, meta, index):
+    columns = {}
+    for entry in meta['columns']:
+        key = entry['key']
+        if entry['kind'] == 'strings':
+            columns[entry['name']] = _decode_strings(
+                reader.array(f'{key}/buffer'), reader.array(f'{key}/offsets'), reader.array(f'{key}/null')
+            )
+        else:
+            columns[entry['name']] = np.array(reader.array(key))
+    return pd.DataFrame(columns, index=index)
+
+def _updated_frame(base, sources, added):
+    """food_df setelah update katalog: baris sources dari gabungan base (DataFrame, atau loader-nya)
+    dan added, dengan index baru 0..n-1"""
+    if callable(base):
+        base = base()
+    frame = pd.concat([base.reset_index(drop=True), added.reset_index(drop=True)], ignore_index=True)
+    return frame.iloc[sources].reset_index(drop=True)
+
+# Klasifikasi mood dari kategori nutrisi (mood_classifier_model.keras tanpa TensorFlow)
+MOOD_CLASSIFIER_FORMAT = 'nutrimood-mood-classifier'
+MOOD_CLASSIFIER_VERSION = 1
+MOOD_CLASSIFIER_PATH = os.getenv('NUTRIMOOD_MOOD_CLASSIFIER_PATH', 'models/mood_classifier.npz')
+MOOD_CLASSIFIER_FEATURES = ('calorie_category', 'protein_category', 'fat_category', 'carb_category')
+MOOD_CATEGORY_MAPPING = {'very_low': 0, 'low': 1, 'medium': 2, 'high': 3, 'very_high': 4}
+MOOD_CATEGORY_DEFAULT = 1  # 'low', sama seperti predict_mood_from_health_data di notebook
+# nutrient_balance -> nutrient_balance_num seperti preprocessing notebook (untuk makanan baru lewat /admin/foods)
+NUTRIENT_BALANCE_MAPPING = {'other': 0.0, 'high_carb': 0.25, 'high_fat': 0.5, 'high_protein': 0.75, 'balanced': 1.0}
+
+def encode_mood_features(values):
+    """Kategori (string atau 0-4, None = default) -> vektor fitur classifier"""
+    encoded = []
+    for feature, value in zip(MOOD_CLASSIFIER_FEATURES, values):
+        if value is None:
+            value = MOOD_CATEGORY_DEFAULT
+        elif isinstance(value, str):
+            if value.lower() not in MOOD_CATEGORY_MAPPING:
+                raise ValueError(f"{feature} tidak valid. Pilih salah satu: {list(MOOD_CATEGORY_MAPPING)}")
+            value = MOOD_CATEGORY_MAPPING[value.lower()]
+        elif isinstance(value, bool) or value not in MOOD_CATEGORY_MAPPING.values():
+            raise ValueError(f"{feature} harus berupa kategori atau angka 0-4")
+        encoded.append(value)
+    return encoded
+
+@dataclass(frozen=True)
+class MoodClassifier:
+    """Forward pass NumPy dari mood classifier Keras (bobot hasil export_mood_model.py).
+
+    StandardScaler dan BatchNormalization sudah dilipat ke bobot Dense saat export,
+    sehingga inferensi hanya Dense(relu) berantai lalu softmax.
+    """
+    weights: Tuple[np.ndarray, ...]   # float32 (in, out) per layer Dense
+    biases: Tuple[np.ndarray, ...]
+    labels: Tuple[str, ...]           # indeks output -> primary_mood
+
+    def predict_proba(self, features):
+        """(n, 4) kategori numerik -> (n, jumlah mood) probabilitas"""
+        hidden = np.asarray(features, dtype=np.float32).reshape(-1, self.weights[0].shape[0])
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            hidden = hidden @ weight
+            hidden += bias
+            np.maximum(hidden, 0, out=hidden)
+        logits = hidden @ self.weights[-1]
+        logits += self.biases[-1]
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def predict(self, features):
+        """Label mood dengan probabilitas tertinggi"""
+        return [self.labels[i] for i in self.predict_proba(features).argmax(axis=1)]
+
+    def save(self, path):
+        arrays = {f'weight_{i}': w for i, w in enumerate(self.weights)}
+        arrays.update({f'bias_{i}': b for i, b in enumerate(self.biases)})
+        np.savez(
+            path,
+            format=np.array(MOOD_CLASSIFIER_FORMAT),
+            version=np.array(MOOD_CLASSIFIER_VERSION),
+            features=np.array(MOOD_CLASSIFIER_FEATURES),
+            labels=np.array(self.labels),
+            **arrays
+        )
+
+    @classmethod
+    def load(cls, path=MOOD_CLASSIFIER_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['format']) != MOOD_CLASSIFIER_FORMAT:
+                raise ValueError(f"{path} bukan {MOOD_CLASSIFIER_FORMAT}")
+            if int(data['version']) != MOOD_CLASSIFIER_VERSION:
+                raise ValueError(f"Versi mood classifier {int(data['version'])} tidak didukung "
+                                 f"(butuh {MOOD_CLASSIFIER_VERSION})")
+            if tuple(data['features']) != MOOD_CLASSIFIER_FEATURES:
+                raise ValueError(f"Fitur mood classifier {list(data['features'])} tidak sesuai")
+            layers = sum(1 for name in data.files if name.startswith('weight_'))
+            weights = tuple(np.ascontiguousarray(data[f'weight_{i}'], dtype=np.float32) for i in range(layers))
+            biases = tuple(np.ascontiguousarray(data[f'bias_{i}'], dtype=np.float32) for i in range(layers))
+            labels = tuple(str(label) for label in data['labels'])
+        for array in weights + biases:
+            array.setflags(write=False)
+        return cls(weights=weights, biases=biases, labels=labels)
+
 # FoodRecommender class
 class FoodRecommender:
     def __init__(self):
@@ -101,13 +2383,275 @@ class FoodRecommender:
             'balanced': 1,
             'unbalanced': 0
         }
+        self._init_runtime_state()
+
+    # Atribut runtime (indeks dan cache) tidak ikut di-pickle
+    _RUNTIME_ATTRS = ('_food_df_loader', '_mood_index', '_mood_index_source', '_catalog', '_result_table',
+                      '_result_table_enabled', '_result_table_lock', '_result_table_hits', '_result_table_misses',
+                      '_result_table_counter_lock',
+                      '_result_cache', '_name_index', '_ranking_cache', '_catalog_fingerprint',
+                      '_search_mode', '_feature_indexes', '_frame_schema', '_name_index_merge', '_health_rules',
+                      '_nutrient_index', '_neighbour_lists', '_neighbour_merges',
+                      '_neighbour_spaces', '_preference_center')
+
+    @property
+    def food_df(self):
+        """DataFrame makanan; untuk model dari artifact baru dibangun saat pertama dibutuhkan"""
+        if self._food_df is None and self._food_df_loader is not None:
+            frame = self._food_df_loader()
+            # Data sama dengan katalog/indeks dari artifact, jadi indeks tidak perlu dibangun ulang
+            self._food_df = self._mood_index_source = frame
+            self._food_df_loader = None
+        return self._food_df
+
+    @food_df.setter
+    def food_df(self, value):
+        self._food_df = value
+        self._food_df_loader = None
+
+    def is_loaded(self):
+        """True jika dataset tersedia (tanpa memaksa food_df dari artifact dibangun)"""
+        return self._food_df is not None or self._food_df_loader is not None
+
+    def _init_runtime_state(self):
+        self._food_df_loader = None
+        self._mood_index = None
+        self._mood_index_source = None
+        self._catalog = None
+        self._result_table = None
+        self._result_table_enabled = False
+        self._result_table_lock = threading.Lock()
+        self._result_table_hits = 0
+        self._result_table_misses = 0
+        # Penghitung hit/miss dari thread executor; bukan _result_table_lock yang ditahan selama build
+        self._result_table_counter_lock = threading.Lock()
+        self._result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self._name_index = None
+        self._name_index_merge = None  # apply_updates: indeks nama digabung saat pertama dibutuhkan
+        self._ranking_cache = LRUCache(RANKING_CACHE_SIZE)
+        self._catalog_fingerprint = None
+        self._search_mode = 'exact'
+        self._feature_indexes = {}
+        self._frame_schema = None
+        self._health_rules = None
+        self._nutrient_index = None
+        self._neighbour_lists = {}   # mood -> NeighbourLists
+        self._neighbour_merges = {}  # apply_updates: mood -> penggabungan daftar lama, saat pertama dibutuhkan
+        self._neighbour_spaces = {}  # mood -> (partisi, _NeighbourSpace, pool) untuk query di luar daftar
+        self._preference_center = None  # rata-rata katalog PREFERENCE_NUTRIENTS untuk personalisasi
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._RUNTIME_ATTRS:
+            state.pop(attr, None)
+        # Format pickle lama: DataFrame disimpan sebagai 'food_df'
+        state.pop('_food_df', None)
+        state['food_df'] = self.food_df
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        food_df = state.pop('food_df', None)
+        self.__dict__.update(state)
+        self._init_runtime_state()
+        self.food_df = food_df
+        if food_df is not None:
+            self._build_mood_index()
+
+    def save_artifact(self, path, include_result_table=True):
+        """Simpan model sebagai artifact berversi: manifest.json (mapping, metadata, checksum)
+        dan array .npy untuk katalog, indeks mood, indeks nama, tabel hasil serta kolom food_df.
+
+        Ditulis ke direktori sementara lalu di-rename, jadi pembaca tidak pernah melihat
+        artifact setengah jadi.
+        """
+        self._ensure_mood_index()
+        if self._catalog is None:
+            raise ValueError("Katalog belum tersedia, artifact tidak bisa dibuat")
+        if include_result_table and self._result_table is None:
+            self.build_result_table()
+
+        # Mapping dan atribut lain harus bisa bolak-balik lewat JSON tanpa berubah
+        state = {key: value for key, value in self.__getstate__().items() if key != 'food_df'}
+        try:
+            if json.loads(json.dumps(state)) != state:
+                raise ValueError("state berubah setelah round-trip JSON")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"State FoodRecommender tidak bisa disimpan ke artifact: {e}") from e
+
+        path = os.path.normpath(path)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        writer = _ArtifactWriter(tmp_path)
+
+        manifest = {
+            'format': ARTIFACT_FORMAT,
+            'version': ARTIFACT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'state': state,
+            'index': _index_to_artifact(writer, self._catalog.index),
+            'catalog': self._catalog.to_artifact(writer, 'catalog'),
+            'partitions': {
+                mood: partition.to_artifact(writer, f'partitions/{mood}')
+                for mood, partition in self._mood_index.items()
+            },
+            'frame': _frame_to_artifact(writer, self.food_df),
+            # Dibangun sekali di sini; setiap worker cukup mmap (lihat NUTRIMOOD_PRELOAD di README)
+            'name_index': self.name_index().to_artifact(writer, 'name_index'),
+            'neighbours': {'size': NEIGHBOUR_LIST_SIZE, 'moods': list(self._mood_index)},
+            'result_table': None,
+        }
+        for mood in self._mood_index:
+            self.neighbour_lists(mood).to_artifact(writer, f'neighbours/{mood}')
+
+        if include_result_table and self._result_table is not None:
+            profiles = sorted(self._result_table.items(), key=lambda item: (item[0][0], sorted(item[0][1])))
+            ids = np.full((len(profiles), RESULT_TABLE_TOP_K), -1, dtype=np.int64)
+            scores = np.zeros((len(profiles), RESULT_TABLE_TOP_K), dtype=np.float64)
+            lengths = np.zeros(len(profiles), dtype=np.int64)
+            for i, (_, (row_ids, row_scores, _)) in enumerate(profiles):
+                lengths[i] = len(row_ids)
+                ids[i, :len(row_ids)] = row_ids
+                scores[i, :len(row_ids)] = row_scores
+            writer.add('result_table/ids', ids)
+            writer.add('result_table/scores', scores)
+            writer.add('result_table/lengths', lengths)
+            manifest['result_table'] = {
+                'top_k': RESULT_TABLE_TOP_K,
+                'health_rules': self.health_rules().fingerprint,  # tabel hanya berlaku untuk aturan yang sama
+                'profiles': [[mood, sorted(conditions), fallback] for (mood, conditions), (_, _, fallback) in profiles],
+            }
+
+        manifest['files'] = writer.files
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        # Ganti artifact lama (jika ada) dengan yang baru
+        old_path = path + '.old'
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info("Artifact v%d disimpan ke %s (%d file)", ARTIFACT_VERSION, path, len(writer.files))
+        return manifest
+
+    @classmethod
+    def load_artifact(cls, path, mmap=True, verify=True, load_result_table=True):
+        """Muat model dari artifact save_artifact(); array di-mmap read-only.
+
+        food_df tidak dibangun sampai dibutuhkan (endpoint debug); serving hanya memakai
+        katalog, indeks mood dan tabel hasil.
+        """
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"{path} bukan artifact {ARTIFACT_FORMAT}")
+        if manifest.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Versi artifact {manifest.get('version')} tidak didukung (butuh {ARTIFACT_VERSION})")
+
+        reader = _ArtifactReader(path, manifest['files'], mmap=mmap, verify=verify)
+        recommender = cls.__new__(cls)
+        recommender.__dict__.update(manifest['state'])
+        recommender._init_runtime_state()
+        recommender._food_df = None
+
+        index = _index_from_artifact(reader, manifest['index'])
+        recommender._catalog = FoodCatalog.from_artifact(reader, 'catalog', manifest['catalog'], index)
+        recommender._mood_index = MappingProxyType({
+            mood: MoodPartition.from_artifact(reader, f'partitions/{mood}', meta, mood)
+            for mood, meta in manifest['partitions'].items()
+        })
+        recommender._food_df_loader = partial(_frame_from_artifact, reader, manifest['frame'], index)
+        recommender._frame_schema = tuple(
+            (entry['name'], np.dtype(object) if entry['kind'] == 'strings' else np.dtype(manifest['files'][entry['key']]['dtype']))
+            for entry in manifest['frame']['columns']
+        )
+
+        name_meta = manifest.get('name_index')  # artifact lama: indeks nama dibangun saat dibutuhkan
+        if name_meta is not None and name_meta['version'] == NAME_INDEX_VERSION:
+            recommender._name_index = FoodNameIndex.from_artifact(reader, 'name_index')
+
+        neighbour_meta = manifest.get('neighbours')  # artifact lama atau ukuran lain: dibangun saat dibutuhkan
+        if neighbour_meta is not None and neighbour_meta['size'] == NEIGHBOUR_LIST_SIZE:
+            recommender._neighbour_lists = {mood: NeighbourLists.from_artifact(reader, f'neighbours/{mood}', mood)
+                                            for mood in neighbour_meta['moods']}
+
+        table_meta = manifest['result_table']
+        if table_meta is not None:
+            # Artifact lama tanpa fingerprint dibangun dengan aturan bawaan
+            rules = table_meta.get('health_rules', HealthRules(recommender.health_mapping).fingerprint)
+            if rules != recommender.health_rules().fingerprint:
+                logger.warning("Aturan kondisi kesehatan berubah sejak artifact dibuat, tabel hasil dibangun ulang")
+                table_meta = None
+        if load_result_table and table_meta is not None and table_meta['top_k'] == RESULT_TABLE_TOP_K:
+            ids = reader.array('result_table/ids')
+            scores = reader.array('result_table/scores')
+            lengths = reader.array('result_table/lengths')
+            recommender._result_table = {
+                (mood, frozenset(conditions)): (ids[i, :lengths[i]], scores[i, :lengths[i]], fallback)
+                for i, (mood, conditions, fallback) in enumerate(table_meta['profiles'])
+            }
+            recommender._result_table_enabled = True
+
+        logger.info("Artifact v%d dimuat dari %s: %d makanan", manifest['version'], path, len(recommender._catalog))
+        return recommender
 
     def load_data(self, food_data_path):
         """Memuat dataset makanan"""
         self.food_df = pd.read_csv(food_data_path)
-        print(f"Data makanan dimuat: {self.food_df.shape[0]} item")
+        logger.info("Data makanan dimuat: %d item", self.food_df.shape[0])
+        self._build_mood_index()
         return self.food_df
 
+    def _build_mood_index(self):
+        """Bangun indeks fitur ternormalisasi per mood dari food_df"""
+        df = self.food_df
+
+        index = {}
+        for mood, (column, value) in MOOD_FILTERS.items():
+            if column not in df.columns:
+                # Partisi tidak tersedia; get_food_similarity akan gagal dan memakai ultimate fallback
+                continue
+            row_ids = np.flatnonzero((df[column] == value).to_numpy())
+            if len(row_ids) == 0:
+                # Tidak ada makanan untuk mood ini, pakai semua makanan
+                row_ids = np.arange(len(df))
+            index[mood] = MoodPartition.build(mood, df, row_ids)
+
+        self._mood_index = MappingProxyType(index)
+        self._mood_index_source = df
+        # Katalog kolumnar untuk ranking fallback dan materialisasi hasil tanpa indexing DataFrame
+        missing = [col for col in RESULT_COLUMNS[:-1] if col not in df.columns]
+        if missing:
+            logger.warning("Kolom %s tidak ada di dataset, katalog hasil tidak dibangun", missing)
+            self._catalog = None
+        else:
+            self._catalog = FoodCatalog.build(df)
+        self._name_index = self._name_index_merge = None
+        self._nutrient_index = None
+        self._neighbour_lists, self._neighbour_merges, self._neighbour_spaces = {}, {}, {}
+        self._feature_indexes = {}
+        self._preference_center = None
+        # Katalog berubah: hasil yang sudah dihitung tidak berlaku lagi
+        self.invalidate_results()
+        return self._mood_index
+
+    def _ensure_mood_index(self):
+        """Bangun ulang indeks jika belum ada atau food_df sudah diganti"""
+        if not self.is_loaded():
+            raise ValueError("Dataset makanan belum dimuat. Panggil load_data() terlebih dahulu.")
+        if self._mood_index is None or self._mood_index_source is not self._food_df:
+            self._build_mood_index()
+
+    def get_mood_partition(self, mood):
+        """Ambil partisi mood; indeks dibangun ulang jika food_df sudah diganti"""
+        self._ensure_mood_index()
+        key = mood if mood in MOOD_FILTERS else 'neutral'
+        if key not in self._mood_index:
+            raise KeyError(f"Kolom filter untuk mood '{key}' tidak ada di dataset")
+        return self._mood_index[key]
+
     def encode_mood(self, mood):
         """Encode mood string ke numeric"""
         return self.mood_mapping.get(mood, 4)
@@ -118,36 +2662,103 @@ class FoodRecommender:
             return self.category_mapping.get(category_value.lower(), 0)
         return category_value
 
-    def get_food_similarity(self, user_profile):
+    def get_food_similarity(self, user_profile, timer=None, top_k=RESULT_TABLE_TOP_K, rows=None):
         """Hitung kesamaan antara profil pengguna dan makanan - VERSI SEMPURNA"""
-        import pandas as pd
-        import numpy as np
-        from sklearn.metrics.pairwise import cosine_similarity
-        from sklearn.preprocessing import MinMaxScaler
+        timer = timer or StageTimer()
+        row_ids, scores, fallback = self._rank_foods(user_profile, timer, top_k, rows)
+        result_df = self._materialize_result(row_ids, scores, fallback)
+        timer.lap('sort')
+
+        if tracing():
+            top = result_df.head(3)
+            log_event("similarity.top", foods=[
+                {"name": name, "similarity_score": score} for name, score in zip(top['name'], top['similarity_score'])
+            ])
+
+        return result_df
 
-        if self.food_df is None:
+    def _rank_foods(self, user_profile, timer, top_k, rows=None):
+        """(posisi baris katalog, skor, fallback) top_k makanan untuk user profile; rows (posisi
+        baris urut naik, hasil filter rentang) membatasi kandidat di partisi mood"""
+        if not self.is_loaded():
             raise ValueError("Dataset makanan belum dimuat. Panggil load_data() terlebih dahulu.")
 
-        print(f"=== PERFECT SIMILARITY CALCULATION ===")
-        print(f"User profile input: {user_profile}")
+        log_event("similarity.start", user_profile=user_profile)
 
-        # Step 1: Filter makanan berdasarkan mood TERLEBIH DAHULU
-        target_mood = user_profile.get('target_mood', 'energizing')  # Mood asli yang diminta
-        
-        if target_mood == 'energizing':
-            filtered_foods = self.food_df[self.food_df['is_energizing'] == 1].copy()
-        elif target_mood == 'relaxing':
-            filtered_foods = self.food_df[self.food_df['is_relaxing'] == 1].copy()
-        elif target_mood == 'focusing':
-            filtered_foods = self.food_df[self.food_df['is_focusing'] == 1].copy()
-        else:
-            filtered_foods = self.food_df[self.food_df['primary_mood'] == 'neutral'].copy()
+        # Step 1-4: partisi mood, proses profil, pilih fitur, normalisasi user
+        query = self._prepare_similarity_query(user_profile, timer)
+        if rows is not None:
+            # Irisan filter dengan partisi; normalisasi tetap milik partisi penuh, jadi skor dan
+            # urutan sama dengan ranking tanpa filter yang dibatasi ke baris ini
+            positions = _sorted_positions(query.row_ids, rows)
+            partition = query.partition.subset(positions) if query.partition is not None else None
+            query = replace(query, partition=partition, row_ids=query.row_ids[positions])
+            timer.lap('filter')
+        if query.partition is None:
+            log_event("similarity.no_features", level=logging.INFO, target_mood=query.target_mood)
+            return self._fallback_sorting(query.row_ids, query.target_mood, top_k)
+
+        if rows is None and self._use_feature_index(query.partition, top_k):
+            row_ids, similarities = self._rank_with_index(query, top_k, timer)
+            return row_ids, similarities, None
+
+        # Step 5: Hitung weighted cosine similarity untuk seluruh partisi (satu perkalian matriks-vektor)
+        similarities = self._weighted_cosine_similarity(
+            query.partition, query.selected, query.user_scaled[np.newaxis, :], query.weights
+        )[0]
+        timer.lap('score')
+        if tracing():
+            log_event("similarity.scored", weights=query.weights, min=similarities.min(),
+                      max=similarities.max(), mean=similarities.mean())
+
+        # Step 6: Add penalty untuk makanan yang tidak sesuai kondisi kesehatan
+        if query.health_conditions:
+            similarities = self._apply_health_penalties(query.partition, similarities, query.health_conditions)
+        timer.lap('penalize')
+
+        # Step 7: Sort berdasarkan similarity, kemudian calories
+        order = self._rank_partition(query.partition, similarities, query.target_mood, top_k)
+        return query.partition.row_ids[order], similarities[order], None
+
+    def _use_feature_index(self, partition, top_k):
+        """Mode 'ann' hanya untuk partisi besar dan top_k yang jauh lebih kecil dari partisi"""
+        size = len(partition.row_ids)
+        return self._search_mode == 'ann' and size >= ANN_MIN_ROWS and top_k * ANN_OVERFETCH < size
+
+    def _rank_with_index(self, query, top_k, timer=None):
+        """Top-k lewat FeatureIndex: nilai sel, ambil kandidat, lalu nilai ulang kandidat secara exact"""
+        timer = timer or StageTimer()
+        index = self.feature_index(query.partition.mood)
+        cell_scores = self._weighted_cosine_similarity(
+            index, query.selected, query.user_scaled[np.newaxis, :], query.weights
+        )[0]
+        if query.health_conditions:
+            cell_scores = self._apply_health_penalties(index, cell_scores, query.health_conditions)
+        candidates = query.partition.subset(index.candidates(cell_scores, math.ceil(top_k * ANN_OVERFETCH)))
+        timer.lap('filter')
+
+        similarities = self._weighted_cosine_similarity(
+            candidates, query.selected, query.user_scaled[np.newaxis, :], query.weights
+        )[0]
+        timer.lap('score')
+        if query.health_conditions:
+            similarities = self._apply_health_penalties(candidates, similarities, query.health_conditions)
+        timer.lap('penalize')
+        order = self._rank_partition(candidates, similarities, query.target_mood, top_k)
+        return candidates.row_ids[order], similarities[order]
+
+    def _prepare_similarity_query(self, user_profile, timer=None):
+        """Ubah user profile menjadi vektor fitur ternormalisasi terhadap partisi mood-nya.
 
-        print(f"Filtered foods by mood '{target_mood}': {len(filtered_foods)} items")
+        Jika tidak ada fitur yang cocok, partition pada hasil bernilai None dan row_ids
+        berisi baris partisi untuk fallback sorting.
+        """
+        timer = timer or StageTimer()
 
-        if len(filtered_foods) == 0:
-            print("No foods found for this mood, using all foods")
-            filtered_foods = self.food_df.copy()
+        # Step 1: Ambil partisi mood dari indeks (dibangun saat load)
+        target_mood = user_profile.get('target_mood', 'energizing')  # Mood asli yang diminta
+        partition = self.get_mood_partition(target_mood)
+        timer.lap('filter')
 
         # Step 2: Konversi dan normalisasi user profile - FIX FEATURE MAPPING
         processed_user_profile = {}
@@ -173,226 +2784,225 @@ class FoodRecommender:
             else:
                 processed_user_profile[key] = value
 
-        print(f"Processed user profile: {processed_user_profile}")
-
         # Step 3: Select features yang ada di dataset dan user profile - IMPROVED
-        available_features = [
-            'primary_mood_num', 'mood_energizing', 'mood_relaxing', 'mood_focusing',
-            'calorie_category_num', 'protein_category_num', 'fat_category_num', 
-            'carb_category_num', 'nutrient_balance_num'
-        ]
-        
-        feature_cols = []
-        for feature in available_features:
-            if feature in filtered_foods.columns and feature in processed_user_profile:
-                feature_cols.append(feature)
-
-        print(f"Selected features: {feature_cols}")
-        print(f"User profile values for selected features:")
-        for feature in feature_cols:
-            print(f"  {feature}: {processed_user_profile[feature]}")
+        selected = tuple(i for i, feature in enumerate(partition.feature_cols) if feature in processed_user_profile)
+        feature_cols = [partition.feature_cols[i] for i in selected]
+        health_conditions = user_profile.get('health_conditions', [])
 
         if len(feature_cols) == 0:
-            print("No matching features, using basic sorting")
-            return self._fallback_sorting(filtered_foods, target_mood)
-
-        # Step 4: Ekstrak dan PROPER NORMALIZATION - FINAL FIX
-        food_features_raw = filtered_foods[feature_cols].fillna(0)
-        user_features_raw = np.array([[processed_user_profile[col] for col in feature_cols]])
-
-        print(f"Before normalization:")
-        print(f"User features: {user_features_raw[0]}")
-        print(f"Food features sample (first 3 rows):")
-        print(food_features_raw.head(3).values)
-
-        # CONVERT BOOLEAN TO NUMERIC PROPERLY
-        food_features_numeric = food_features_raw.copy()
-        user_features_numeric = user_features_raw.copy()
-
-        for i, col in enumerate(feature_cols):
-            if food_features_raw[col].dtype == 'bool':
-                # Convert boolean to 0/1
-                food_features_numeric[col] = food_features_raw[col].astype(int)
-                user_features_numeric[0, i] = int(user_features_numeric[0, i])
-
-        # NOW NORMALIZE CORRECTLY - Handle edge cases
-        food_features = food_features_numeric.values
-        user_features = user_features_numeric
-
-        # Manual normalization untuk handle edge cases
-        normalized_user = []
-        normalized_food = []
-
-        for i, col in enumerate(feature_cols):
-            food_col = food_features[:, i]
-            user_val = user_features[0, i]
-            
-            col_min = food_col.min()
-            col_max = food_col.max()
-            
-            if col_max == col_min:
-                # Tidak ada variasi - set semua ke 0.5
-                normalized_food_col = np.full_like(food_col, 0.5)
-                normalized_user_val = 0.5
-            else:
-                # Normal MinMax scaling tapi clamp user value ke range [min, max]
-                user_val_clamped = np.clip(user_val, col_min, col_max)
-                
-                normalized_food_col = (food_col - col_min) / (col_max - col_min)
-                normalized_user_val = (user_val_clamped - col_min) / (col_max - col_min)
-            
-            normalized_food.append(normalized_food_col)
-            normalized_user.append(normalized_user_val)
-            
-            print(f"Feature {col}: range [{col_min}, {col_max}], user: {user_val} -> {normalized_user_val}")
+            return SimilarityQuery(target_mood, None, partition.row_ids, selected, None, None, health_conditions)
 
-        food_features_scaled = np.column_stack(normalized_food)
-        user_features_scaled = np.array([normalized_user])
+        # Step 4: Normalisasi - fitur makanan sudah dinormalisasi di indeks, tinggal user profile
+        user_features = np.array([processed_user_profile[col] for col in feature_cols])
+        user_features = np.where(partition.col_is_bool[list(selected)], np.trunc(user_features), user_features)
 
-        print(f"After proper normalization:")
-        print(f"User features: {user_features_scaled[0]}")
-        print(f"Food features range: min={food_features_scaled.min(axis=0)}, max={food_features_scaled.max(axis=0)}")
+        col_min = partition.col_min[list(selected)]
+        col_max = partition.col_max[list(selected)]
+        constant = col_max == col_min
+        span = np.where(constant, 1.0, col_max - col_min)
+        user_scaled = np.where(constant, 0.5, (np.clip(user_features, col_min, col_max) - col_min) / span)
+        timer.lap('normalize')
+        if tracing():
+            log_event("similarity.features", target_mood=target_mood, partition_size=len(partition.row_ids),
+                      features=feature_cols, col_min=col_min, col_max=col_max,
+                      user=user_features, user_scaled=user_scaled)
 
-        # Step 5: Hitung weighted cosine similarity - FINAL FIX
-        health_conditions = user_profile.get('health_conditions', [])
-        feature_weights = self._calculate_feature_weights(feature_cols, health_conditions)
-        
-        print(f"Feature weights: {feature_weights[0]}")
+        weights = self._calculate_feature_weights(feature_cols, health_conditions)[0]
+        timer.lap('weight')
+        return SimilarityQuery(target_mood, partition, partition.row_ids, selected, user_scaled, weights, health_conditions)
 
-        # Apply weights
-        user_weighted = user_features_scaled * feature_weights
-        food_weighted = food_features_scaled * feature_weights
+    def _partition_features(self, partition, selected):
+        """Fitur ternormalisasi partisi untuk kolom terpilih (float64)"""
+        selected = list(selected)
+        food_scaled = partition.features[:, selected].astype(np.float64)
+        constant = partition.col_max[selected] == partition.col_min[selected]
+        if constant.any() and not partition.col_is_float[selected].any():
+            # Matriks fitur integer: kolom konstan jadi 0 (perilaku full_like pada kolom int)
+            food_scaled[:, constant] = 0.0
+        return food_scaled
 
-        print(f"User weighted features: {user_weighted[0]}")
+    def _weighted_cosine_similarity(self, partition, selected, user_scaled, weights):
+        """Weighted cosine similarity antara n user dan semua makanan partisi (matriks n x m).
 
-        # Hitung similarity - FIX untuk handle zero vectors
-        similarities = []
-        for i in range(len(food_weighted)):
-            food_vec = food_weighted[i:i+1]
-            
-            # Check for zero vectors
-            user_norm = np.linalg.norm(user_weighted)
-            food_norm = np.linalg.norm(food_vec)
-            
-            if user_norm == 0 or food_norm == 0:
-                # Fallback: use euclidean distance inverse
-                distance = np.linalg.norm(user_features_scaled - food_features_scaled[i:i+1])
-                similarity = 1.0 / (1.0 + distance)  # Convert distance to similarity
-            else:
-                # Normal cosine similarity
-                similarity = cosine_similarity(user_weighted, food_vec)[0][0]
-            
-            similarities.append(similarity)
-        
-        similarities = np.array(similarities)
-        print(f"Similarity range: {similarities.min():.4f} to {similarities.max():.4f}")
-        print(f"Similarity mean: {similarities.mean():.4f}")
+        Satu perkalian matriks untuk seluruh partisi. Vektor nol (user atau makanan) tetap
+        memakai fallback 1 / (1 + jarak euclidean) pada fitur ternormalisasi tanpa bobot.
+        """
+        food_scaled = self._partition_features(partition, selected)
+        user_weighted = user_scaled * weights
+        food_weighted = food_scaled * weights
 
-        # Step 6: Add penalty untuk makanan yang tidak sesuai kondisi kesehatan
-        if health_conditions:
-            similarities = self._apply_health_penalties(filtered_foods, similarities, health_conditions)
+        user_norm = np.sqrt(np.einsum('ij,ij->i', user_weighted, user_weighted))
+        food_norm = np.sqrt(np.einsum('ij,ij->i', food_weighted, food_weighted))
+        cosine_users = user_norm != 0
+        cosine_foods = food_norm != 0
+
+        similarities = np.empty((len(user_scaled), len(food_scaled)))
+        if cosine_users.any() and cosine_foods.any():
+            # Normalisasi per baris lalu dot product, urutan operasi sama dengan sklearn cosine_similarity
+            food_unit = food_weighted[cosine_foods] / food_norm[cosine_foods, np.newaxis]
+            user_unit = user_weighted[cosine_users] / user_norm[cosine_users, np.newaxis]
+            similarities[np.ix_(cosine_users, cosine_foods)] = (food_unit @ user_unit.T).T
+
+        # Fallback: inverse euclidean distance untuk pasangan dengan vektor nol
+        for users, foods in ((cosine_users, ~cosine_foods), (~cosine_users, slice(None))):
+            user_rows = user_scaled[users]
+            food_rows = food_scaled[foods]
+            if len(user_rows) == 0 or len(food_rows) == 0:
+                continue
+            squared = np.zeros((len(user_rows), len(food_rows)))
+            for j in range(food_rows.shape[1]):
+                diff = food_rows[np.newaxis, :, j] - user_rows[:, j, np.newaxis]
+                squared += diff * diff
+            similarities[np.ix_(users, np.arange(len(food_scaled))[foods])] = 1.0 / (1.0 + np.sqrt(squared))
 
-        # Step 7: Create result
-        result_df = filtered_foods.copy()
-        result_df['similarity_score'] = similarities
+        return similarities
 
-        # Sort berdasarkan similarity, kemudian criteria sekunder
-        result_df = result_df.sort_values(['similarity_score', 'calories'], ascending=[False, target_mood != 'relaxing'])
+    def _rank_partition(self, partition, similarities, target_mood, top_k=RESULT_TABLE_TOP_K):
+        """Urutan top-k: similarity menurun lalu calories (stable, sama dengan sort_values)"""
+        calories_key = partition.calories if target_mood != 'relaxing' else -partition.calories
+        return top_k_order((calories_key, -similarities), top_k)
 
-        print(f"Top 3 final recommendations:")
-        for i in range(min(3, len(result_df))):
-            print(f"{i+1}. {result_df.iloc[i]['name']}: {result_df.iloc[i]['similarity_score']:.4f}")
+    def health_rules(self):
+        """Aturan kondisi kesehatan terkompilasi (health_mapping model + HEALTH_RULES)"""
+        rules = self._health_rules
+        if rules is None:
+            rules = self._health_rules = HealthRules(self.health_mapping, HEALTH_RULES)
+        return rules
 
-        return result_df.head(10)[['name', 'calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'similarity_score']]
+    def check_health_rules(self):
+        """Pastikan aturan kondisi kesehatan bisa diterapkan ke semua partisi mood; ValueError jika tidak"""
+        self._ensure_mood_index()
+        rules = self.health_rules()
+        for partition in self._mood_index.values():
+            rules.check_columns(partition)
 
     def _calculate_feature_weights(self, feature_cols, health_conditions):
         """Calculate dynamic feature weights based on health conditions"""
-        weights = np.ones(len(feature_cols))
-        
-        for i, feature in enumerate(feature_cols):
-            base_weight = 1.0
-            
-            # Mood features always important
-            if 'mood_' in feature:
-                base_weight = 2.0
-            
-            # Health condition specific weights
-            for condition in health_conditions:
-                if condition in self.health_mapping:
-                    priority_nutrients = self.health_mapping[condition].get('priority_nutrients', [])
-                    
-                    if feature == 'calorie_category_num' and 'calories' in priority_nutrients:
-                        base_weight *= 2.0
-                    elif feature == 'carb_category_num' and 'carbohydrate' in priority_nutrients:
-                        base_weight *= 2.0
-                    elif feature == 'fat_category_num' and 'fat' in priority_nutrients:
-                        base_weight *= 2.0
-                    elif feature == 'protein_category_num' and 'proteins' in priority_nutrients:
-                        base_weight *= 1.5
-            
-            weights[i] = base_weight
-        
-        # Normalize weights
-        weights = weights / np.sum(weights) * len(weights)
-        return weights.reshape(1, -1)
+        return self.health_rules().feature_weights(feature_cols, health_conditions).reshape(1, -1)
 
-    def _apply_health_penalties(self, foods_df, similarities, health_conditions):
+    def _apply_health_penalties(self, partition, similarities, health_conditions):
         """Apply penalties untuk makanan yang tidak sesuai kondisi kesehatan"""
-        penalties = np.zeros(len(similarities))
-        
-        for condition in health_conditions:
-            if condition == 'diabetes':
-                # Penalty untuk karbohidrat tinggi
-                high_carb_mask = foods_df['carb_category_num'] >= 3
-                penalties[high_carb_mask] += 0.1
-                
-            elif condition == 'hipertensi':
-                # Penalty untuk lemak tinggi
-                high_fat_mask = foods_df['fat_category_num'] >= 3
-                penalties[high_fat_mask] += 0.1
-                
-            elif condition == 'kolesterol':
-                # Penalty untuk lemak tinggi
-                high_fat_mask = foods_df['fat_category_num'] >= 3
-                penalties[high_fat_mask] += 0.15
-                
-            elif condition == 'obesitas':
-                # Penalty untuk kalori tinggi
-                high_cal_mask = foods_df['calorie_category_num'] >= 3
-                penalties[high_cal_mask] += 0.1
-        
-        return similarities - penalties
+        rules = self.health_rules()
+        # Mask terkompilasi hanya untuk partisi indeks; subset (kandidat, sel FeatureIndex) dihitung langsung
+        full = self._mood_index is not None and self._mood_index.get(partition.mood) is partition
+        return rules.penalize(partition, similarities, health_conditions,
+                              rules.partition_masks(partition) if full else None)
 
-    def _fallback_sorting(self, foods_df, mood):
-        """Fallback sorting ketika tidak ada features yang cocok"""
-        if mood == 'energizing':
-            sorted_df = foods_df.sort_values('calories', ascending=False)
-        elif mood == 'focusing':
-            sorted_df = foods_df.sort_values('proteins', ascending=False)
+    def _fallback_sorting(self, row_ids, mood, top_k=RESULT_TABLE_TOP_K):
+        """Fallback sorting ketika tidak ada features yang cocok; (posisi baris, skor, fallback)"""
+        catalog = self._catalog
+        if mood == 'focusing':
+            key = -catalog.proteins[row_ids]
         elif mood == 'relaxing':
-            sorted_df = foods_df.sort_values('calories', ascending=True)
+            key = catalog.calories[row_ids]
         else:
-            sorted_df = foods_df.sort_values('calories', ascending=False)
-        
-        sorted_df = sorted_df.copy()
-        sorted_df['similarity_score'] = 0.8  # Fixed score untuk fallback
-        
-        return sorted_df.head(10)[['name', 'calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'similarity_score']]
+            key = -catalog.calories[row_ids]
 
-    def recommend_for_mood(self, mood, top_n=5, health_conditions=None):
-        """PERFECT RECOMMENDATION SYSTEM - Versi Sempurna"""
-        if self.food_df is None:
+        # Fixed score 0.8 untuk fallback
+        order = top_k_order((key,), top_k)
+        return row_ids[order], np.full(len(order), 0.8), 'fallback_sorting'
+
+    def recommend_for_mood(self, mood, top_n=5, health_conditions=None, filters=None):
+        """PERFECT RECOMMENDATION SYSTEM - Versi Sempurna
+
+        filters: {nama filter: (min, max)} (lihat RANGE_FILTER_COLUMNS); hanya makanan dalam
+        rentang yang dinilai.
+        """
+        if not self.is_loaded():
             raise ValueError("Dataset makanan belum dimuat. Panggil load_data() terlebih dahulu.")
 
-        print(f"\n=== PERFECT RECOMMENDATION SYSTEM ===")
-        print(f"Input -> Mood: {mood}, Health: {health_conditions}, Top N: {top_n}")
+        bounds = self.range_bounds(filters) if filters else ()
+        if bounds:
+            return self._recommend_filtered(mood, top_n, health_conditions, bounds)
+
+        log_event("recommend.start", mood=mood, health_conditions=health_conditions, top_n=top_n)
+        timer = StageTimer()
 
         # Validasi mood
         valid_moods = ['energizing', 'relaxing', 'focusing', 'neutral']
         if mood not in valid_moods:
-            print(f"Invalid mood '{mood}', using 'neutral'")
+            log_event("recommend.invalid_mood", level=logging.INFO, mood=mood, using='neutral')
             mood = 'neutral'
 
+        self._ensure_mood_index()
+        self._ensure_result_table()
+        timer.restart()
+
+        # Profil kanonik (mood x subset kondisi yang dikenal): lookup di tabel hasil
+        table_key = self._result_table_key(mood, top_n, health_conditions)
+        if table_key is not None and self._result_table is not None:
+            self._count_result_table(hits=1)
+            ids, scores, fallback = self._result_table[table_key]
+            recommendations = self._materialize_result(ids[:top_n], scores[:top_n], fallback)
+            timer.lap('lookup')
+            log_event("recommend.result_table_hit", count=len(recommendations))
+            self._record_served(recommendations)
+            return recommendations
+        self._count_result_table(misses=1)
+
+        # Input non-kanonik (kondisi tidak dikenal, top_n besar, dll): LRU cache
+        cache_key = (mood, tuple(health_conditions or ()), top_n)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            timer.lap('lookup')
+            log_event("recommend.lru_hit", count=len(cached))
+            self._record_served(cached)
+            return cached.copy()
+
+        recommendations = self._compute_recommendations(mood, top_n, health_conditions, timer)
+        self._result_cache.put(cache_key, recommendations.copy())
+        timer.log("recommend.timings")
+        self._record_served(recommendations)
+        return recommendations
+
+    def _recommend_filtered(self, mood, top_n, health_conditions, bounds):
+        """Rekomendasi dengan filter rentang: tidak memakai tabel hasil, hanya LRU cache"""
+        log_event("recommend.start", mood=mood, health_conditions=health_conditions, top_n=top_n, filters=bounds)
+        timer = StageTimer()
+        mood = mood if mood in MOOD_FILTERS else 'neutral'
+        self._ensure_mood_index()
+        cache_key = (mood, tuple(health_conditions or ()), top_n, bounds)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            timer.lap('lookup')
+            self._record_served(cached)
+            return cached.copy()
+
+        rows = self.nutrient_index().select(bounds)
+        timer.lap('filter')
+        recommendations = self._compute_recommendations(mood, top_n, health_conditions, timer, rows)
+        self._result_cache.put(cache_key, recommendations.copy())
+        timer.log("recommend.timings")
+        self._record_served(recommendations)
+        return recommendations
+
+    @staticmethod
+    def _record_served(recommendations):
+        """Hitung hasil yang dilayani lewat jalur fallback (untuk /metrics)"""
+        fallback = recommendations.attrs.get('fallback')
+        if fallback is not None:
+            with FALLBACK_LOCK:
+                FALLBACK_COUNTS[fallback] += 1
+
+    def _compute_recommendations(self, mood, top_n, health_conditions, timer=None, rows=None):
+        """Hitung rekomendasi tanpa cache (mood sudah divalidasi); rows membatasi kandidat"""
+        # Step 1-2: Buat user profile beserta constraint kondisi kesehatan
+        user_profile = self._build_user_profile(mood, health_conditions)
+
+        # Step 3: Get recommendations using perfect similarity calculation
+        try:
+            recommendations = self.get_food_similarity(user_profile, timer, max(top_n, RESULT_TABLE_TOP_K), rows)
+            
+            log_event("recommend.done", count=len(recommendations))
+            return recommendations.head(top_n)
+
+        except Exception as e:
+            logger.warning("Error in perfect recommendation, using ultimate fallback: %s", e)
+            # Ultimate fallback
+            return self._ultimate_fallback(mood, top_n, health_conditions, rows)
+
+    def _build_user_profile(self, mood, health_conditions):
+        """User profile dari mood yang diminta dan constraint kondisi kesehatan"""
         # Step 1: Buat user profile yang comprehensive - FIX TARGET MOOD
         user_profile = {
             'target_mood': mood,  # Mood asli yang diminta - SELALU KONSISTEN
@@ -406,108 +3016,1755 @@ class FoodRecommender:
 
         # Step 2: Add health condition constraints - FIX VEGETARIAN BUG
         if health_conditions:
-            print(f"Processing health conditions: {health_conditions}")
-            
-            # Aggregate constraints from multiple conditions
-            aggregated_constraints = {}
-            
-            for condition in health_conditions:
-                if condition in self.health_mapping:
-                    condition_constraints = self.health_mapping[condition].copy()
-                    
-                    # Remove priority_nutrients metadata
-                    if 'priority_nutrients' in condition_constraints:
-                        del condition_constraints['priority_nutrients']
-                    
-                    for feature, value in condition_constraints.items():
-                        if feature in aggregated_constraints:
-                            # Take the more restrictive constraint (lower value)
-                            aggregated_constraints[feature] = min(aggregated_constraints[feature], value)
-                        else:
-                            aggregated_constraints[feature] = value
-            
+            # Constraint gabungan (nilai paling ketat) dari tabel aturan, disimpan per kombinasi kondisi
+            aggregated_constraints = self.health_rules().profile_constraints(health_conditions)
+
             # Add aggregated constraints to user profile
             user_profile.update(aggregated_constraints)
-            print(f"Applied health constraints: {aggregated_constraints}")
+            log_event("recommend.health_constraints", health_conditions=health_conditions,
+                      constraints=aggregated_constraints)
 
-        # Step 3: Get recommendations using perfect similarity calculation
-        try:
-            recommendations = self.get_food_similarity(user_profile)
-            
-            print(f"Successfully generated {len(recommendations)} recommendations")
-            return recommendations.head(top_n)
+        return user_profile
 
-        except Exception as e:
-            print(f"Error in perfect recommendation: {str(e)}")
-            # Ultimate fallback
-            return self._ultimate_fallback(mood, top_n, health_conditions)
+    def recommend_batch(self, queries):
+        """Rekomendasi untuk banyak (mood, top_n, health_conditions) sekaligus.
+
+        Profil identik hanya dihitung sekali, dan profil yang tidak ada di tabel hasil
+        dinilai bersama sebagai satu perkalian matriks user x makanan per partisi mood.
+        Hasil berupa list DataFrame (atau Exception per item) dengan urutan sama seperti input.
+        """
+        self._ensure_mood_index()
+        self._ensure_result_table()
+        timer = StageTimer()
+
+        results = [None] * len(queries)
+        pending = {}  # (mood, kondisi) -> index item yang menunggu skor
+        for i, (mood, top_n, health_conditions) in enumerate(queries):
+            mood = mood if mood in MOOD_FILTERS else 'neutral'
+            table_key = self._result_table_key(mood, top_n, health_conditions)
+            if table_key is not None and self._result_table is not None:
+                results[i] = self._result_table[table_key]
+            else:
+                pending.setdefault((mood, tuple(health_conditions or ())), []).append(i)
+        misses = sum(len(indices) for indices in pending.values())
+        self._count_result_table(hits=len(queries) - misses, misses=misses)
+        timer.lap('lookup')
+
+        # Siapkan query per profil unik; gagal -> ultimate fallback seperti recommend_for_mood
+        groups = {}
+        for profile_key in pending:
+            mood, conditions = profile_key
+            try:
+                query = self._prepare_similarity_query(self._build_user_profile(mood, list(conditions)), timer)
+            except Exception as e:
+                self._fill_batch_fallback(results, queries, pending[profile_key], mood, e)
+                continue
+            if query.partition is None:
+                ranked = self._fallback_sorting(query.row_ids, mood, self._batch_top_k(queries, pending[profile_key]))
+                for i in pending[profile_key]:
+                    results[i] = ranked
+                continue
+            group_key = (query.partition.mood, query.selected, query.weights.tobytes())
+            groups.setdefault(group_key, []).append((profile_key, query))
+
+        # Satu perkalian matriks per (partisi, fitur, bobot); profil mode 'ann' lewat FeatureIndex
+        for members in groups.values():
+            partition, selected, weights = members[0][1].partition, members[0][1].selected, members[0][1].weights
+            try:
+                exact = []
+                for profile_key, query in members:
+                    top_k = self._batch_top_k(queries, pending[profile_key])
+                    if not self._use_feature_index(partition, top_k):
+                        exact.append((profile_key, query, top_k))
+                        continue
+                    ranked = (*self._rank_with_index(query, top_k, timer), None)
+                    for i in pending[profile_key]:
+                        results[i] = ranked
+                if not exact:
+                    continue
+
+                user_matrix = np.vstack([query.user_scaled for _, query, _ in exact])
+                similarity_matrix = self._weighted_cosine_similarity(partition, selected, user_matrix, weights)
+                timer.lap('score')
+                for (profile_key, query, top_k), similarities in zip(exact, similarity_matrix):
+                    if query.health_conditions:
+                        similarities = self._apply_health_penalties(partition, similarities, query.health_conditions)
+                    timer.lap('penalize')
+                    order = self._rank_partition(partition, similarities, query.target_mood, top_k)
+                    timer.lap('sort')
+                    ranked = (partition.row_ids[order], similarities[order], None)
+                    for i in pending[profile_key]:
+                        results[i] = ranked
+            except Exception as e:
+                for profile_key, _ in members:
+                    self._fill_batch_fallback(results, queries, pending[profile_key], profile_key[0], e)
+
+        # Materialisasi hasil per item; item dengan hasil dan top_n sama berbagi DataFrame
+        materialized = {}
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                continue
+            top_n = queries[i][1]
+            key = (id(result), top_n)
+            if key not in materialized:
+                try:
+                    if isinstance(result, tuple):
+                        row_ids, scores, fallback = result
+                        value = self._materialize_result(row_ids[:top_n], scores[:top_n], fallback)
+                    else:
+                        value = result.head(top_n)
+                except Exception as e:
+                    value = e
+                # Simpan juga objek sumber agar id() tidak dipakai ulang selama loop
+                materialized[key] = (result, value)
+            results[i] = materialized[key][1]
+            if not isinstance(results[i], Exception):
+                self._record_served(results[i])
+
+        timer.lap('sort')
+        log_event("recommend_batch.done", level=logging.INFO, items=len(queries),
+                  profiles_scored=len(pending), matrix_products=len(groups))
+        timer.log("recommend_batch.timings")
+        return results
+
+    @staticmethod
+    def _batch_top_k(queries, indices):
+        """Jumlah hasil yang perlu diurutkan untuk item batch yang berbagi satu profil"""
+        return max([RESULT_TABLE_TOP_K] + [queries[i][1] for i in indices])
+
+    def _fill_batch_fallback(self, results, queries, indices, mood, error):
+        """Ultimate fallback untuk item batch yang gagal dihitung"""
+        logger.warning("Error in batch recommendation, using ultimate fallback: %s", error)
+        fallbacks = {}
+        for i in indices:
+            top_n = queries[i][1]
+            if top_n not in fallbacks:
+                try:
+                    fallbacks[top_n] = self._ultimate_fallback(mood, top_n, queries[i][2])
+                except Exception as e:
+                    fallbacks[top_n] = e
+            results[i] = fallbacks[top_n]
+
+    def _result_table_key(self, mood, top_n, health_conditions):
+        """Key tabel hasil, atau None jika input di luar domain kanonik"""
+        conditions = health_conditions or []
+        if not 0 <= top_n <= RESULT_TABLE_TOP_K:
+            return None
+        if len(set(conditions)) != len(conditions) or any(c not in self.health_rules().constraints for c in conditions):
+            return None
+        return (mood, frozenset(conditions))
+
+    def _materialize_result(self, row_ids, scores, fallback=None):
+        """Bangun DataFrame hasil (hanya k baris) dari posisi baris katalog dan skor"""
+        catalog = self._catalog
+        mood_labels = np.array(catalog.mood_labels + (None,), dtype=object)  # kode -1 -> None
+        columns = {
+            'name': catalog.names(row_ids),
+            'calories': _float32_to_float(catalog.calories[row_ids]),
+            'proteins': _float32_to_float(catalog.proteins[row_ids]),
+            'fat': _float32_to_float(catalog.fat[row_ids]),
+            'carbohydrate': _float32_to_float(catalog.carbohydrate[row_ids]),
+            'primary_mood': mood_labels[catalog.mood_codes[row_ids]],
+            'similarity_score': np.asarray(scores, dtype=np.float64),
+        }
+        result_df = pd.DataFrame(columns, index=catalog.index[row_ids])
+        if fallback is not None:
+            result_df.attrs['fallback'] = fallback
+        return result_df
+
+    def _count_result_table(self, hits=0, misses=0):
+        with self._result_table_counter_lock:
+            self._result_table_hits += hits
+            self._result_table_misses += misses
+
+    def build_result_table(self):
+        """Hitung top-K untuk semua kombinasi mood x subset kondisi kesehatan sekaligus"""
+        with self._result_table_lock:
+            return self._build_result_table()
+
+    def _ensure_result_table(self):
+        """Bangun tabel hasil yang aktif tapi belum ada, kecuali sedang dibangun thread lain (warm-up)"""
+        if self._result_table_enabled and self._result_table is None and self._result_table_lock.acquire(blocking=False):
+            try:
+                if self._result_table is None:
+                    self._build_result_table()
+            finally:
+                self._result_table_lock.release()
+
+    def _build_result_table(self):
+        self._ensure_mood_index()
+        self._result_table_enabled = True
+        if self._catalog is None:
+            return None
+        if not self._catalog.index.is_unique:
+            logger.warning("Index food_df tidak unik, tabel hasil tidak dibangun")
+            return None
+
+        conditions = self.health_rules().conditions
+        table = {}
+        for mood in MOOD_FILTERS:
+            for r in range(len(conditions) + 1):
+                for subset in itertools.combinations(conditions, r):
+                    table[(mood, frozenset(subset))] = self._result_table_entry(mood, subset)
+        self._result_table = table
+        logger.info("Tabel hasil dibangun: %d profil", len(table))
+        return table
+
+    def _result_table_entry(self, mood, conditions):
+        """(posisi baris, skor, fallback) top-K satu profil tabel hasil"""
+        timer = StageTimer(enabled=False)  # jangan campur waktu build ke histogram request
+        result = self._compute_recommendations(mood, RESULT_TABLE_TOP_K, sorted(conditions) or None, timer)
+        return (
+            self._catalog.index.get_indexer(result.index),
+            result['similarity_score'].to_numpy(dtype=np.float64),
+            result.attrs.get('fallback')
+        )
+
+    def enable_result_table(self):
+        """Aktifkan tabel hasil; hanya dibangun jika belum ada (mis. sudah dimuat dari artifact)"""
+        self._result_table_enabled = True
+        with self._result_table_lock:
+            if self._result_table is None:
+                self._build_result_table()
+        return self._result_table
+
+    def set_search_mode(self, mode):
+        """Pilih 'exact' (nilai semua makanan) atau 'ann' (FeatureIndex untuk partisi besar)"""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Mode pencarian '{mode}' tidak dikenal (pilih {', '.join(SEARCH_MODES)})")
+        if mode != self._search_mode:
+            self._search_mode = mode
+            # Hasil mode sebelumnya tidak dipakai ulang
+            self.invalidate_results()
+
+    @property
+    def search_mode(self):
+        return self._search_mode
+
+    def feature_index(self, mood):
+        """FeatureIndex partisi mood; dibangun saat pertama dibutuhkan"""
+        partition = self.get_mood_partition(mood)
+        index = self._feature_indexes.get(partition.mood)
+        if index is None:
+            index = self._feature_indexes[partition.mood] = FeatureIndex.build(partition)
+        return index
+
+    def build_feature_indexes(self):
+        """Bangun FeatureIndex untuk semua partisi yang cukup besar untuk mode 'ann'"""
+        self._ensure_mood_index()
+        return {mood: self.feature_index(mood).cells for mood, partition in self._mood_index.items()
+                if len(partition.row_ids) >= ANN_MIN_ROWS}
+
+    def neighbour_lists(self, mood):
+        """NeighbourLists partisi mood; dari artifact, digabung setelah update katalog, atau dibangun
+        saat pertama dibutuhkan"""
+        partition = self.get_mood_partition(mood)
+        lists = self._neighbour_lists.get(partition.mood)
+        if lists is None:
+            merge = self._neighbour_merges.pop(partition.mood, None)
+            lists = merge() if merge is not None else self._build_neighbour_lists(partition)
+            self._neighbour_lists[partition.mood] = lists
+        return lists
+
+    def build_neighbour_lists(self):
+        """Bangun (atau gabungkan) NeighbourLists semua partisi; (mood -> ukuran byte)"""
+        self._ensure_mood_index()
+        return {mood: self.neighbour_lists(mood).nbytes for mood in self._mood_index}
+
+    def _neighbour_space(self, partition):
+        selected = tuple(range(len(partition.feature_cols)))
+        n = len(partition.row_ids)
+        if selected:
+            first, group_of = _row_groups(partition.features)
+        else:
+            first, group_of = np.zeros(min(n, 1), dtype=np.intp), np.zeros(n, dtype=np.intp)
+        groups = partition.subset(first)
+        weights = self.health_rules().feature_weights(partition.feature_cols, ())
+        return _NeighbourSpace(group_of, first, self._partition_features(groups, selected),
+                               partial(self._weighted_cosine_similarity, groups, selected, weights=weights),
+                               np.asarray(partition.calories))
+
+    def _neighbour_search(self, partition):
+        """(_NeighbourSpace, pool semua makanan) partisi untuk query di luar NeighbourLists; di-cache per mood"""
+        cached = self._neighbour_spaces.get(partition.mood)
+        if cached is None or cached[0] is not partition:
+            space = self._neighbour_space(partition)
+            cached = self._neighbour_spaces[partition.mood] = (partition, space, space.pool(np.arange(len(partition.row_ids))))
+        return cached[1:]
+
+    def _fill_neighbours(self, space, members, pool, wanted, positions, scores, previous=None):
+        """Isi positions/scores (posisi partisi tetangga) untuk members, per blok satu grup di thread pool.
+
+        previous: tetangga lama per posisi (-1 = kosong); kandidat pool hanya dibandingkan dengan
+        daftar itu, jadi pool cukup berisi baris baru.
+        """
+        k = positions.shape[1]
+        members = members[np.argsort(space.group_of[members], kind='stable')]
+        groups = space.group_of[members]
+        edges = np.concatenate([[0], np.flatnonzero(np.diff(groups)) + 1, [len(members)]])
+        blocks = [(groups[start], members[block:min(stop, block + NEIGHBOUR_BLOCK_ROWS)])
+                  for start, stop in zip(edges[:-1], edges[1:])
+                  for block in range(start, stop, NEIGHBOUR_BLOCK_ROWS)]
+
+        def fill(block):
+            group, rows = block
+            similarities, calories = space.similarities(group), space.calories[rows]
+            if previous is None:
+                candidates, candidate_scores = space.candidates(similarities, calories, pool, wanted)
+                positions[rows], scores[rows] = space.select(rows, calories, candidates, candidate_scores, k)
+                return
+            old = previous[rows]
+            old_scores = np.where(old >= 0, similarities[space.group_of[old]], -np.inf)
+            positions[rows], scores[rows] = old, old_scores
+            # Baris baru hanya bisa masuk jika lebih dekat dari tetangga terakhir; cek dulu baris baru
+            # terdekat tiap grup, hanya makanan yang daftarnya berubah yang digabung penuh
+            floor = old_scores.min() if (old >= 0).all() else -np.inf
+            nearest, nearest_scores = space.candidates(similarities, calories, pool, 1, floor)
+            last, last_scores = old[:, -1:], old_scores[:, -1:]
+            distance = np.abs(space.calories[nearest] - calories[:, np.newaxis])
+            last_distance = np.abs(space.calories[last] - calories[:, np.newaxis])
+            better = (nearest >= 0) & ((nearest_scores > last_scores) | ((nearest_scores == last_scores) & (
+                (distance < last_distance) | ((distance == last_distance) & (nearest < last)))))
+            changed = better.any(axis=1)
+            if changed.any():
+                rows, calories, old, old_scores = rows[changed], calories[changed], old[changed], old_scores[changed]
+                candidates, candidate_scores = space.candidates(similarities, calories, pool, wanted, floor)
+                positions[rows], scores[rows] = space.select(rows, calories, np.hstack([old, candidates]),
+                                                             np.hstack([old_scores, candidate_scores]), k)
+
+        if len(blocks) > 1:
+            with ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix='nutrimood-neighbours') as executor:
+                list(executor.map(fill, blocks))
+        else:
+            for block in blocks:
+                fill(block)
+
+    def _build_neighbour_lists(self, partition):
+        space = self._neighbour_space(partition)
+        n = len(partition.row_ids)
+        positions = np.full((n, NEIGHBOUR_LIST_SIZE), -1, dtype=np.int64)
+        scores = np.full((n, NEIGHBOUR_LIST_SIZE), -np.inf)
+        everyone = np.arange(n)
+        # +1: makanan itu sendiri ada di pool
+        self._fill_neighbours(space, everyone, space.pool(everyone), NEIGHBOUR_LIST_SIZE + 1, positions, scores)
+        return NeighbourLists.build(partition, positions, scores)
+
+    def _merged_neighbour_lists(self, partition, old_partition, old, new_of, fresh):
+        """NeighbourLists partisi setelah apply_updates dari daftar lama (normalisasi partisi sama).
+
+        Tetangga lama dipetakan ke posisi baru dan dibandingkan hanya dengan baris baru (fresh:
+        mask baris katalog baru/diganti). Baris baru dan makanan yang salah satu tetangganya
+        dihapus dihitung penuh.
+        """
+        n, k = len(partition.row_ids), old.size
+        added = np.flatnonzero(fresh[partition.row_ids])
+        # Setiap baris baru rata-rata menggeser ~k daftar; jika itu mencakup seluruh partisi,
+        # build ulang lebih murah daripada menggabung
+        if k != NEIGHBOUR_LIST_SIZE or len(added) * k >= n:
+            return self._build_neighbour_lists(partition)
+        position_of = np.full(len(new_of) + 1, -1, dtype=np.int64)  # baris katalog baru -> posisi partisi
+        position_of[partition.row_ids] = np.arange(n)
+        kept = new_of[old_partition.row_ids]
+        survivors = np.flatnonzero(kept >= 0)
+        targets = position_of[kept[survivors]]
+        if (targets < 0).any():
+            return self._build_neighbour_lists(partition)
+        old_rows = np.asarray(old.rows[survivors], dtype=np.int64)
+        mapped = np.where(old_rows >= 0, new_of[old_rows], -1)  # -1 di old_rows -> new_of[-1]: dibuang where
+        complete = ((old_rows < 0) | (mapped >= 0)).all(axis=1)
+        previous = np.full((n, k), -1, dtype=np.int64)
+        previous[targets] = position_of[mapped]  # mapped -1 -> position_of[-1] = -1
+        merge = np.zeros(n, dtype=bool)
+        merge[targets[complete]] = True
+
+        space = self._neighbour_space(partition)
+        positions = np.full((n, k), -1, dtype=np.int64)
+        scores = np.full((n, k), -np.inf)
+        everyone = np.arange(n)
+        self._fill_neighbours(space, np.flatnonzero(~merge), space.pool(everyone), k + 1, positions, scores)
+        self._fill_neighbours(space, np.flatnonzero(merge), space.pool(added), k, positions, scores, previous)
+        return NeighbourLists.build(partition, positions, scores)
+
+    def food_position(self, food_id):
+        """Posisi baris katalog untuk id (label index food_df, seperti di /foods/search); KeyError jika tidak ada"""
+        self._ensure_mood_index()
+        index = self._catalog.index
+        if isinstance(food_id, str) and index.dtype.kind in 'iu':
+            try:
+                food_id = int(food_id)
+            except ValueError:
+                raise KeyError(food_id)
+        if index.is_unique:
+            position = int(index.get_indexer([food_id])[0])
+        else:
+            matches = np.flatnonzero(index == food_id)
+            position = int(matches[0]) if len(matches) else -1
+        if position < 0:
+            raise KeyError(food_id)
+        return position
+
+    def foods_at(self, rows):
+        """DataFrame hasil (similarity_score NaN) untuk posisi baris katalog"""
+        rows = np.asarray(rows, dtype=np.intp)
+        return self._materialize_result(rows, np.full(len(rows), np.nan))
+
+    def similar_foods(self, row, k=10, mood=None, health_conditions=None):
+        """k makanan paling mirip dengan baris katalog row; (DataFrame hasil, mood partisi).
+
+        Tanpa mood dipakai partisi tempat makanan itu berada. health_conditions membatasi hasil
+        ke makanan yang tidak terkena penalty kondisi tersebut. Dijawab dari NeighbourLists;
+        jika makanan di luar partisi, k melebihi daftar, atau filter kondisi menyisakan terlalu
+        sedikit, kandidat diambil dari grup fitur partisi (urutan sama dengan NeighbourLists).
+        """
+        self._ensure_mood_index()
+        home = None
+        for partition in self._mood_index.values():
+            position = _sorted_positions(partition.row_ids, np.array([row]))
+            if len(position):
+                home = (partition, int(position[0]))
+                break
+        if mood is None and home is not None:
+            partition, position = home
+        else:
+            partition = self.get_mood_partition(mood or 'neutral')
+            position = _sorted_positions(partition.row_ids, np.array([row]))
+            position = int(position[0]) if len(position) else None
+
+        rules = self.health_rules()
+        if position is not None and k <= NEIGHBOUR_LIST_SIZE:
+            lists = self.neighbour_lists(partition.mood)
+            rows, scores = np.asarray(lists.rows[position]), np.asarray(lists.scores[position])
+            complete = rows[-1] < 0  # daftar tidak penuh: sudah memuat semua makanan lain di partisi
+            rows, scores = rows[rows >= 0], scores[rows >= 0]
+            if health_conditions:
+                keep = rules.allowed(partition, health_conditions, np.searchsorted(partition.row_ids, rows))
+                rows, scores = rows[keep], scores[keep]
+            if len(rows) >= k or complete:
+                return self._materialize_result(rows[:k], scores[:k].astype(np.float64)), partition.mood
+
+        space, pool = self._neighbour_search(partition)
+        if position is not None:
+            similarities, calories = space.similarities(space.group_of[position]), space.calories[position]
+        else:
+            similarities, calories = self._probe_similarities(partition, space, row, home)
+        allowed = rules.allowed(partition, health_conditions, space.first) if health_conditions else None
+        members, calories = np.array([-1 if position is None else position]), np.array([calories])
+        candidates, candidate_scores = space.candidates(similarities, calories, pool, k + 1, allowed=allowed)
+        positions, scores = space.select(members, calories, candidates, candidate_scores, k)
+        positions, scores = positions[0][positions[0] >= 0], scores[0][positions[0] >= 0]
+        # Presisi skor sama dengan NeighbourLists
+        return self._materialize_result(partition.row_ids[positions],
+                                        scores.astype(np.float16).astype(np.float64)), partition.mood
+
+    def _probe_similarities(self, partition, space, row, home):
+        """(similarity ke setiap grup, calories) makanan di luar partisi, dinormalisasi dengan batas
+        partisi seperti user profile"""
+        if home is not None:
+            source, position = home
+        else:
+            source, position = MoodPartition.build(partition.mood, self.food_df, np.array([row])), 0
+        raw = np.clip(source.raw[position], partition.col_min, partition.col_max)
+        features = _min_max_scale(raw, partition.col_min, partition.col_max).astype(np.float32)
+        probe = replace(partition, row_ids=np.array([row]), raw=source.raw[position:position + 1],
+                        features=features[np.newaxis], calories=np.array([source.calories[position]]))
+        selected = tuple(range(len(partition.feature_cols)))
+        return space.similarity(self._partition_features(probe, selected))[0], source.calories[position]
+
+    def meal_plan(self, mood, days=7, health_conditions=None, snacks=1, targets=None,
+                  budget=MEAL_PLAN_BUDGET_MS / 1000):
+        """Plan makan `days` hari dari kandidat recommend_for_mood (lihat solve_meal_plan).
+
+        targets: {nutrisi: total per hari} dalam satuan katalog (nilai ternormalisasi 0-1 per makanan,
+        jadi paling besar jumlah slot per hari; lihat check_meal_plan_targets); nutrisi yang tidak diisi memakai
+        rata-rata kandidat x jumlah slot (hari "tipikal" untuk mood itu). budget (detik) dihitung
+        dari awal pemanggilan, termasuk mengambil kandidat. Hasil: (DataFrame kandidat, MealPlan,
+        nama slot, target harian).
+        """
+        deadline = time.perf_counter() + budget
+        targets = targets or {}
+        unknown = sorted(set(targets) - set(MEAL_PLAN_NUTRIENTS))
+        if unknown:
+            raise ValueError(f"Target tidak dikenal: {unknown}. Pilih dari: {list(MEAL_PLAN_NUTRIENTS)}")
+        if any(not value > 0 for value in targets.values()):
+            raise ValueError("Target nutrisi harus lebih dari 0")
+        slots, shares = meal_plan_slots(snacks)
+        self.check_meal_plan_targets(targets, len(slots))
+        candidates = self.recommend_for_mood(mood, max(MEAL_PLAN_CANDIDATES, 2 * days * len(slots)), health_conditions)
+        if len(candidates) < len(slots):
+            raise ValueError(f"Kandidat makanan terlalu sedikit ({len(candidates)}) untuk {len(slots)} slot per hari")
+        nutrients = candidates[list(MEAL_PLAN_NUTRIENTS)].to_numpy(dtype=np.float64)
+        typical = np.maximum(nutrients.mean(axis=0) * len(slots), 1e-6)
+        daily = np.array([targets.get(name, default) for name, default in zip(MEAL_PLAN_NUTRIENTS, typical)])
+        plan = solve_meal_plan(nutrients / daily, candidates['similarity_score'].to_numpy(), days, shares, deadline)
+        return candidates, plan, slots, daily
+
+    def check_meal_plan_targets(self, targets, slot_count):
+        """ValueError jika target harian di luar jumlah maksimum slot_count makanan. Seperti filter
+        rentang (_check_range): nutrisi katalog dinormalisasi 0-1, jadi target kkal/gram (mis.
+        calories 2000) tidak pernah tercapai dan plan hanya menjauh dari target"""
+        index = self.nutrient_index()
+        for name, value in targets.items():
+            if name not in MEAL_PLAN_NUTRIENTS:
+                continue
+            stored = index.stored_range(name)
+            high = slot_count * max(1.0, stored[1] if stored is not None else 1.0)
+            if not value <= high:
+                raise ValueError(f"Target '{name}': nilai {value:g} di luar rentang per hari "
+                                 f"(0-{high:g} untuk {slot_count} slot; nilai ternormalisasi, bukan kkal/gram)")
+
+    def food_rows_by_name(self, names):
+        """Posisi baris katalog untuk nama makanan yang sama persis (setelah normalize_name); -1 jika tidak ada"""
+        index = self.name_index()
+        if not len(names) or not len(index):
+            return np.full(len(names), -1, dtype=np.int64)
+        lo, hi = index.find_exact([normalize_name(name) for name in names])
+        return np.where(hi > lo, index.sorted_name_rows[np.minimum(lo, len(index) - 1)], -1)
+
+    def _preference_features(self, nutrients):
+        """Nutrisi PREFERENCE_NUTRIENTS (n, 4) relatif terhadap rata-rata katalog"""
+        if self._preference_center is None:
+            self._preference_center = np.array([getattr(self._catalog, name).mean(dtype=np.float64)
+                                                for name in PREFERENCE_NUTRIENTS])
+        return nutrients - self._preference_center
 
-    def _ultimate_fallback(self, mood, top_n, health_conditions):
-        """Ultimate fallback ketika semua gagal"""
-        print("Using ultimate fallback recommendation")
+    def user_preference(self, profile):
+        """(vektor preferensi satuan atau None, kekuatan 0-1) dari makanan yang disukai/dikonsumsi user.
+
+        Vektor = rata-rata berbobot nutrisi makanan itu relatif terhadap rata-rata katalog; kekuatan
+        naik dengan total bobot interaksi (setengah saat mencapai PERSONALIZATION_PRIOR). Di-cache di
+        profil selama katalog dan riwayat suka/konsumsinya sama.
+        """
+        self._ensure_mood_index()
+        catalog, weights = self._catalog, profile.weights
+        resolved = profile.memo.get('preference')
+        if resolved is not None and resolved[0]() is catalog and resolved[1] is weights:
+            return resolved[2], resolved[3]
+        vector, strength = None, 0.0
+        if catalog is not None and weights:
+            rows = self.food_rows_by_name(list(weights))
+            values = np.fromiter(weights.values(), dtype=np.float64, count=len(rows))
+            found = rows >= 0
+            if found.any():
+                rows, values = rows[found], values[found]
+                nutrients = np.column_stack([getattr(catalog, name)[rows] for name in PREFERENCE_NUTRIENTS])
+                vector = values @ self._preference_features(nutrients.astype(np.float64)) / values.sum()
+                norm = np.linalg.norm(vector)
+                if norm > 0:
+                    vector, strength = vector / norm, values.sum() / (values.sum() + PERSONALIZATION_PRIOR)
+                else:
+                    vector = None
+        if catalog is not None:
+            profile.memo['preference'] = (weakref.ref(catalog), weights, vector, strength)
+        return vector, strength
+
+    def personalize(self, recommendations, profile, top_n):
+        """Urutkan ulang kandidat recommend_for_mood untuk satu user, ambil top_n.
+
+        Skor + PERSONALIZATION_WEIGHT x kekuatan x cosine(nutrisi kandidat, vektor preferensi),
+        keduanya relatif terhadap rata-rata katalog. Makanan yang baru ditampilkan (dan tidak
+        disukai/dikonsumsi) ditaruh paling belakang. similarity_score di hasil tetap skor asli.
+        """
+        vector, strength = self.user_preference(profile)
+        scores = recommendations['similarity_score'].to_numpy(dtype=np.float64)
+        if vector is not None and len(recommendations):
+            # Per kolom: df[list kolom] jauh lebih lambat untuk DataFrame sekecil ini
+            features = self._preference_features(np.column_stack([
+                recommendations[name].to_numpy(dtype=np.float64) for name in PREFERENCE_NUTRIENTS]))
+            norms = np.linalg.norm(features, axis=1)
+            scores = scores + PERSONALIZATION_WEIGHT * strength * (features @ vector) / np.where(norms > 0, norms, 1.0)
+        excluded = set(profile.recent).difference(profile.weights)
+        shown = np.array([name in excluded for name in recommendations['name']], dtype=bool)
+        order = np.lexsort((np.arange(len(scores)), -scores, shown))[:top_n]
+        return recommendations.iloc[order]
+
+    def index_recall(self, k=RESULT_TABLE_TOP_K):
+        """recall@k FeatureIndex terhadap skor exact untuk semua profil mood x kondisi kanonik.
+
+        Hasil FeatureIndex dihitung benar jika skor exact-nya tidak di bawah skor exact ke-k
+        (seri di batas top-k boleh tertukar). Semua partisi diukur berapa pun ukurannya;
+        profil yang gagal (dan memakai ultimate fallback di kedua mode) dilewati.
+        """
+        self._ensure_mood_index()
+        conditions = self.health_rules().conditions
+        recalls, identical = [], 0
+        for mood in MOOD_FILTERS:
+            for r in range(len(conditions) + 1):
+                for subset in itertools.combinations(conditions, r):
+                    try:
+                        query = self._prepare_similarity_query(self._build_user_profile(mood, list(subset)))
+                    except Exception:
+                        continue
+                    if query.partition is None:
+                        continue
+                    partition = query.partition
+                    similarities = self._weighted_cosine_similarity(
+                        partition, query.selected, query.user_scaled[np.newaxis, :], query.weights
+                    )[0]
+                    if query.health_conditions:
+                        similarities = self._apply_health_penalties(partition, similarities, query.health_conditions)
+                    expected = self._rank_partition(partition, similarities, query.target_mood, k)
+                    actual, _ = self._rank_with_index(query, k)
+                    if len(expected) == 0:
+                        continue
+                    # row_ids partisi urut naik, jadi posisi baris bisa dicari balik
+                    exact_scores = similarities[np.searchsorted(partition.row_ids, actual)]
+                    kth = similarities[expected[-1]] - ANN_SCORE_TOLERANCE
+                    recalls.append(int((exact_scores >= kth).sum()) / len(expected))
+                    identical += int(np.array_equal(partition.row_ids[expected], actual))
+        return {
+            "k": k,
+            "profiles": len(recalls),
+            "mean": float(np.mean(recalls)) if recalls else None,
+            "min": float(np.min(recalls)) if recalls else None,
+            "identical": identical,
+            "cells": {mood: self.feature_index(mood).cells for mood in self._mood_index},
+        }
+
+    def catalog_size(self):
+        """Jumlah makanan di katalog (tanpa membangun food_df dari artifact)"""
+        self._ensure_mood_index()
+        return len(self._catalog) if self._catalog is not None else len(self.food_df)
+
+    def name_index(self):
+        """Indeks nama makanan (posisi baris = posisi katalog/food_df); dibangun saat pertama dibutuhkan"""
+        self._ensure_mood_index()
+        merge = self._name_index_merge
+        if self._name_index is None and merge is not None:
+            self._name_index = merge()
+            self._name_index_merge = None
+        if self._name_index is None:
+            if self._catalog is not None:
+                names = self._catalog.names(range(len(self._catalog)))
+            else:
+                names = self.food_df['name'].fillna('').astype(str).tolist()
+            self._name_index = FoodNameIndex.build(names)
+        return self._name_index
+
+    def search_foods(self, query, limit=10, offset=0):
+        """Cari makanan berdasarkan nama; (DataFrame hasil dengan kolom 'match', total)"""
+        rows, kinds, similarity, total = self.name_index().search(query, limit=limit, offset=offset)
+        result = self._materialize_result(rows, similarity)
+        result['match'] = [NAME_MATCH_KINDS[kind] for kind in kinds.tolist()]
+        return result, total
+
+    def nutrient_index(self):
+        """Indeks filter rentang nutrisi/kategori katalog; dibangun saat pertama dibutuhkan"""
+        self._ensure_mood_index()
+        if self._nutrient_index is None:
+            if self._catalog is None:
+                raise ValueError("Katalog tidak lengkap, filter rentang nutrisi tidak tersedia")
+            self._nutrient_index = NutrientIndex.build(self._catalog)
+        return self._nutrient_index
+
+    def range_bounds(self, filters):
+        """{nama filter: (min, max)} -> tuple (kolom katalog, min, max) urut nama filter, untuk
+        NutrientIndex.select dan kunci cache. Kategori boleh berupa nama ('low', ...).
+        ValueError jika filter tidak dikenal atau nilainya tidak valid."""
+        columns = self.nutrient_index().values
+        bounds = []
+        for name, limits in sorted(filters.items()):
+            column = RANGE_FILTER_COLUMNS.get(name)
+            if column not in columns:
+                raise ValueError(f"Filter '{name}' tidak dikenal. Pilihan: "
+                                 f"{', '.join(n for n, c in RANGE_FILTER_COLUMNS.items() if c in columns)}")
+            low, high = (self._range_value(name, column, value) for value in limits)
+            self._check_range(name, column, low, high)
+            if low is None and high is None:
+                continue
+            if low is not None and high is not None and low > high:
+                raise ValueError(f"Filter '{name}': min lebih besar dari max")
+            bounds.append((column, low, high))
+        return tuple(bounds)
+
+    def _range_value(self, name, column, value):
+        if isinstance(value, str):
+            code = self.category_mapping.get(value.lower()) if column.endswith('_category_num') else None
+            if code is None:
+                raise ValueError(f"Filter '{name}': nilai '{value}' tidak valid")
+            return float(code)
+        if value is None:
+            return None
+        if not math.isfinite(value):
+            raise ValueError(f"Filter '{name}': nilai harus berhingga")
+        return float(value)
+
+    def _check_range(self, name, column, low, high):
+        # Nilai nutrisi katalog dinormalisasi min-max (0-1), bukan kkal/gram: batas di luar rentang
+        # kolom tidak pernah menyaring apa pun (mis. max 300), jadi ditolak daripada diam-diam diabaikan
+        if column.endswith('_category_num'):
+            lo, hi, unit = 0.0, float(max(self.category_mapping.values())), "kode kategori"
+        else:
+            lo, hi, unit = 0.0, 1.0, "nilai ternormalisasi, bukan kkal/gram"
+        stored = self.nutrient_index().stored_range(column)
+        if stored is not None:
+            lo, hi = min(lo, stored[0]), max(hi, stored[1])
+        for value in (low, high):
+            if value is not None and not lo <= value <= hi:
+                raise ValueError(f"Filter '{name}': nilai {value:g} di luar rentang kolom "
+                                 f"({lo:g}-{hi:g}, {unit})")
+
+    def query_foods(self, filters, mood=None, health_conditions=None, limit=10, offset=0):
+        """Makanan yang memenuhi semua filter rentang; (DataFrame hasil, total).
+
+        Tanpa mood: urutan katalog, similarity_score NaN. Dengan mood: hanya makanan di partisi
+        mood, diurutkan seperti recommend_for_mood. health_conditions hanya berlaku dengan mood
+        (penalti kondisi adalah bagian skor); tanpa mood ValueError, bukan diabaikan diam-diam.
+        """
+        if mood is None and health_conditions:
+            raise ValueError("health_conditions hanya bisa dipakai bersama mood")
+        bounds = self.range_bounds(filters)
+        rows = self.nutrient_index().select(bounds) if bounds else np.arange(self.catalog_size())
+        if mood is None:
+            page = rows[offset:offset + limit]
+            return self._materialize_result(page, np.full(len(page), np.nan)), len(rows)
+
+        mood = mood if mood in MOOD_FILTERS else 'neutral'
+        total = len(_sorted_positions(self.get_mood_partition(mood).row_ids, rows))
+        recommendations = self._compute_recommendations(mood, offset + limit, health_conditions, rows=rows)
+        return recommendations.iloc[offset:], total
+
+    def find_food_rows(self, food_name, exact=False):
+        """Posisi baris makanan yang namanya memuat (atau sama dengan, jika exact) food_name; tanpa fuzzy"""
+        rows, kinds, _, _ = self.name_index().search(food_name, limit=None, fuzzy=False)
+        if exact:
+            return rows[kinds == NAME_MATCH_KINDS.index('exact')]
+        return rows
+
+    def frame_schema(self):
+        """(kolom, dtype) food_df; untuk model dari artifact diambil dari manifest tanpa membangun food_df"""
+        if self._food_df is not None or self._frame_schema is None:
+            return tuple(self.food_df.dtypes.items())
+        return self._frame_schema
+
+    def food_rows(self, items):
+        """DataFrame makanan baru (kolom dan dtype sama dengan food_df) dari dict nilai dasar.
+
+        Kolom turunan diisi seperti preprocessing notebook: *_category_num dari *_category,
+        nutrient_balance_num dari nutrient_balance, primary_mood_num/mood_<m> dari primary_mood,
+        dan is_<mood> (jika tidak diisi) = primary_mood == mood. Kolom lain yang tidak diisi
+        bernilai 0 (numerik) atau kosong (string). ValueError jika ada nilai yang tidak valid.
+        """
+        schema = dict(self.frame_schema())
+        categories = [column[:-len('_num')] for column in schema if column.endswith('_category_num')]
+        for item in items:
+            name = item.get('name')
+            if not isinstance(name, str) or not name.strip():
+                raise ValueError("Nama makanan wajib diisi")
+            unknown = [key for key, value in item.items() if value is not None and key not in schema]
+            if unknown:
+                raise ValueError(f"Kolom {unknown} tidak ada di katalog ('{name}')")
+            if item.get('primary_mood') not in self.mood_mapping:
+                raise ValueError(f"primary_mood '{item.get('primary_mood')}' tidak dikenal ('{name}')")
+            for column in categories:
+                if item.get(column) not in MOOD_CATEGORY_MAPPING:
+                    raise ValueError(f"{column} '{item.get(column)}' tidak dikenal ('{name}'; "
+                                     f"pilih {', '.join(MOOD_CATEGORY_MAPPING)})")
+            if 'nutrient_balance_num' in schema and item.get('nutrient_balance') not in NUTRIENT_BALANCE_MAPPING:
+                raise ValueError(f"nutrient_balance '{item.get('nutrient_balance')}' tidak dikenal ('{name}'; "
+                                 f"pilih {', '.join(NUTRIENT_BALANCE_MAPPING)})")
+
+        flag_moods = {column: mood for mood, column in MOOD_FLAG_COLUMNS.items()}
+        columns = {}
+        for column, dtype in schema.items():
+            if column.endswith('_category_num'):
+                values = [MOOD_CATEGORY_MAPPING[item[column[:-4]]] for item in items]
+            elif column == 'nutrient_balance_num':
+                values = [NUTRIENT_BALANCE_MAPPING[item['nutrient_balance']] for item in items]
+            elif column == 'primary_mood_num':
+                values = [self.encode_mood(item['primary_mood']) for item in items]
+            elif column.startswith('mood_'):
+                values = [item['primary_mood'] == column[len('mood_'):] for item in items]
+            elif column in flag_moods:
+                values = [item[column] if item.get(column) is not None else int(item['primary_mood'] == flag_moods[column])
+                          for item in items]
+            else:
+                default = None if dtype == object else 0
+                values = [item[column] if item.get(column) is not None else default for item in items]
+            try:
+                columns[column] = np.array(values, dtype=dtype)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Nilai kolom '{column}' tidak valid: {e}") from e
+            if dtype.kind == 'f' and not np.isfinite(columns[column]).all():
+                raise ValueError(f"Nilai kolom '{column}' harus berupa angka terhingga")
+        return pd.DataFrame(columns, index=pd.RangeIndex(len(items)))
+
+    def apply_updates(self, upserts=(), deletes=()):
+        """Recommender baru dengan upserts (dict untuk food_rows) ditambahkan atau menggantikan
+        makanan bernama sama, dan makanan bernama deletes dihapus; self tidak diubah.
+
+        Katalog, partisi mood, indeks nama dan tabel hasil diperbarui inkremental: min/max
+        tiap kolom fitur dipertahankan dan kolom hanya dinormalisasi ulang jika batasnya
+        bergeser, lalu profil tabel hasil hanya dihitung ulang penuh jika batas mood-nya
+        bergeser; selain itu top-K lama yang tersisa digabung dengan baris baru di partisi dan
+        diranking ulang (diisi ulang dari partisi jika baris top-K yang dihapus/diganti membuat
+        hasilnya tidak pasti). Makanan yang diganti tetap di posisi
+        barisnya, makanan baru ditambahkan di akhir, dan posisi setelah baris yang dihapus bergeser.
+        Hasil (recommender baru, statistik).
+        """
+        self._ensure_mood_index()
+        if self._catalog is None:
+            raise ValueError("Katalog belum tersedia, update tidak bisa diterapkan")
+        items = {}
+        for item in upserts:
+            items[item.get('name')] = item  # nama sama dalam satu batch: yang terakhir dipakai
+        deletes = list(dict.fromkeys(deletes))
+        both = [name for name in deletes if name in items]
+        if both:
+            raise ValueError(f"Makanan {both[:5]} ada di upserts sekaligus deletes")
+        added = self.food_rows(list(items.values()))  # validasi sebelum katalog disentuh
+        added_index = FoodNameIndex.build(added['name'].tolist())
+
+        # Identitas makanan = nama persis; dicari lewat indeks nama (nama ter-normalisasi) lalu dicek
+        n = len(self._catalog)
+        names = list(items) + deletes
+        index = self.name_index()
+        lo, hi = index.find_exact(added_index.normalized(range(len(added))) + [normalize_name(name) for name in deletes])
+        matched = [(name, np.sort(index.sorted_name_rows[start:stop]).tolist())
+                   for name, start, stop in zip(names, lo.tolist(), hi.tolist()) if stop > start]
+        stored = iter(self._catalog.names([row for _, candidates in matched for row in candidates]))
+        rows = {}
+        for name, candidates in matched:
+            found = [row for row in candidates if next(stored) == name]
+            if found:
+                rows[name] = found
+
+        removed = [row for name in deletes for row in rows.get(name, ())]
+        deleted = len(removed)
+        source_of = np.arange(n)
+        inserted = []  # posisi baris added yang ditambahkan di akhir
+        for i, name in enumerate(items):
+            if name in rows:
+                source_of[rows[name][0]] = n + i  # diganti di posisinya
+                removed.extend(rows[name][1:])   # duplikat nama lama ikut diganti oleh satu baris
+            else:
+                inserted.append(n + i)
+        keep = np.ones(n, dtype=bool)
+        keep[removed] = False
+        sources = np.concatenate([source_of[keep], np.array(inserted, dtype=np.int64)])
+        new_of = np.full(n + len(added), -1, dtype=np.int64)
+        new_of[sources] = np.arange(len(sources))
+
+        updated = type(self).__new__(type(self))
+        updated.__dict__.update({key: value for key, value in self.__dict__.items()
+                                 if key not in self._RUNTIME_ATTRS and key != '_food_df'})
+        updated._init_runtime_state()
+        updated._catalog = self._catalog.merged(FoodCatalog.build(added), sources)
+        updated._frame_schema = self.frame_schema()
+        updated._search_mode = self._search_mode
+        updated._result_table_enabled = self._result_table_enabled
+        base = self._food_df if self._food_df is not None else self._food_df_loader
+        updated._food_df = None
+        updated._food_df_loader = partial(_updated_frame, base, sources, added)
+
+        partitions, renormalized, rebuilt = {}, {}, []
+        for mood, old in self._mood_index.items():
+            column, value = MOOD_FILTERS[mood]
+            mask = updated._catalog.filter_mask(column, value)
+            members = np.flatnonzero(mask) if mask is not None else None
+            if members is not None and len(members) == 0:
+                members = np.arange(len(sources))  # sama seperti _build_mood_index: semua makanan
+            if members is not None:
+                member_sources = sources[members]
+                from_self = member_sources < n
+                positions = np.searchsorted(old.row_ids, member_sources[from_self])
+                positions[positions == len(old.row_ids)] = 0
+            if members is None or not np.array_equal(old.row_ids[positions], member_sources[from_self]):
+                # Baris lama masuk partisi (mis. partisi sebelumnya kosong): bangun penuh dari food_df baru
+                rebuilt.append(mood)
+                continue
+            take = np.empty(len(members), dtype=np.int64)
+            take[from_self] = positions
+            take[~from_self] = len(old.row_ids) + np.arange(int((~from_self).sum()))
+            added_part = MoodPartition.build(mood, added, member_sources[~from_self] - n)
+            partitions[mood], moved = old.updated(added_part, take, members)
+            if moved:
+                renormalized[mood] = moved
+        if rebuilt:
+            frame = updated.food_df
+            for mood in rebuilt:
+                column, value = MOOD_FILTERS[mood]
+                row_ids = np.flatnonzero((frame[column] == value).to_numpy())
+                partitions[mood] = MoodPartition.build(mood, frame, row_ids if len(row_ids) else np.arange(len(frame)))
+        updated._mood_index = MappingProxyType({mood: partitions[mood] for mood in self._mood_index})
+
+        updated._name_index_merge = partial(index.merged, added_index, sources)
+        # Daftar tetangga: digabung dengan baris baru saat pertama dibutuhkan; partisi yang
+        # dinormalisasi ulang dibangun ulang penuh
+        fresh = sources >= n
+        for mood, lists in list(self._neighbour_lists.items()):
+            if mood in partitions and mood not in renormalized and mood not in rebuilt:
+                updated._neighbour_merges[mood] = partial(updated._merged_neighbour_lists, partitions[mood],
+                                                          self._mood_index[mood], lists, new_of, fresh)
+        ranking_stats = None
+        if self._result_table is not None:
+            recompute = set(renormalized) | set(rebuilt)
+            recompute.update(mood for mood, partition in partitions.items()
+                             if updated._use_feature_index(partition, RESULT_TABLE_TOP_K))
+            updated._result_table, ranking_stats = updated._updated_result_table(
+                self._result_table, new_of, new_of[n:], recompute)
+
+        stats = {
+            "inserted": len(inserted),
+            "updated": len(items) - len(inserted),
+            "deleted": deleted,
+            "not_found": [name for name in deletes if name not in rows],
+            "catalog_size": len(sources),
+            "renormalized": renormalized,
+            "rebuilt_partitions": rebuilt,
+            "rankings": ranking_stats,
+        }
+        log_event("catalog.updated", level=logging.INFO, **{key: value for key, value in stats.items() if key != 'not_found'})
+        return updated, stats
+
+    def _updated_result_table(self, table, new_of, added_rows, recompute):
+        """Tabel hasil setelah apply_updates (dipanggil pada recommender baru).
+
+        new_of memetakan posisi baris lama ke baru (-1 = dihapus/diganti), added_rows posisi baru
+        baris tambahan (termasuk pengganti). Profil mood di recompute dinilai ulang atas seluruh
+        partisi. Lainnya cukup meranking ulang top-K lama yang tersisa + baris baru di partisi:
+        baris lain tidak masuk top-K lama, jadi kalah dari setiap baris top-K lama yang tersisa.
+        Jika top-K kehilangan baris, hasil gabungan hanya pasti sampai baris lama terakhir; bila
+        itu kurang dari K, profil diisi ulang dari seluruh partisi. Profil per mood dinilai
+        bersama (satu perkalian matriks per fitur dan bobot, seperti recommend_batch), sehingga
+        skor bisa beda beberapa ulp dari build penuh.
+        """
+        added_rows = np.sort(added_rows[added_rows >= 0])
+        in_partition = {mood: added_rows[np.isin(added_rows, partition.row_ids, assume_unique=True)]
+                        for mood, partition in self._mood_index.items()}
+        counts = Counter(kept=0, merged=0, recomputed=0, refilled=0)
+        updated, jobs = {}, {}
+        for (mood, conditions), (row_ids, scores, fallback) in table.items():
+            key = (mood, conditions)
+            mapped = new_of[row_ids]
+            lost = bool((mapped < 0).any())
+            full = mood in recompute or (lost and fallback is not None)
+            if fallback == 'ultimate_fallback':
+                mask = self._catalog.mood_mask(mood)
+                fresh = added_rows[mask[added_rows]] if mask is not None else added_rows
+            else:
+                partition = self.get_mood_partition(mood)
+                fresh = in_partition[partition.mood]
+            if not full and not lost and len(fresh) == 0:
+                updated[key] = (mapped, scores, fallback)
+                counts['kept'] += 1
+                continue
+            health_conditions = sorted(conditions) or None
+            if full and (fallback is not None or self._use_feature_index(partition, RESULT_TABLE_TOP_K)):
+                updated[key] = self._result_table_entry(mood, conditions)
+                counts['recomputed'] += 1
+            elif fallback == 'ultimate_fallback':
+                updated[key] = self._ultimate_fallback_ranking(
+                    mood, RESULT_TABLE_TOP_K, health_conditions, np.union1d(mapped, fresh))
+                counts['merged'] += 1
+            elif fallback == 'fallback_sorting':
+                updated[key] = self._fallback_sorting(np.union1d(mapped, fresh), mood)
+                counts['merged'] += 1
+            else:
+                try:
+                    query = self._prepare_similarity_query(self._build_user_profile(mood, health_conditions))
+                except Exception:
+                    updated[key] = self._result_table_entry(mood, conditions)
+                    counts['recomputed'] += 1
+                    continue
+                # top-K lama kurang dari K baris = seluruh partisi sudah di dalamnya
+                exhaustive = len(row_ids) < RESULT_TABLE_TOP_K
+                jobs.setdefault((mood, full), []).append((key, query, mapped[mapped >= 0], fresh, exhaustive))
+
+        refill = {}
+        for (mood, full), members in jobs.items():
+            for key, query, survivors, entry in self._rank_table_profiles(mood, full, members):
+                if full or entry is not None:
+                    updated[key] = entry
+                    counts['recomputed' if full else 'merged'] += 1
+                else:
+                    refill.setdefault(mood, []).append((key, query, survivors, None, True))
+        for mood, members in refill.items():
+            for key, _, _, entry in self._rank_table_profiles(mood, True, members):
+                updated[key] = entry
+                counts['refilled'] += 1
+        return updated, dict(counts)
+
+    def _rank_table_profiles(self, mood, full, members):
+        """Nilai profil jalur similarity satu mood atas seluruh partisi (full) atau gabungan semua
+        kandidat profil mood itu; yield (key, query, survivors, entry). Entry None jika top-K
+        gabungan tidak pasti (baris di luar kandidat bisa masuk) dan perlu diisi ulang."""
+        partition = self.get_mood_partition(mood)
+        if not full:
+            candidates = np.union1d(np.concatenate([survivors for _, _, survivors, _, _ in members]), members[0][3])
+            partition = partition.subset(np.searchsorted(partition.row_ids, candidates))
+        groups = {}
+        for member in members:
+            query = member[1]
+            groups.setdefault((query.selected, query.weights.tobytes()), []).append(member)
+        for group in groups.values():
+            selected, weights = group[0][1].selected, group[0][1].weights
+            user_matrix = np.vstack([query.user_scaled for _, query, _, _, _ in group])
+            similarity_matrix = self._weighted_cosine_similarity(partition, selected, user_matrix, weights)
+            for (key, query, survivors, _, exhaustive), similarities in zip(group, similarity_matrix):
+                if query.health_conditions:
+                    similarities = self._apply_health_penalties(partition, similarities, query.health_conditions)
+                order = self._rank_partition(partition, similarities, query.target_mood)
+                rows = partition.row_ids[order]
+                # Pasti jika ada baris lama yang tersisa di luar hasil, atau hasil penuh K dan
+                # berakhir di baris lama: baris di luar kandidat selalu kalah dari baris lama
+                certain = (full or exhaustive or np.isin(survivors, rows).sum() < len(survivors)
+                           or len(rows) == RESULT_TABLE_TOP_K and rows[-1] in survivors)
+                yield key, query, survivors, ((rows, similarities[order], None) if certain else None)
+
+    def ranking(self, mood, health_conditions=None):
+        """Urutan lengkap (posisi baris, skor, fallback) semua makanan untuk satu profil.
+
+        Dipakai untuk pagination dan streaming; di-cache per (mood, kondisi) sehingga
+        halaman berikutnya hanya memotong array yang sama.
+        """
+        mood = mood if mood in MOOD_FILTERS else 'neutral'
+        self._ensure_mood_index()
+        key = (mood, tuple(health_conditions or ()))
+        ranked = self._ranking_cache.get(key)
+        if ranked is None:
+            n = len(self._catalog)
+            try:
+                ranked = self._rank_foods(self._build_user_profile(mood, health_conditions), StageTimer(), n)
+            except Exception as e:
+                logger.warning("Error in full ranking, using ultimate fallback: %s", e)
+                ranked = self._ultimate_fallback_ranking(mood, n, health_conditions)
+            for array in ranked[:2]:
+                array.setflags(write=False)
+            self._ranking_cache.put(key, ranked)
+        return ranked
+
+    def ranking_slice(self, ranked, start, stop):
+        """DataFrame hasil untuk posisi [start, stop) dari ranked (hasil ranking())"""
+        row_ids, scores, fallback = ranked
+        return self._materialize_result(row_ids[start:stop], scores[start:stop], fallback)
+
+    def catalog_fingerprint(self):
+        """Hash isi katalog; cursor pagination hanya berlaku untuk katalog yang sama"""
+        self._ensure_mood_index()
+        if self._catalog_fingerprint is None:
+            catalog = self._catalog
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(str(len(catalog)).encode())
+            for array in [getattr(catalog, field) for field in FoodCatalog.ARRAY_FIELDS] + list(catalog.categories.values()):
+                digest.update(np.ascontiguousarray(array).data)
+            self._catalog_fingerprint = digest.hexdigest()
+        return self._catalog_fingerprint
+
+    def invalidate_results(self):
+        """Buang tabel hasil dan semua cache (dipanggil saat katalog berubah)"""
+        self._result_table = None
+        self._result_cache.clear()
+        self._ranking_cache.clear()
+        self._catalog_fingerprint = None
+
+    def cache_stats(self):
+        """Statistik tabel hasil dan LRU cache untuk /health"""
+        return {
+            "result_table": {
+                "enabled": self._result_table_enabled,
+                "profiles": len(self._result_table) if self._result_table is not None else 0,
+                "hits": self._result_table_hits,
+                "misses": self._result_table_misses,
+            },
+            "lru": self._result_cache.stats(),
+            "ranking": self._ranking_cache.stats(),
+        }
+
+    def search_stats(self):
+        """Mode pencarian similarity dan jumlah sel FeatureIndex per mood untuk /health"""
+        return {
+            "mode": self._search_mode,
+            "index_cells": {mood: index.cells for mood, index in list(self._feature_indexes.items())},
+        }
+
+    def _ultimate_fallback(self, mood, top_n, health_conditions, rows=None):
+        """Ultimate fallback ketika semua gagal; rows (filter rentang) diiris dengan filter mood"""
+        if rows is not None:
+            mask = self._catalog.mood_mask(mood, rows)
+            rows = rows[mask] if mask is not None else rows
+        return self._materialize_result(*self._ultimate_fallback_ranking(mood, top_n, health_conditions, rows))
+
+    def _ultimate_fallback_ranking(self, mood, top_n, health_conditions, row_ids=None):
+        """Urutan ultimate fallback: (posisi baris, skor, fallback); row_ids (urut naik) membatasi
+        kandidat, mis. saat tabel hasil diperbarui inkremental"""
+        log_event("recommend.ultimate_fallback", level=logging.INFO, mood=mood, health_conditions=health_conditions)
+        catalog = self._catalog
         
         # Filter berdasarkan mood
-        if mood == 'energizing' and 'is_energizing' in self.food_df.columns:
-            filtered_df = self.food_df[self.food_df['is_energizing'] == 1]
-        elif mood == 'relaxing' and 'is_relaxing' in self.food_df.columns:
-            filtered_df = self.food_df[self.food_df['is_relaxing'] == 1]
-        elif mood == 'focusing' and 'is_focusing' in self.food_df.columns:
-            filtered_df = self.food_df[self.food_df['is_focusing'] == 1]
-        else:
-            filtered_df = self.food_df
+        if row_ids is None:
+            mask = catalog.mood_mask(mood)
+            row_ids = np.flatnonzero(mask) if mask is not None else np.arange(len(catalog))
         
-        # Simple health filtering
-        if health_conditions:
-            if 'diabetes' in health_conditions:
-                # Prioritas karbohidrat rendah
-                filtered_df = filtered_df.sort_values(['carb_category_num', 'calories'])
-            elif 'kolesterol' in health_conditions:
-                # Prioritas lemak rendah
-                filtered_df = filtered_df.sort_values(['fat_category_num', 'calories'])
-            else:
-                # Default sorting berdasarkan mood
-                if mood == 'energizing':
-                    filtered_df = filtered_df.sort_values('calories', ascending=False)
-                elif mood == 'focusing':
-                    filtered_df = filtered_df.sort_values('proteins', ascending=False)
-                elif mood == 'relaxing':
-                    filtered_df = filtered_df.sort_values('calories', ascending=True)
+        # Key urutan (seperti np.lexsort: key terakhir paling utama)
+        calories, proteins = catalog.calories[row_ids], catalog.proteins[row_ids]
+        if health_conditions and 'diabetes' in health_conditions:
+            # Prioritas karbohidrat rendah
+            keys = (calories, catalog.categories['carb_category_num'][row_ids])
+        elif health_conditions and 'kolesterol' in health_conditions:
+            # Prioritas lemak rendah
+            keys = (calories, catalog.categories['fat_category_num'][row_ids])
+        elif mood == 'energizing':
+            # Default sorting berdasarkan mood
+            keys = (-calories,)
+        elif mood == 'focusing':
+            keys = (-proteins,)
+        elif mood == 'relaxing':
+            keys = (calories,)
         else:
-            # No health conditions - sort by mood preference
-            if mood == 'energizing':
-                filtered_df = filtered_df.sort_values('calories', ascending=False)
-            elif mood == 'focusing':
-                filtered_df = filtered_df.sort_values('proteins', ascending=False)
-            elif mood == 'relaxing':
-                filtered_df = filtered_df.sort_values('calories', ascending=True)
+            keys = None  # Urutan katalog
         
-        result_df = filtered_df.copy()
-        result_df['similarity_score'] = 0.5  # Fallback score
+        k = top_n if top_n >= 0 else max(len(row_ids) + top_n, 0)  # semantik head(top_n)
+        order = top_k_order(keys, k) if keys is not None else np.arange(min(k, len(row_ids)))
         
-        return result_df.head(top_n)[['name', 'calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'similarity_score']]
+        # Fallback score 0.5
+        return row_ids[order], np.full(len(order), 0.5), 'ultimate_fallback'
+
+# Snapshot model yang melayani request. Startup dan reload membangun snapshot lengkap (katalog,
+# indeks, tabel hasil) sebelum di-install, sehingga request tidak pernah melihat model setengah jadi.
+PICKLE_PATH = 'models/food_recommender.pkl'
+RELOAD_POLL_SECONDS = float(os.getenv('NUTRIMOOD_RELOAD_POLL_SECONDS', '0'))  # 0 = file watcher mati
+ADMIN_TOKEN = os.getenv('NUTRIMOOD_ADMIN_TOKEN')  # tanpa token, endpoint /admin dimatikan (404)
+SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))  # worker gunicorn (gunicorn.conf.py)
+VALIDATION_MOODS = ('energizing', 'relaxing', 'focusing', 'neutral')
+
+@dataclass(frozen=True, eq=False)
+class ModelSnapshot:
+    """Recommender dan mood classifier yang dimuat bersama; tidak diubah setelah di-install"""
+    recommender: FoodRecommender
+    mood_classifier: Optional[MoodClassifier]
+    version: str      # hash isi katalog + bobot classifier, sama di proses utama dan worker process
+    source: str       # 'artifact' atau 'pickle'
+    loaded_at: float  # epoch detik
+
+SNAPSHOT = None  # snapshot untuk request baru; ditukar hanya di thread event loop (install_snapshot)
+
+def serving_snapshot():
+    """Snapshot yang di-pin request ini, atau SNAPSHOT terbaru di luar request (warm-up, worker process)"""
+    return _pinned_snapshot.get() or SNAPSHOT
+
+def serving_recommender():
+    snapshot = serving_snapshot()
+    return snapshot.recommender if snapshot is not None else None
+
+def serving_classifier():
+    snapshot = serving_snapshot()
+    return snapshot.mood_classifier if snapshot is not None else None
+
+def model_source():
+    """'artifact', atau 'pickle' jika artifact belum dibuat atau lebih lama dari pickle"""
+    manifest = os.path.join(ARTIFACT_PATH, 'manifest.json')
+    if os.path.exists(manifest):
+        if os.path.exists(PICKLE_PATH) and os.path.getmtime(PICKLE_PATH) > os.path.getmtime(manifest):
+            logger.warning("%s lebih baru dari artifact; jalankan convert_model.py", PICKLE_PATH)
+            return 'pickle'
+        return 'artifact'
+    if os.path.exists(PICKLE_PATH):
+        return 'pickle'
+    raise FileNotFoundError(f"Model tidak ditemukan ({ARTIFACT_PATH} atau {PICKLE_PATH})")
+
+def load_food_recommender(precompute, source=None):
+    """Load artifact berversi, atau pickle lama (lihat model_source)"""
+    if (source or model_source()) == 'artifact':
+        # Artifact berversi (lihat convert_model.py): array di-mmap, food_df dibangun saat dibutuhkan
+        return FoodRecommender.load_artifact(
+            ARTIFACT_PATH,
+            verify=os.getenv('NUTRIMOOD_ARTIFACT_VERIFY', '1') == '1',
+            load_result_table=precompute
+        )
+    # Format lama; pickle hanya di-import untuk jalur ini
+    import pickle
+    import sys
+    # Fix module reference untuk pickle
+    sys.modules['__main__'].FoodRecommender = FoodRecommender
+
+    # Load food recommender dari pickle
+    with open(PICKLE_PATH, 'rb') as f:
+        recommender = pickle.load(f)
+    logger.warning("Memakai pickle lama; jalankan convert_model.py untuk membuat artifact")
+    return recommender
+
+def load_mood_classifier():
+    """Opsional: tanpa classifier, /predict-mood mengembalikan 503"""
+    try:
+        return MoodClassifier.load(MOOD_CLASSIFIER_PATH)
+    except Exception as e:
+        logger.warning("Mood classifier tidak dimuat (%s); jalankan export_mood_model.py", e)
+        return None
+
+def snapshot_version(recommender, classifier):
+    """Versi deterministik dari isi model: proses yang memuat file yang sama mendapat versi yang sama"""
+    digest = hashlib.blake2b(recommender.catalog_fingerprint().encode(), digest_size=6)
+    if classifier is not None:
+        for array in classifier.weights + classifier.biases:
+            digest.update(array.tobytes())
+        digest.update('\0'.join(classifier.labels).encode())
+    return digest.hexdigest()
+
+def build_snapshot(precompute, timings, mark=None, warm=True):
+    """Muat model dari disk dan bangun semua indeksnya; belum melayani request sampai di-install.
+    timings: detik per tahap (MODEL_LOAD_SECONDS saat startup), mark: READINESS.mark saat startup"""
+    start = time.perf_counter()
+    classifier = load_mood_classifier()
+    if classifier is not None:
+        timings['mood_classifier'] = time.perf_counter() - start
+    source = model_source()
+    start = time.perf_counter()
+    recommender = load_food_recommender(precompute, source)
+    timings['model'] = time.perf_counter() - start
+    if mark:
+        mark('catalog_loaded')
+
+    recommender.catalog_size()  # memastikan indeks mood sudah ada
+    recommender.check_health_rules()  # aturan yang tidak cocok dengan model gagal di sini, bukan per request
+    start = time.perf_counter()
+    recommender.name_index()
+    timings['name_index'] = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        recommender.nutrient_index()
+        timings['nutrient_index'] = time.perf_counter() - start
+    except ValueError as e:
+        logger.warning("Filter rentang nutrisi tidak tersedia: %s", e)
+    recommender.set_search_mode(SEARCH_MODE)
+    if SEARCH_MODE == 'ann':
+        start = time.perf_counter()
+        recommender.build_feature_indexes()
+        timings['feature_index'] = time.perf_counter() - start
+    version = snapshot_version(recommender, classifier)  # sekaligus fingerprint katalog (ETag, cursor)
+    if mark:
+        mark('indices_built')
+    if warm and precompute:
+        start = time.perf_counter()
+        recommender.enable_result_table()
+        timings['result_table'] = time.perf_counter() - start
+        start = time.perf_counter()
+        recommender.build_neighbour_lists()  # sudah ada jika dimuat dari artifact
+        timings['neighbour_lists'] = time.perf_counter() - start
+    return ModelSnapshot(recommender, classifier, version, source, time.time())
+
+def validate_snapshot(snapshot, previous=None):
+    """Cek snapshot baru sebelum di-install; ValueError jika tidak layak melayani"""
+    recommender = snapshot.recommender
+    if not recommender.is_loaded() or recommender.catalog_size() == 0:
+        raise ValueError("Katalog kosong")
+    recommender.check_health_rules()
+    for mood in VALIDATION_MOODS:
+        recommendations = recommender.recommend_for_mood(mood, RESULT_TABLE_TOP_K)
+        if recommendations.empty:
+            raise ValueError(f"Tidak ada rekomendasi untuk mood {mood}")
+        if recommendations.attrs.get('fallback') == 'ultimate_fallback':
+            raise ValueError(f"Similarity untuk mood {mood} gagal dihitung (ultimate fallback)")
+        if not np.isfinite(recommendations['similarity_score'].to_numpy()).all():
+            raise ValueError(f"Skor similarity mood {mood} tidak valid")
+        json_bytes(food_item_dicts(recommendations))  # nilai NaN/None yang tidak bisa dilayani
+    classifier = snapshot.mood_classifier
+    if classifier is None:
+        if previous is not None and previous.mood_classifier is not None:
+            raise ValueError("Mood classifier gagal dimuat")
+        return
+    probabilities = classifier.predict_proba([[MOOD_CATEGORY_DEFAULT] * len(MOOD_CLASSIFIER_FEATURES)])
+    if probabilities.shape != (1, len(classifier.labels)) or not np.isfinite(probabilities).all():
+        raise ValueError("Output mood classifier tidak valid")
+
+def install_snapshot(snapshot, process_pool=None):
+    """Tukar snapshot untuk request baru (di thread event loop). Request yang sudah berjalan tetap
+    memakai snapshot yang di-pin; process_pool: pool baru yang worker-nya sudah memuat snapshot ini"""
+    global SNAPSHOT
+    previous, SNAPSHOT = SNAPSHOT, snapshot
+    if READINESS.error is not None:
+        # Startup gagal memuat model; reload pertama yang berhasil memulihkan readiness
+        READINESS.error = None
+        for stage in Readiness.REQUIRED:
+            READINESS.mark(stage)
+    if process_pool is not None:
+        PROCESS_EXECUTOR.replace_pool(process_pool)
+    log_event("snapshot.installed", level=logging.INFO, version=snapshot.version, source=snapshot.source,
+              previous=previous.version if previous is not None else None)
+
+def model_files_state():
+    """(mtime, ukuran, inode) file model yang dipantau file watcher; None untuk file yang tidak ada"""
+    state = []
+    for path in (os.path.join(ARTIFACT_PATH, 'manifest.json'), PICKLE_PATH, MOOD_CLASSIFIER_PATH):
+        try:
+            stat = os.stat(path)
+            state.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            state.append(None)
+    return tuple(state)
+
+class Reloader:
+    """Hot reload katalog dan model di thread background (POST /admin/reload atau file watcher).
+
+    Paling banyak satu reload berjalan. Snapshot baru dibangun dan divalidasi penuh sebelum
+    ditukar di thread event loop; jika gagal, snapshot lama tetap melayani.
+    """
+    def __init__(self):
+        self.status = 'idle'  # idle, running, succeeded, failed
+        self.reloads = 0
+        self.failures = 0
+        self.last_trigger = None
+        self.last_error = None
+        self.last_seconds = None
+        self.last_timings = {}  # detik per tahap build reload terakhir
+        self.updates = 0
+        self.last_update = None  # statistik update katalog terakhir (apply_updates)
+        self.files = None     # model_files_state() saat model terakhir dimuat
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def attach(self, loop):
+        self._loop = loop
+
+    def trigger(self, trigger):
+        """Mulai reload; False jika reload lain masih berjalan (atau aplikasi belum startup)"""
+        if self._loop is None or not self._lock.acquire(blocking=False):
+            return False
+        self.status = 'running'
+        self.last_trigger = trigger
+        threading.Thread(target=self._reload, name='nutrimood-reload', daemon=True).start()
+        return True
+
+    def _reload(self):
+        start = time.perf_counter()
+        try:
+            self.files = model_files_state()
+            previous = SNAPSHOT
+            self.last_timings = {}
+            snapshot = build_snapshot(os.getenv('NUTRIMOOD_PRECOMPUTE', '1') == '1', self.last_timings)
+            validate_snapshot(snapshot, previous)
+            process_pool = self._spawn_process_pool(snapshot, self.last_timings)
+            self._loop.call_soon_threadsafe(install_snapshot, snapshot, process_pool)
+            self.reloads += 1
+            self.last_error = None
+            self.status = 'succeeded'
+        except Exception as e:
+            logger.exception("Reload gagal, snapshot lama tetap dipakai: %s", e)
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.status = 'failed'
+        finally:
+            self.last_seconds = time.perf_counter() - start
+            self._lock.release()
+
+    @staticmethod
+    def _spawn_process_pool(snapshot, timings):
+        """Pool process baru yang memuat model dari disk, atau None jika process pool tidak dipakai"""
+        if PROCESS_EXECUTOR is None or PROCESS_EXECUTOR._pool is None:
+            return None
+        # Worker baru disiapkan sebelum swap agar request setelah swap tidak menunggu model dimuat
+        start = time.perf_counter()
+        process_pool, versions = PROCESS_EXECUTOR.spawn_pool()
+        timings['process_pool'] = time.perf_counter() - start
+        if versions != {snapshot.version}:
+            # File berubah lagi selama reload; request yang tidak cocok dihitung di thread pool
+            logger.warning("Worker process memuat versi %s, snapshot %s", sorted(versions), snapshot.version)
+        return process_pool
+
+    def update(self, upserts, deletes, persist=False):
+        """Terapkan upsert/delete makanan ke snapshot yang melayani (dipanggil di thread, bukan event loop).
+
+        Katalog dan indeks diperbarui inkremental (FoodRecommender.apply_updates) lalu divalidasi
+        dan ditukar seperti reload; request yang sedang berjalan tetap memakai snapshot lama.
+        Tanpa persist, update hanya ada di proses ini dan hilang saat reload berikutnya.
+        ValueError jika update tidak valid, RuntimeError jika reload/update lain sedang berjalan.
+        """
+        if self._loop is None or not self._lock.acquire(blocking=False):
+            raise RuntimeError("Reload atau update lain masih berjalan")
+        try:
+            previous = SNAPSHOT
+            if previous is None:
+                raise ValueError("Model belum dimuat")
+            timings = {}
+            start = time.perf_counter()
+            recommender, stats = previous.recommender.apply_updates(upserts, deletes)
+            timings['apply'] = time.perf_counter() - start
+            snapshot = replace(previous, recommender=recommender, loaded_at=time.time(),
+                               version=snapshot_version(recommender, previous.mood_classifier))
+            validate_snapshot(snapshot, previous)
+            process_pool = None
+            if persist:
+                start = time.perf_counter()
+                recommender.save_artifact(ARTIFACT_PATH)
+                timings['persist'] = time.perf_counter() - start
+                self.files = model_files_state()  # file watcher proses ini tidak perlu reload
+                snapshot = replace(snapshot, source='artifact')
+                process_pool = self._spawn_process_pool(snapshot, timings)
+            # Worker process tanpa persist masih memuat katalog lama: versinya tidak cocok,
+            # request dihitung di thread pool (SnapshotMismatch)
+            self._loop.call_soon_threadsafe(install_snapshot, snapshot, process_pool)
+            # Indeks nama dan daftar tetangga digabung malas dan indeks nutrisi dibangun ulang; siapkan
+            # di background agar /foods/search, /foods/{id}/similar dan filter rentang pertama tidak menunggu
+            threading.Thread(target=recommender.name_index, name='nutrimood-name-index', daemon=True).start()
+            threading.Thread(target=recommender.nutrient_index, name='nutrimood-nutrient-index', daemon=True).start()
+            threading.Thread(target=recommender.build_neighbour_lists, name='nutrimood-neighbours', daemon=True).start()
+            self.updates += 1
+            self.last_update = {**stats, "persisted": persist,
+                                "timings": {step: round(seconds, 3) for step, seconds in timings.items()}}
+            return snapshot, self.last_update
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {
+            "status": self.status,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "updates": self.updates,
+            "last_update": self.last_update,
+            "last_trigger": self.last_trigger,
+            "last_error": self.last_error,
+            "last_seconds": round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            "last_timings": {step: round(seconds, 3) for step, seconds in self.last_timings.items()},
+        }
+
+RELOADER = Reloader()
+
+def watch_model_files(reloader, interval):
+    """Polling file model; reload setelah perubahan stabil selama satu interval (selesai ditulis)"""
+    pending = None
+    while True:
+        time.sleep(interval)
+        state = model_files_state()
+        if state == reloader.files:
+            pending = None
+        elif state != pending:
+            pending = state  # masih berubah, tunggu satu interval lagi
+        elif reloader.trigger('watch'):
+            pending = None
+
+# Personalisasi /recommend per user_id: riwayat dari SQLite lokal (pengganti tabel
+# food_recommendations Postgres), di-cache per user dan di-refresh batch di background
+# Opt-in: store ada di disk lokal worker (di Render hilang setiap deploy/restart)
+USER_STORE_PATH = os.getenv('NUTRIMOOD_USER_STORE_PATH', '')  # '' = personalisasi mati
+USER_HISTORY_MAX = int(os.getenv('NUTRIMOOD_USER_HISTORY_MAX', '500'))  # baris per user (ditampilkan dan suka/konsumsi masing-masing); 0 = tanpa batas
+USER_FEEDBACK_TOKEN = os.getenv('NUTRIMOOD_USER_FEEDBACK_TOKEN')  # tanpa token, POST /users/{id}/feedback dimatikan (404)
+USER_FEEDBACK_MAX_ITEMS = 1000  # item per request feedback
+USER_CACHE_SIZE = int(os.getenv('NUTRIMOOD_USER_CACHE_SIZE', '10000'))
+USER_REFRESH_SECONDS = float(os.getenv('NUTRIMOOD_USER_REFRESH_SECONDS', '30'))  # umur profil sebelum dimuat ulang
+USER_RECENT_SHOWN = int(os.getenv('NUTRIMOOD_USER_RECENT_SHOWN', '30'))  # makanan terakhir yang tidak diulang
+USER_FLUSH_SECONDS = 1.0      # interval thread background (tulis riwayat, refresh profil)
+USER_LOAD_BATCH = 500         # user per query IN (...)
+USER_LIKED_WEIGHT = 1.0       # bobot preferensi per riwayat is_liked / is_consumed
+USER_CONSUMED_WEIGHT = 0.5
+PERSONALIZATION_CANDIDATES = int(os.getenv('NUTRIMOOD_PERSONALIZATION_CANDIDATES', '50'))
+PERSONALIZATION_WEIGHT = float(os.getenv('NUTRIMOOD_PERSONALIZATION_WEIGHT', '0.1'))
+PERSONALIZATION_PRIOR = 3.0   # bobot interaksi saat preferensi baru berpengaruh setengahnya
+PREFERENCE_NUTRIENTS = ('calories', 'proteins', 'fat', 'carbohydrate')
+
+@dataclass(frozen=True, eq=False)
+class UserProfile:
+    """Riwayat satu user: bobot suka/konsumsi per nama makanan dan makanan yang terakhir ditampilkan.
+
+    Tidak diubah setelah dibuat: perubahan (makanan ditampilkan, refresh) membuat profil baru yang
+    ditukar utuh di cache UserPreferences, jadi request selalu melihat weights dan recent yang sejalan.
+    """
+    user_id: str
+    weights: Mapping[str, float]  # nama makanan -> bobot interaksi
+    recent: Tuple[str, ...]       # nama makanan yang terakhir ditampilkan, terbaru dulu
+    loaded_at: float              # time.monotonic() saat dimuat dari store
+    # cache user_preference: {'preference': (weakref katalog, weights, vektor, kekuatan)}; berlaku
+    # hanya untuk weights yang sama, jadi boleh ikut ke profil baru hasil replace
+    memo: dict = field(default_factory=dict, repr=False)
+
+def _recent_shown(names, recent):
+    """Makanan yang baru ditampilkan di depan recent, tanpa duplikat, paling banyak USER_RECENT_SHOWN"""
+    return tuple(dict.fromkeys(list(names) + list(recent)))[:USER_RECENT_SHOWN]
+
+class UserStore:
+    """Riwayat rekomendasi per user di SQLite, skema mengikuti tabel food_recommendations Supabase"""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS food_recommendations (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            food_name TEXT NOT NULL,
+            mood_category TEXT NOT NULL,
+            similarity_score REAL NOT NULL DEFAULT 0,
+            is_liked INTEGER NOT NULL DEFAULT 0,
+            is_consumed INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL  -- epoch detik
+        );
+        CREATE INDEX IF NOT EXISTS idx_food_recommendations_user_created
+            ON food_recommendations(user_id, created_at);
+    """
+
+    # Riwayat terlama di luar history_max terbaru per user dihapus; ditampilkan dan suka/konsumsi
+    # dihitung terpisah agar riwayat ditampilkan tidak mendesak keluar preferensi
+    PRUNE = ("DELETE FROM food_recommendations WHERE id IN (SELECT id FROM food_recommendations "
+             "WHERE user_id = ? AND (is_liked OR is_consumed) = ? ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?)")
+
+    def __init__(self, path, history_max=USER_HISTORY_MAX):
+        self.path = path
+        self.history_max = history_max
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(self.SCHEMA)
+
+    def load(self, user_ids):
+        """{user_id: UserProfile} untuk semua user_ids (user tanpa riwayat mendapat profil kosong)"""
+        rows = []
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._lock:
+            for start in range(0, len(user_ids), USER_LOAD_BATCH):
+                chunk = user_ids[start:start + USER_LOAD_BATCH]
+                rows += self._connection.execute(
+                    f"SELECT user_id, food_name, is_liked, is_consumed FROM food_recommendations "
+                    f"WHERE user_id IN ({','.join('?' * len(chunk))}) ORDER BY created_at DESC, id DESC",
+                    chunk
+                ).fetchall()
+        weights = {user_id: {} for user_id in user_ids}
+        recent = {user_id: {} for user_id in user_ids}  # dict sebagai ordered set
+        for user_id, name, liked, consumed in rows:
+            weight = liked * USER_LIKED_WEIGHT + consumed * USER_CONSUMED_WEIGHT
+            if weight:
+                weights[user_id][name] = max(weights[user_id].get(name, 0.0), weight)
+            if len(recent[user_id]) < USER_RECENT_SHOWN:
+                recent[user_id].setdefault(name)
+        loaded_at = time.monotonic()
+        return {user_id: UserProfile(user_id, MappingProxyType(weights[user_id]), tuple(recent[user_id]), loaded_at)
+                for user_id in user_ids}
+
+    def record(self, records):
+        """Tambah riwayat (user_id, food_name, mood_category, similarity_score, is_liked, is_consumed, created_at)
+        lalu pangkas riwayat user yang ditulis ke history_max baris terbaru"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO food_recommendations (user_id, food_name, mood_category, similarity_score, "
+                "is_liked, is_consumed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+            if self.history_max > 0:
+                users = dict.fromkeys(record[0] for record in records)
+                self._connection.executemany(self.PRUNE, [(user_id, feedback, self.history_max)
+                                                          for user_id in users for feedback in (0, 1)])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class UserPreferences:
+    """LRU UserProfile di atas UserStore.
+
+    Miss dimuat langsung (satu query). Thread background menulis makanan yang ditampilkan
+    secara batch, lalu memuat ulang (juga batch) profil yang lebih tua dari
+    USER_REFRESH_SECONDS dan me-resolve-nya terhadap recommender yang melayani, sehingga
+    request untuk user yang sudah di-cache hanya melakukan operasi array.
+    """
+    def __init__(self, store, maxsize=USER_CACHE_SIZE, refresh_seconds=USER_REFRESH_SECONDS):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self.loads = 0       # user yang dimuat dari store
+        self.refreshes = 0   # batch refresh background
+        self.written = 0     # baris riwayat yang ditulis
+        self._cache = LRUCache(maxsize)
+        self._pending = []   # riwayat yang belum ditulis ke store
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, user_id):
+        profile = self._cache.get(user_id)
+        if profile is None:
+            profile = self.store.load([user_id])[user_id]
+            self.loads += 1
+            self._cache.put(user_id, profile)
+        return profile
+
+    def record_shown(self, profile, mood, names, scores):
+        """Makanan yang baru ditampilkan: langsung dikecualikan di profil cache (profil baru, dari
+        profil yang sedang di cache agar update bersamaan tidak hilang), ditulis ke store di background"""
+        # Antre dulu baru ubah cache: nama yang terlihat di profil cache pasti ikut flush berikutnya (_install)
+        with self._pending_lock:
+            self._pending.append((profile.user_id, mood, names, scores, time.time()))
+        self._cache.replace(profile.user_id, lambda current: replace(current, recent=_recent_shown(names, current.recent)))
+
+    def _install(self, stale, fresh):
+        """Tukar profil cache dengan hasil load; makanan yang ditampilkan sejak stale diambil (mungkin
+        belum ada di store) tetap dikecualikan. stale harus diambil sebelum flush yang mendahului load"""
+        def merge(current):
+            if current is stale:
+                return fresh
+            shown = [name for name in current.recent if name not in stale.recent]
+            return replace(fresh, recent=_recent_shown(shown, fresh.recent))
+        if self._cache.replace(fresh.user_id, merge) is None and stale is None:
+            self._cache.put(fresh.user_id, fresh)
+
+    def record_feedback(self, user_id, mood, feedback):
+        """Suka/konsumsi (food_name, is_liked, is_consumed) dari client: langsung ditulis, dan profil user
+        di cache proses ini dimuat ulang (proses/worker lain setelah refresh_seconds)"""
+        stale = self._cache.replace(user_id, lambda current: current)
+        self.flush()  # riwayat ditampilkan yang tertunda ikut masuk ke profil yang dimuat ulang
+        now = time.time()
+        self.store.record([(user_id, name, mood, 0.0, int(liked), int(consumed), now)
+                           for name, liked, consumed in feedback])
+        self.written += len(feedback)
+        self._install(stale, self.store.load([user_id])[user_id])
+        self.loads += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='nutrimood-users', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.store.close()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        records = [(user_id, name, mood, float(score), 0, 0, shown_at)
+                   for user_id, mood, names, scores, shown_at in pending for name, score in zip(names, scores)]
+        if records:
+            self.store.record(records)
+            self.written += len(records)
+
+    def refresh(self, recommender=None):
+        """Muat ulang (satu batch) profil yang sudah lewat refresh_seconds, lalu resolve semua profil
+        terhadap recommender (murah untuk profil yang katalog dan riwayatnya tidak berubah)"""
+        if self.refresh_seconds > 0:
+            cutoff = time.monotonic() - self.refresh_seconds
+            stale = [profile for profile in self._cache.values() if profile.loaded_at <= cutoff]
+            if stale:
+                self.flush()
+                loaded = self.store.load([profile.user_id for profile in stale])
+                for profile in stale:
+                    self._install(profile, loaded[profile.user_id])
+                self.loads += len(stale)
+                self.refreshes += 1
+        if recommender is not None:
+            for profile in self._cache.values():
+                recommender.user_preference(profile)
+
+    def _run(self):
+        while not self._stop.wait(USER_FLUSH_SECONDS):
+            try:
+                self.flush()
+                recommender = serving_recommender()
+                self.refresh(recommender if recommender is not None and recommender.is_loaded() else None)
+            except Exception as e:
+                logger.exception("Error refresh profil user: %s", e)
+
+    def stats(self):
+        return {
+            "store": self.store.path,
+            "history_max": self.store.history_max,
+            "cache": self._cache.stats(),
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "written": self.written,
+            "pending": sum(len(names) for _, _, names, _, _ in list(self._pending)),
+        }
+
+USER_PREFERENCES = None  # dibuat per proses saat startup (koneksi SQLite tidak boleh ikut fork)
 
-# Inisialisasi FoodRecommender
-food_recommender = FoodRecommender()
+def start_user_preferences():
+    global USER_PREFERENCES
+    if USER_STORE_PATH and USER_PREFERENCES is None:
+        USER_PREFERENCES = UserPreferences(UserStore(USER_STORE_PATH))
+        USER_PREFERENCES.start()
+
+def init_process_worker():
+    """Initializer process pool: tiap proses memuat snapshot sendiri dari disk (artifact di-mmap,
+    halaman memorinya dibagi dengan proses utama lewat page cache)"""
+    global SNAPSHOT
+    SNAPSHOT = build_snapshot(os.getenv('NUTRIMOOD_PRECOMPUTE', '1') == '1', {})
+
+def preload_snapshot():
+    """gunicorn preload (gunicorn.conf.py): bangun snapshot sekali di master sebelum fork.
+
+    Worker mewarisi katalog dan semua indeks lewat copy-on-write; array dari artifact di-mmap
+    sehingga halamannya dibagi lewat page cache. Worker tambahan hampir tidak menambah RSS.
+    """
+    global SNAPSHOT
+    READINESS.mark('imported')
+    MODEL_LOAD_SECONDS['imports'] = READINESS.reached['imported']
+    precompute = os.getenv('NUTRIMOOD_PRECOMPUTE', '1') == '1'
+    RELOADER.files = model_files_state()
+    try:
+        SNAPSHOT = build_snapshot(precompute, MODEL_LOAD_SECONDS, mark=READINESS.mark, warm=True)
+    except Exception as e:
+        # Worker mencoba memuat sendiri saat startup dan melaporkan errornya lewat /readyz
+        logger.exception("Preload model gagal: %s", e)
+        return
+    if precompute:
+        READINESS.mark('caches_warmed')
+    # Objek yang sudah ada tidak lagi disentuh GC di worker, jadi halamannya tidak ikut tersalin
+    gc.freeze()
 
 @app.on_event("startup")
 async def startup_event():
-    """Load data dan model saat startup"""
+    """Load katalog dan indeks saat startup (kecuali sudah di-preload master gunicorn);
+    tabel hasil di-warm di background"""
+    READINESS.mark('imported')
+    MODEL_LOAD_SECONDS.setdefault('imports', READINESS.reached['imported'])
+    RELOADER.attach(asyncio.get_running_loop())
     try:
-        # Fix module reference untuk pickle
-        import sys
-        sys.modules['__main__'].FoodRecommender = FoodRecommender
-        
-        # Load food recommender dari pickle
-        if os.path.exists('models/food_recommender.pkl'):
-            with open('models/food_recommender.pkl', 'rb') as f:
-                global food_recommender
-                food_recommender = pickle.load(f)
-            print("Food recommender loaded dari pickle file")
-        else:
-            print("Error: models/food_recommender.pkl tidak ditemukan")
+        start_user_preferences()
+    except Exception as e:
+        # Rekomendasi tetap jalan tanpa personalisasi
+        logger.exception("Store riwayat user tidak bisa dibuka: %s", e)
+    if RELOAD_POLL_SECONDS > 0:
+        # Watcher tetap jalan walau startup gagal: file model yang diperbaiki memulihkan server
+        threading.Thread(target=watch_model_files, args=(RELOADER, RELOAD_POLL_SECONDS),
+                         name='nutrimood-watch', daemon=True).start()
+
+    if SNAPSHOT is not None:
+        # Di-preload master; worker yang di-fork ulang (max_requests) setelah hot reload
+        # membawa snapshot lama dari master, jadi muat ulang jika file model sudah berubah
+        if model_files_state() != RELOADER.files:
+            RELOADER.trigger('startup')
+        if PROCESS_EXECUTOR is not None:
+            PROCESS_EXECUTOR.start()
+        return
+
+    RELOADER.files = model_files_state()
+    precompute = os.getenv('NUTRIMOOD_PRECOMPUTE', '1') == '1'
+    try:
+        snapshot = build_snapshot(precompute, MODEL_LOAD_SECONDS, mark=READINESS.mark, warm=False)
+    except Exception as e:
+        logger.exception("Error loading data: %s", e)
+        READINESS.fail(e)
+        return
+    install_snapshot(snapshot)
+
+    # Precompute seluruh kombinasi mood x kondisi kesehatan tanpa menahan startup;
+    # request yang datang lebih dulu dihitung langsung (lewat LRU cache)
+    if precompute:
+        threading.Thread(target=warm_caches, args=(snapshot.recommender,), name='nutrimood-warmup', daemon=True).start()
+    if PROCESS_EXECUTOR is not None:
+        PROCESS_EXECUTOR.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for executor in EXECUTORS:
+        executor.shutdown()
+    if USER_PREFERENCES is not None:
+        USER_PREFERENCES.stop()  # tulis riwayat yang masih tertunda
+
+def warm_caches(recommender):
+    """Bangun tabel hasil (dilewati jika sudah ada di artifact)"""
+    try:
+        start = time.perf_counter()
+        recommender.enable_result_table()
+        MODEL_LOAD_SECONDS['result_table'] = time.perf_counter() - start
+        READINESS.mark('caches_warmed')
     except Exception as e:
-        print(f"Error loading data: {str(e)}")
-        food_recommender = None
+        logger.exception("Error warming cache: %s", e)
+
+@app.get("/livez")
+async def livez():
+    """Liveness: proses hidup dan event loop merespons"""
+    return {"status": "alive", "uptime_seconds": round(time.perf_counter() - IMPORT_STARTED, 3)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 jika katalog dan indeks siap melayani request, 503 jika belum"""
+    snapshot = READINESS.snapshot()
+    if not snapshot["ready"]:
+        return JSONResponse(status_code=503, content=snapshot)
+    return snapshot
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -516,27 +4773,259 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check"""
-    data_loaded = food_recommender.food_df is not None if food_recommender else False
+    recommender = serving_recommender()
+    classifier = serving_classifier()
+    data_loaded = recommender.is_loaded() if recommender else False
     return {
         "status": "healthy" if data_loaded else "degraded",
-        "data_loaded": data_loaded
+        "data_loaded": data_loaded,
+        "mood_classifier_loaded": classifier is not None,
+        "executors": {executor.kind: executor.stats() for executor in EXECUTORS},
+        "micro_batching": MICRO_BATCHER.stats() if MICRO_BATCHER is not None else None,
+        "cache": recommender.cache_stats() if data_loaded else None,
+        "search": recommender.search_stats() if data_loaded else None,
+        "personalization": USER_PREFERENCES.stats() if USER_PREFERENCES is not None else None,
+        "model": snapshot_info(serving_snapshot())
+    }
+
+def snapshot_info(snapshot):
+    """Versi model yang melayani request dan status hot reload"""
+    return {
+        "version": snapshot.version if snapshot is not None else None,
+        "source": snapshot.source if snapshot is not None else None,
+        "loaded_at": round(snapshot.loaded_at, 3) if snapshot is not None else None,
+        "reload": RELOADER.stats(),
     }
 
+def render_metrics():
+    """Semua metrics dalam format teks Prometheus"""
+    recommender = serving_recommender()
+    lines = [
+        '# HELP nutrimood_http_requests_total Jumlah request HTTP per route dan status',
+        '# TYPE nutrimood_http_requests_total counter',
+    ]
+    for (method, route, status), count in sorted(REQUEST_COUNTS.items()):
+        lines.append(f'nutrimood_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP nutrimood_http_request_duration_seconds Latency request HTTP per route',
+        '# TYPE nutrimood_http_request_duration_seconds histogram',
+    ]
+    for route, histogram in sorted(REQUEST_LATENCY.items()):
+        lines += histogram.exposition('nutrimood_http_request_duration_seconds', f'route="{route}"')
+
+    lines += [
+        '# HELP nutrimood_stage_duration_seconds Waktu per stage rekomendasi (di-sample)',
+        '# TYPE nutrimood_stage_duration_seconds histogram',
+    ]
+    for stage, histogram in STAGE_TIMINGS.items():
+        lines += histogram.exposition('nutrimood_stage_duration_seconds', f'stage="{stage}"')
+
+    lines += [
+        '# HELP nutrimood_fallback_total Rekomendasi yang dilayani lewat jalur fallback',
+        '# TYPE nutrimood_fallback_total counter',
+    ]
+    for path, count in sorted(FALLBACK_COUNTS.items()):
+        lines.append(f'nutrimood_fallback_total{{path="{path}"}} {count}')
+
+    lines += [
+        '# HELP nutrimood_executor_workers Jumlah worker per pool executor',
+        '# TYPE nutrimood_executor_workers gauge',
+    ]
+    lines += [f'nutrimood_executor_workers{{pool="{e.kind}"}} {e.workers}' for e in EXECUTORS]
+    lines += [
+        '# HELP nutrimood_executor_in_flight Task yang sedang dikerjakan atau mengantre',
+        '# TYPE nutrimood_executor_in_flight gauge',
+    ]
+    lines += [f'nutrimood_executor_in_flight{{pool="{e.kind}"}} {e.in_flight}' for e in EXECUTORS]
+    lines += [
+        '# HELP nutrimood_executor_queue_depth Task yang menunggu worker',
+        '# TYPE nutrimood_executor_queue_depth gauge',
+    ]
+    lines += [f'nutrimood_executor_queue_depth{{pool="{e.kind}"}} {e.queue_depth}' for e in EXECUTORS]
+    lines += [
+        '# HELP nutrimood_executor_rejected_total Request ditolak (503) karena antrean penuh',
+        '# TYPE nutrimood_executor_rejected_total counter',
+    ]
+    lines += [f'nutrimood_executor_rejected_total{{pool="{e.kind}"}} {e.rejected}' for e in EXECUTORS]
+    lines += [
+        '# HELP nutrimood_executor_deadline_exceeded_total Request melewati deadline (504)',
+        '# TYPE nutrimood_executor_deadline_exceeded_total counter',
+    ]
+    lines += [f'nutrimood_executor_deadline_exceeded_total{{pool="{e.kind}"}} {e.deadline_exceeded}' for e in EXECUTORS]
+    lines += [
+        '# HELP nutrimood_executor_wait_seconds Waktu tunggu di antrean sebelum dikerjakan',
+        '# TYPE nutrimood_executor_wait_seconds histogram',
+    ]
+    for executor in EXECUTORS:
+        lines += executor.wait_time.exposition('nutrimood_executor_wait_seconds', f'pool="{executor.kind}"')
+    lines += [
+        '# HELP nutrimood_executor_run_seconds Waktu eksekusi task di worker',
+        '# TYPE nutrimood_executor_run_seconds histogram',
+    ]
+    for executor in EXECUTORS:
+        lines += executor.run_time.exposition('nutrimood_executor_run_seconds', f'pool="{executor.kind}"')
+
+    if MICRO_BATCHER is not None:
+        lines += [
+            '# HELP nutrimood_microbatch_requests_total Request /recommend yang lewat micro-batcher',
+            '# TYPE nutrimood_microbatch_requests_total counter',
+            f'nutrimood_microbatch_requests_total {MICRO_BATCHER.requests}',
+            '# HELP nutrimood_microbatch_shared_total Request yang memakai hasil request identik yang sedang in-flight',
+            '# TYPE nutrimood_microbatch_shared_total counter',
+            f'nutrimood_microbatch_shared_total {MICRO_BATCHER.shared}',
+            '# HELP nutrimood_microbatch_batch_size Jumlah request unik per batch',
+            '# TYPE nutrimood_microbatch_batch_size histogram',
+        ]
+        lines += MICRO_BATCHER.batch_size.exposition('nutrimood_microbatch_batch_size')
+
+    data_loaded = recommender is not None and recommender.is_loaded()
+    if data_loaded:
+        stats = recommender.cache_stats()
+        lines += [
+            '# HELP nutrimood_catalog_foods Jumlah makanan di katalog',
+            '# TYPE nutrimood_catalog_foods gauge',
+            f'nutrimood_catalog_foods {recommender.catalog_size()}',
+            '# HELP nutrimood_cache_requests_total Lookup tabel hasil dan LRU cache',
+            '# TYPE nutrimood_cache_requests_total counter',
+            f'nutrimood_cache_requests_total{{cache="result_table",result="hit"}} {stats["result_table"]["hits"]}',
+            f'nutrimood_cache_requests_total{{cache="result_table",result="miss"}} {stats["result_table"]["misses"]}',
+            f'nutrimood_cache_requests_total{{cache="lru",result="hit"}} {stats["lru"]["hits"]}',
+            f'nutrimood_cache_requests_total{{cache="lru",result="miss"}} {stats["lru"]["misses"]}',
+        ]
+
+    if USER_PREFERENCES is not None:
+        users = USER_PREFERENCES.stats()
+        lines += [
+            '# HELP nutrimood_user_profiles Profil user di cache personalisasi',
+            '# TYPE nutrimood_user_profiles gauge',
+            f'nutrimood_user_profiles {users["cache"]["size"]}',
+            '# HELP nutrimood_user_profile_requests_total Lookup profil user per hasil (miss = dimuat langsung dari store)',
+            '# TYPE nutrimood_user_profile_requests_total counter',
+            f'nutrimood_user_profile_requests_total{{result="hit"}} {users["cache"]["hits"]}',
+            f'nutrimood_user_profile_requests_total{{result="miss"}} {users["cache"]["misses"]}',
+            '# HELP nutrimood_user_history_written_total Baris riwayat rekomendasi yang ditulis ke store',
+            '# TYPE nutrimood_user_history_written_total counter',
+            f'nutrimood_user_history_written_total {users["written"]}',
+        ]
+
+    snapshot = serving_snapshot()
+    if snapshot is not None:
+        lines += [
+            '# HELP nutrimood_model_info Versi snapshot model yang melayani request',
+            '# TYPE nutrimood_model_info gauge',
+            f'nutrimood_model_info{{version="{snapshot.version}",source="{snapshot.source}"}} 1',
+        ]
+    lines += [
+        '# HELP nutrimood_reloads_total Hot reload katalog dan model per hasil',
+        '# TYPE nutrimood_reloads_total counter',
+        f'nutrimood_reloads_total{{result="succeeded"}} {RELOADER.reloads}',
+        f'nutrimood_reloads_total{{result="failed"}} {RELOADER.failures}',
+        '# HELP nutrimood_catalog_updates_total Update katalog (POST /admin/foods) yang diterapkan',
+        '# TYPE nutrimood_catalog_updates_total counter',
+        f'nutrimood_catalog_updates_total {RELOADER.updates}',
+    ]
+
+    if MODEL_LOAD_SECONDS:
+        lines += [
+            '# HELP nutrimood_model_load_seconds Durasi tahap startup (import, load model, build tabel hasil)',
+            '# TYPE nutrimood_model_load_seconds gauge',
+        ]
+        for step, seconds in MODEL_LOAD_SECONDS.items():
+            lines.append(f'nutrimood_model_load_seconds{{step="{step}"}} {seconds}')
+
+    rss = process_rss_bytes()
+    if rss is not None:
+        lines += [
+            '# HELP process_resident_memory_bytes Resident memory size in bytes.',
+            '# TYPE process_resident_memory_bytes gauge',
+            f'process_resident_memory_bytes {rss}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics format Prometheus untuk worker yang melayani request ini"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_admin(authorization):
+    """Endpoint admin hanya aktif jika NUTRIMOOD_ADMIN_TOKEN di-set; header Authorization: Bearer <token>"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or '').encode(), f'Bearer {ADMIN_TOKEN}'.encode()):
+        raise HTTPException(status_code=401, detail="Token admin tidak valid", headers={"WWW-Authenticate": "Bearer"})
+
+def require_feedback_token(authorization):
+    """POST /users/{id}/feedback hanya aktif jika NUTRIMOOD_USER_FEEDBACK_TOKEN di-set (dipakai backend/webhook
+    tepercaya, bukan browser); header Authorization: Bearer <token>"""
+    if not USER_FEEDBACK_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or '').encode(), f'Bearer {USER_FEEDBACK_TOKEN}'.encode()):
+        raise HTTPException(status_code=401, detail="Token feedback tidak valid", headers={"WWW-Authenticate": "Bearer"})
+
+def require_shared_update(persist=True):
+    """Dengan beberapa worker, perubahan model harus sampai ke semua worker: lewat file (persist)
+    yang dipantau watcher setiap worker. Tanpa itu hanya worker yang menjawab yang berubah, dan
+    ETag/cursor berganti-ganti antar worker"""
+    if SERVER_WORKERS <= 1:
+        return
+    if RELOAD_POLL_SECONDS <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Server berjalan dengan {SERVER_WORKERS} worker tanpa NUTRIMOOD_RELOAD_POLL_SECONDS; "
+                   f"perubahan hanya akan sampai ke satu worker"
+        )
+    if not persist:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Server berjalan dengan {SERVER_WORKERS} worker; update katalog harus memakai \"persist\": true"
+        )
+
+@app.post("/admin/reload", status_code=202)
+async def reload_model(authorization: Optional[str] = Header(None)):
+    """Muat ulang katalog dan model di background tanpa downtime; status lewat GET /admin/reload"""
+    require_admin(authorization)
+    require_shared_update()
+    if not RELOADER.trigger('admin'):
+        raise HTTPException(status_code=409, detail="Reload lain masih berjalan")
+    return snapshot_info(SNAPSHOT)
+
+@app.get("/admin/reload")
+async def reload_status(authorization: Optional[str] = Header(None)):
+    """Status reload terakhir dan versi model yang melayani request baru"""
+    require_admin(authorization)
+    return snapshot_info(SNAPSHOT)
+
+@app.post("/admin/foods")
+async def update_foods(request: CatalogUpdateRequest, authorization: Optional[str] = Header(None)):
+    """Tambah, ganti atau hapus makanan di katalog yang melayani tanpa reload penuh"""
+    require_admin(authorization)
+    require_shared_update(request.persist)
+    upserts = [item.dict(exclude_none=True) for item in request.upserts]
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot, stats = await loop.run_in_executor(None, RELOADER.update, upserts, request.deletes, request.persist)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # install_snapshot sudah dijadwalkan sebelum hasil executor, jadi snapshot baru sudah melayani
+    return {**snapshot_info(snapshot), "update": stats}
+
 @app.get("/debug/food-details")
 async def get_food_details(food_name: str):
     """Get details of a specific food"""
-    if food_recommender is None or food_recommender.food_df is None:
+    recommender = serving_recommender()
+    if recommender is None or recommender.food_df is None:
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
     
-    df = food_recommender.food_df
+    df = recommender.food_df
     
     # Find exact match first, then partial match
-    exact_match = df[df['name'] == food_name]
-    if exact_match.empty:
-        partial_match = df[df['name'].str.contains(food_name, case=False, na=False)]
-        food_data = partial_match
-    else:
-        food_data = exact_match
+    rows = recommender.find_food_rows(food_name, exact=True)
+    if len(rows) == 0:
+        rows = recommender.find_food_rows(food_name)
+    food_data = df.iloc[rows]
     
     features = ['name', 'calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'is_energizing', 
                'calorie_category_num', 'carb_category_num', 'mood_energizing', 'primary_mood_num']
@@ -556,14 +5045,15 @@ async def get_food_details(food_name: str):
 @app.get("/debug/compare-foods")
 async def compare_foods(food1: str, food2: str):
     """Compare features between two foods"""
-    if food_recommender is None or food_recommender.food_df is None:
+    recommender = serving_recommender()
+    if recommender is None or recommender.food_df is None:
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
     
-    df = food_recommender.food_df
+    df = recommender.food_df
     
     # Find foods
-    food1_data = df[df['name'].str.contains(food1, case=False, na=False)]
-    food2_data = df[df['name'].str.contains(food2, case=False, na=False)]
+    food1_data = df.iloc[recommender.find_food_rows(food1)]
+    food2_data = df.iloc[recommender.find_food_rows(food2)]
     
     features = ['calories', 'proteins', 'fat', 'carbohydrate', 'primary_mood', 'is_energizing', 
                'calorie_category_num', 'carb_category_num', 'mood_energizing', 'primary_mood_num']
@@ -584,8 +5074,11 @@ async def compare_foods(food1: str, food2: str):
 @app.get("/debug/full-process")
 async def debug_full_process(mood: str = "energizing", health_conditions: str = "diabetes", top_n: int = 5):
     """Debug lengkap untuk melihat seluruh proses"""
-    if food_recommender is None or food_recommender.food_df is None:
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
+    if not 1 <= top_n <= RECOMMEND_MAX_TOP_N:
+        raise HTTPException(status_code=400, detail=TOP_N_ERROR)
     
     try:
         request = RecommendationRequest(
@@ -593,87 +5086,90 @@ async def debug_full_process(mood: str = "energizing", health_conditions: str =
             health_conditions=[health_conditions] if health_conditions else None,
             top_n=top_n
         )
+        return await THREAD_EXECUTOR.run(debug_full_process_task, request)
         
-        print(f"\n=== FULL DEBUG PROCESS ===")
-        print(f"Request: {request}")
-        
-        # Step 1: Lihat makanan energizing dengan nama kacang
-        df = food_recommender.food_df
-        energizing_foods = df[df['is_energizing'] == 1]
-        kacang_energizing = energizing_foods[energizing_foods['name'].str.contains('kacang', case=False, na=False)]
-        
-        print(f"Kacang energizing foods:")
-        for _, row in kacang_energizing.iterrows():
-            print(f"- {row['name']}: calories={row['calories']:.4f}")
-        
-        # Step 2: Build user profile seperti di Colab
-        user_profile = {
-            'primary_mood': request.mood,
-            'primary_mood_num': food_recommender.encode_mood(request.mood)
-        }
-        
-        # Add mood feature
-        mood_col = f'mood_{request.mood}'
-        if mood_col in df.columns:
-            user_profile[mood_col] = 1.0
-            
-        # Add health conditions with correct column names
-        if request.health_conditions:
-            for condition in request.health_conditions:
-                if condition == 'diabetes':
-                    user_profile['calorie_category_num'] = 1  # low = 1
-                    user_profile['carb_category_num'] = 1     # low = 1
-                    
-        print(f"User profile before processing: {user_profile}")
-        
-        # Step 3: Process user profile
-        processed_profile = {}
-        for key, value in user_profile.items():
-            if key == 'primary_mood':
-                processed_profile[key] = food_recommender.encode_mood(value)
-            elif isinstance(value, str):
-                processed_profile[key] = food_recommender.encode_category(value)
-            else:
-                processed_profile[key] = value
-                
-        print(f"Processed user profile: {processed_profile}")
-        
-        # Step 4: Find matching features
-        feature_cols = [col for col in df.columns 
-                       if col in processed_profile and pd.api.types.is_numeric_dtype(df[col])]
-        print(f"Matching features: {feature_cols}")
-        
-        # Step 5: Check specific foods
-        test_foods = ["Kacang merah /banda kering", "Jampang huma mentah", "Beef burger"]
-        print(f"\nChecking specific foods:")
-        for food_name in test_foods:
-            food_row = df[df['name'] == food_name]
-            if not food_row.empty:
-                food_features = food_row[feature_cols].values[0] if feature_cols else []
-                print(f"{food_name}:")
-                print(f"  Features: {dict(zip(feature_cols, food_features))}")
-                print(f"  is_energizing: {food_row['is_energizing'].values[0]}")
-                print(f"  primary_mood: {food_row['primary_mood'].values[0]}")
-        
-        return {
-            "user_profile": user_profile,
-            "processed_profile": processed_profile,
-            "matching_features": feature_cols,
-            "kacang_energizing_count": len(kacang_energizing),
-            "kacang_energizing_foods": kacang_energizing[['name', 'calories']].to_dict('records')[:3]
-        }
-        
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in full debug: {str(e)}")
+        logger.exception("Error in full debug: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def debug_full_process_task(request):
+    """Langkah /debug/full-process (pandas, dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    log_event("debug.full_process", request=request.dict())
+    
+    # Step 1: Lihat makanan energizing dengan nama kacang
+    df = recommender.food_df
+    kacang_foods = df.iloc[recommender.find_food_rows('kacang')]
+    kacang_energizing = kacang_foods[kacang_foods['is_energizing'] == 1]
+    
+    log_event("debug.kacang_energizing", foods=kacang_energizing[['name', 'calories']].to_dict('records'))
+    
+    # Step 2: Build user profile seperti di Colab
+    user_profile = {
+        'primary_mood': request.mood,
+        'primary_mood_num': recommender.encode_mood(request.mood)
+    }
+    
+    # Add mood feature
+    mood_col = f'mood_{request.mood}'
+    if mood_col in df.columns:
+        user_profile[mood_col] = 1.0
+        
+    # Add health conditions with correct column names
+    if request.health_conditions:
+        for condition in request.health_conditions:
+            if condition == 'diabetes':
+                user_profile['calorie_category_num'] = 1  # low = 1
+                user_profile['carb_category_num'] = 1     # low = 1
+                
+    log_event("debug.user_profile", user_profile=user_profile)
+    
+    # Step 3: Process user profile
+    processed_profile = {}
+    for key, value in user_profile.items():
+        if key == 'primary_mood':
+            processed_profile[key] = recommender.encode_mood(value)
+        elif isinstance(value, str):
+            processed_profile[key] = recommender.encode_category(value)
+        else:
+            processed_profile[key] = value
+            
+    log_event("debug.processed_profile", processed_profile=processed_profile)
+    
+    # Step 4: Find matching features
+    feature_cols = [col for col in df.columns 
+                   if col in processed_profile and pd.api.types.is_numeric_dtype(df[col])]
+    log_event("debug.matching_features", features=feature_cols)
+    
+    # Step 5: Check specific foods
+    test_foods = ["Kacang merah /banda kering", "Jampang huma mentah", "Beef burger"]
+    for food_name in test_foods:
+        food_row = df.iloc[recommender.find_food_rows(food_name, exact=True)[:1]]
+        if not food_row.empty:
+            food_features = food_row[feature_cols].values[0] if feature_cols else []
+            log_event("debug.check_food", name=food_name,
+                      features=dict(zip(feature_cols, food_features)),
+                      is_energizing=food_row['is_energizing'].values[0],
+                      primary_mood=food_row['primary_mood'].values[0])
+    
+    return {
+        "user_profile": user_profile,
+        "processed_profile": processed_profile,
+        "matching_features": feature_cols,
+        "kacang_energizing_count": len(kacang_energizing),
+        "kacang_energizing_foods": kacang_energizing[['name', 'calories']].to_dict('records')[:3]
+    }
+
 @app.get("/debug/energizing-foods")
 async def debug_energizing_foods():
     """Debug endpoint untuk melihat makanan energizing"""
-    if food_recommender is None or food_recommender.food_df is None:
+    recommender = serving_recommender()
+    if recommender is None or recommender.food_df is None:
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
     
-    df = food_recommender.food_df
+    df = recommender.food_df
     
     # Filter energizing foods
     energizing_foods = df[df['is_energizing'] == 1] if 'is_energizing' in df.columns else df[df['primary_mood'] == 'energizing']
@@ -684,16 +5180,17 @@ async def debug_energizing_foods():
     return {
         "total_energizing_foods": len(energizing_foods),
         "top_10_by_calories": top_energizing[['name', 'calories', 'proteins', 'fat', 'carbohydrate']].to_dict('records'),
-        "search_kacang": df[df['name'].str.contains('kacang', case=False, na=False)][['name', 'calories', 'primary_mood', 'is_energizing']].to_dict('records') if 'is_energizing' in df.columns else []
+        "search_kacang": df.iloc[recommender.find_food_rows('kacang')][['name', 'calories', 'primary_mood', 'is_energizing']].to_dict('records') if 'is_energizing' in df.columns else []
     }
 
 @app.get("/debug/dataset-info")
 async def get_dataset_info():
     """Debug endpoint untuk melihat info dataset"""
-    if food_recommender is None or food_recommender.food_df is None:
+    recommender = serving_recommender()
+    if recommender is None or recommender.food_df is None:
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
     
-    df = food_recommender.food_df
+    df = recommender.food_df
     return {
         "total_foods": len(df),
         "columns": df.columns.tolist(),
@@ -703,115 +5200,782 @@ async def get_dataset_info():
     }
 
 @app.post("/debug/recommend")
-async def debug_recommend(request: RecommendationRequest):
-    """Debug version of recommend endpoint with detailed logging"""
-    if food_recommender is None or food_recommender.food_df is None:
+async def debug_recommend(request: RecommendationRequest, use_cache: bool = False):
+    """Debug version of recommend endpoint; trace lengkap dikembalikan di response"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
         raise HTTPException(status_code=503, detail="Dataset belum dimuat")
+    if not 1 <= request.top_n <= RECOMMEND_MAX_TOP_N:
+        raise HTTPException(status_code=400, detail=TOP_N_ERROR)
     
     try:
-        print(f"\n=== DEBUG RECOMMEND ===")
-        print(f"Request: {request}")
-        
-        # Dapatkan rekomendasi dengan debug output
-        recommendations_df = food_recommender.recommend_for_mood(
-            mood=request.mood,
-            top_n=request.top_n,
-            health_conditions=request.health_conditions
-        )
-        
-        return {
-            "request": request.dict(),
-            "recommendations": recommendations_df.to_dict('records'),
-            "debug_info": "Check server console for detailed logs"
-        }
+        return await THREAD_EXECUTOR.run(debug_recommend_task, request, use_cache)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in debug recommend: {str(e)}")
+        logger.exception("Error in debug recommend: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/recommend", response_model=RecommendationResponse)
-async def get_recommendations(request: RecommendationRequest):
-    """Endpoint utama untuk mendapatkan rekomendasi makanan"""
-    
-    # Validasi food_recommender
-    if food_recommender is None or food_recommender.food_df is None:
+def debug_recommend_task(request, use_cache):
+    """Rekomendasi beserta trace-nya (dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    with collect_trace() as trace:
+        log_event("debug.recommend", request=request.dict())
+
+        # Dapatkan rekomendasi; tanpa cache agar seluruh tahap perhitungan ikut ter-trace
+        if use_cache:
+            recommendations_df = recommender.recommend_for_mood(
+                mood=request.mood,
+                top_n=request.top_n,
+                health_conditions=request.health_conditions
+            )
+        else:
+            mood = request.mood if request.mood in MOOD_FILTERS else 'neutral'
+            timer = StageTimer()
+            recommendations_df = recommender._compute_recommendations(
+                mood, request.top_n, request.health_conditions, timer
+            )
+            timer.log("recommend.timings")
+
+    return {
+        "request": request.dict(),
+        "recommendations": recommendations_df.to_dict('records'),
+        "trace": trace
+    }
+
+@app.get("/debug/stage-timings")
+async def debug_stage_timings():
+    """Histogram waktu per stage recommend_for_mood (detik)"""
+    return {
+        "sample_rate": TIMING_SAMPLE_RATE,
+        "stages": {stage: histogram.snapshot() for stage, histogram in STAGE_TIMINGS.items()}
+    }
+
+VALID_REQUEST_MOODS = ['energizing', 'relaxing', 'focusing', 'neutral', 'multi_category']
+MAX_BATCH_SIZE = int(os.getenv('NUTRIMOOD_MAX_BATCH_SIZE', '10000'))
+RECOMMEND_MAX_TOP_N = 100  # lebih dalam dari ini: /recommend/pages atau /recommend/stream
+TOP_N_ERROR = (f"top_n harus antara 1 dan {RECOMMEND_MAX_TOP_N}; untuk urutan lebih dalam gunakan "
+               f"/recommend/pages atau /recommend/stream")
+
+HTTP_CACHE_MAX_AGE = int(os.getenv('NUTRIMOOD_HTTP_CACHE_MAX_AGE', '60'))  # detik; 0 = selalu revalidasi
+
+def json_bytes(content):
+    """Encode JSON persis seperti JSONResponse (body sama byte per byte)"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def strong_etag(*parts):
+    """ETag kuat dari komponen yang menentukan isi response"""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json_bytes(part))
+        digest.update(b'\0')
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match cocok dengan etag (perbandingan lemah, RFC 9110)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+def cacheable_response(body, etag, request=None):
+    """Response JSON ber-ETag dan Cache-Control; 304 tanpa body jika If-None-Match cocok"""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}"}
+    if request is not None and etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def food_item_dicts(recommendations_df):
+    """Kolom DataFrame rekomendasi -> list dict berbentuk FoodItem (tanpa objek Pydantic)"""
+    # Per kolom (bukan iterrows) agar tidak membuat Series untuk setiap baris
+    n = len(recommendations_df)
+    def column(name, default):
+        if name in recommendations_df.columns:
+            return recommendations_df[name].tolist()
+        return [default] * n
+
+    moods = column('primary_mood', 'unknown')
+    if None in moods:
+        raise ValueError("primary_mood kosong pada hasil rekomendasi")
+    return [
+        {
+            "name": name,
+            "calories": float(calories),
+            "proteins": float(proteins),
+            "fat": float(fat),
+            "carbohydrate": float(carbohydrate),
+            "primary_mood": primary_mood,
+            "similarity_score": float(similarity_score),
+        }
+        for name, calories, proteins, fat, carbohydrate, primary_mood, similarity_score in zip(
+            column('name', 'Unknown'), column('calories', 0), column('proteins', 0), column('fat', 0),
+            column('carbohydrate', 0), moods, column('similarity_score', 0)
+        )
+    ]
+
+def build_recommendation_response(request, recommendations_df, food_items=None):
+    """Body JSON RecommendationResponse langsung dari DataFrame rekomendasi"""
+    if food_items is None:
+        food_items = food_item_dicts(recommendations_df)
+
+    # Buat response message
+    message = f"Ditemukan {len(food_items)} rekomendasi makanan untuk mood '{request.mood}'"
+    if request.health_conditions:
+        message += f" dengan kondisi kesehatan: {', '.join(request.health_conditions)}"
+
+    return json_bytes({
+        "mood": request.mood,
+        "health_conditions": request.health_conditions,
+        "recommendations": food_items,
+        "message": message,
+    })
+
+def recommendation_etag(request):
+    """ETag /recommend: hasil deterministik untuk katalog, mode pencarian dan request yang sama"""
+    recommender = serving_recommender()
+    filters = [sorted(range_filters(request.filters).items())] if request.filters else []
+    return strong_etag(app.version, recommender.catalog_fingerprint(), recommender.health_rules().fingerprint,
+                       recommender.search_mode, request.mood, request.top_n, request.health_conditions, *filters)
+
+async def serve_recommendation(request, http_request=None):
+    """Validasi, ETag dan perhitungan /recommend (POST dan GET)"""
+    # Validasi recommender
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
         raise HTTPException(
             status_code=503,
             detail="Food recommender belum dimuat. Cek status server."
         )
-    
+
     # Validasi mood
-    valid_moods = ['energizing', 'relaxing', 'focusing', 'neutral', 'multi_category']
-    if request.mood not in valid_moods:
+    if request.mood not in VALID_REQUEST_MOODS:
         raise HTTPException(
             status_code=400,
-            detail=f"Mood tidak valid. Pilih salah satu: {valid_moods}"
+            detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}"
         )
-    
+    if not 1 <= request.top_n <= RECOMMEND_MAX_TOP_N:
+        raise HTTPException(status_code=400, detail=TOP_N_ERROR)
+    if request.filters:
+        try:
+            recommender.range_bounds(range_filters(request.filters))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        # Dapatkan rekomendasi
-        recommendations_df = food_recommender.recommend_for_mood(
+        if personalized(request):
+            # Hasil berbeda per user dan mengubah riwayatnya: tanpa ETag dan micro-batching
+            body = await THREAD_EXECUTOR.run(recommend_task, request)
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "private, no-store"})
+        etag = recommendation_etag(request)
+        if http_request is not None and etag_matches(http_request.headers.get('if-none-match'), etag):
+            # Client/CDN sudah punya versi ini: tidak perlu dihitung ulang
+            return cacheable_response(None, etag, http_request)
+        if MICRO_BATCHER is not None:
+            body = await MICRO_BATCHER.submit(request)
+        else:
+            body = await cpu_executor().run(recommend_task, request)
+        return cacheable_response(body, etag)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.post("/recommend", response_model=RecommendationResponse)
+async def get_recommendations(request: RecommendationRequest):
+    """Endpoint utama untuk mendapatkan rekomendasi makanan"""
+    return await serve_recommendation(request)
+
+@app.get("/recommend", response_model=RecommendationResponse)
+async def get_recommendations_cacheable(http_request: Request, mood: str,
+                                        health_conditions: Optional[List[str]] = Query(None), top_n: int = 5,
+                                        user_id: Optional[str] = None):
+    """Sama dengan POST /recommend, tapi bisa di-cache dan direvalidasi (If-None-Match -> 304);
+    dengan user_id hasilnya privat (tidak di-cache)"""
+    request = RecommendationRequest(mood=mood, health_conditions=health_conditions, top_n=top_n, user_id=user_id)
+    return await serve_recommendation(request, http_request)
+
+def personalized(request):
+    """Request dengan user_id dan personalisasi aktif (UserPreferences hanya ada di proses utama)"""
+    return bool(request.user_id) and USER_PREFERENCES is not None
+
+def personalized_recommendations(recommender, request):
+    """Top-N hasil personalize dari PERSONALIZATION_CANDIDATES kandidat; yang ditampilkan dicatat ke riwayat user"""
+    profile = USER_PREFERENCES.get(request.user_id)
+    candidates = recommender.recommend_for_mood(
+        request.mood, max(request.top_n, PERSONALIZATION_CANDIDATES), request.health_conditions,
+        range_filters(request.filters) if request.filters else None
+    )
+    recommendations_df = recommender.personalize(candidates, profile, request.top_n)
+    USER_PREFERENCES.record_shown(profile, request.mood, recommendations_df['name'].tolist(),
+                                  recommendations_df['similarity_score'].tolist())
+    return recommendations_df
+
+def recommend_task(request):
+    """Ranking dan serialisasi /recommend (dijalankan di executor)"""
+    # Dapatkan rekomendasi
+    recommender = serving_recommender()
+    if personalized(request):
+        recommendations_df = personalized_recommendations(recommender, request)
+    else:
+        recommendations_df = recommender.recommend_for_mood(
             mood=request.mood,
             top_n=request.top_n,
-            health_conditions=request.health_conditions
-        )
-        
-        # Convert ke FoodItem objects
-        food_items = []
-        for _, row in recommendations_df.iterrows():
-            food_item = FoodItem(
-                name=row.get('name', 'Unknown'),
-                calories=float(row.get('calories', 0)),
-                proteins=float(row.get('proteins', 0)),
-                fat=float(row.get('fat', 0)),
-                carbohydrate=float(row.get('carbohydrate', 0)),
-                primary_mood=row.get('primary_mood', 'unknown'),
-                similarity_score=float(row.get('similarity_score', 0))
-            )
-            food_items.append(food_item)
-        
-        # Buat response message
-        message = f"Ditemukan {len(food_items)} rekomendasi makanan untuk mood '{request.mood}'"
-        if request.health_conditions:
-            message += f" dengan kondisi kesehatan: {', '.join(request.health_conditions)}"
-        
-        return RecommendationResponse(
-            mood=request.mood,
             health_conditions=request.health_conditions,
-            recommendations=food_items,
-            message=message
+            filters=range_filters(request.filters) if request.filters else None
         )
-        
+    timer = StageTimer()
+    body = build_recommendation_response(request, recommendations_df)
+    timer.lap('serialize')
+    return body
+
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def get_batch_recommendations(requests: List[RecommendationRequest]):
+    """Rekomendasi untuk banyak user sekaligus; error per item tidak menggagalkan batch"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(
+            status_code=503,
+            detail="Food recommender belum dimuat. Cek status server."
+        )
+    if len(requests) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch terlalu besar. Maksimal {MAX_BATCH_SIZE} request"
+        )
+
+    errors = {}  # index -> (status_code, error)
+    valid = []
+    for i, request in enumerate(requests):
+        if request.mood not in VALID_REQUEST_MOODS:
+            errors[i] = (400, f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}")
+            continue
+        if not 1 <= request.top_n <= RECOMMEND_MAX_TOP_N:
+            errors[i] = (400, TOP_N_ERROR)
+            continue
+        if request.filters:
+            try:
+                recommender.range_bounds(range_filters(request.filters))
+            except ValueError as e:
+                errors[i] = (400, str(e))
+                continue
+        valid.append(i)
+
+    # Personalisasi memakai UserPreferences di proses ini, jadi tidak bisa lewat process pool
+    executor = THREAD_EXECUTOR if any(personalized(requests[i]) for i in valid) else cpu_executor()
+    try:
+        body = await executor.run(recommend_batch_task, requests, errors, valid)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    return Response(content=body, media_type="application/json")
+
+def recommend_many_task(requests):
+    """Rekomendasi dan serialisasi banyak request sekaligus (dijalankan di executor).
+
+    Hasil per request berupa body JSON RecommendationResponse atau Exception, urutan sama seperti input.
+    """
+    recommender = serving_recommender()
+    # Request dengan filter rentang atau user_id dihitung sendiri-sendiri (kandidat/urutannya berbeda per request)
+    plain = [i for i, request in enumerate(requests) if not request.filters and not personalized(request)]
+    results = [None] * len(requests)
+    batch = recommender.recommend_batch([
+        (requests[i].mood, requests[i].top_n, requests[i].health_conditions) for i in plain
+    ]) if plain else []
+    for i, result in zip(plain, batch):
+        results[i] = result
+    for i, request in enumerate(requests):
+        if personalized(request):
+            try:
+                results[i] = personalized_recommendations(recommender, request)
+            except Exception as e:
+                results[i] = e
+        elif request.filters:
+            try:
+                results[i] = recommender.recommend_for_mood(request.mood, request.top_n, request.health_conditions,
+                                                            range_filters(request.filters))
+            except Exception as e:
+                results[i] = e
+
+    # Hasil yang sama (DataFrame yang sama) cukup dikonversi sekali
+    food_items_cache = {}
+    responses = []
+    for request, result in zip(requests, results):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            timer = StageTimer()
+            if id(result) not in food_items_cache:
+                food_items_cache[id(result)] = food_item_dicts(result)
+            responses.append(build_recommendation_response(request, result, food_items_cache[id(result)]))
+            timer.lap('serialize')
+        except Exception as e:
+            responses.append(e)
+    return responses
+
+def recommend_batch_task(requests, errors, valid):
+    """Body JSON BatchRecommendationResponse; item valid dihitung di sini (dijalankan di executor)"""
+    responses = dict(zip(valid, recommend_many_task([requests[i] for i in valid])))
+    for i, response in responses.items():
+        if isinstance(response, Exception):
+            errors[i] = (500, f"Error: {str(response)}")
+
+    # Body item yang sudah di-encode disisipkan apa adanya (urutan field sama dengan BatchRecommendationItem)
+    parts = []
+    for i in range(len(requests)):
+        if i in errors:
+            status_code, error = errors[i]
+            parts.append(json_bytes({"index": i, "status_code": status_code, "result": None, "error": error}))
+        else:
+            parts.append(b'{"index":%d,"status_code":200,"result":%s,"error":null}' % (i, responses[i]))
+    return b'{"results":[%s],"total":%d,"failed":%d}' % (b','.join(parts), len(requests), len(errors))
+
+RECOMMEND_PAGE_MAX_SIZE = 200
+STREAM_CHUNK_SIZE = 1000  # baris per chunk NDJSON yang dimaterialisasi sekaligus
+
+def encode_page_cursor(mood, health_conditions, offset, fingerprint):
+    """Cursor opaque: query, posisi awal halaman berikutnya dan fingerprint katalog"""
+    payload = json.dumps([mood, health_conditions, offset, fingerprint], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_page_cursor(cursor):
+    """Kebalikan encode_page_cursor; ValueError jika cursor rusak"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        mood, health_conditions, offset, fingerprint = payload
+    except Exception:
+        raise ValueError("Cursor tidak valid")
+    if (not isinstance(mood, str) or not isinstance(offset, int) or offset < 0 or not isinstance(fingerprint, str)
+            or not (health_conditions is None or (isinstance(health_conditions, list)
+                                                  and all(isinstance(c, str) for c in health_conditions)))):
+        raise ValueError("Cursor tidak valid")
+    return mood, health_conditions, offset, fingerprint
+
+@app.post("/recommend/pages", response_model=RecommendationPage)
+async def get_recommendation_page(request: RecommendationPageRequest):
+    """Seluruh urutan rekomendasi per halaman dengan cursor (tidak dibatasi top 10)"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(
+            status_code=503,
+            detail="Food recommender belum dimuat. Cek status server."
+        )
+    if not 1 <= request.page_size <= RECOMMEND_PAGE_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size harus antara 1 dan {RECOMMEND_PAGE_MAX_SIZE}")
+
+    fingerprint = None
+    mood, health_conditions, offset = request.mood, request.health_conditions, 0
+    if request.cursor is not None:
+        try:
+            mood, health_conditions, offset, fingerprint = decode_page_cursor(request.cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if (request.mood is not None and request.mood != mood) or \
+                (request.health_conditions is not None and request.health_conditions != health_conditions):
+            raise HTTPException(status_code=400, detail="Cursor tidak cocok dengan mood/health_conditions request")
+    if mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}"
+        )
+
+    try:
+        # Urutan di-cache di proses ini, jadi selalu lewat thread pool
+        body = await THREAD_EXECUTOR.run(
+            recommend_page_task, mood, health_conditions, offset, request.page_size, fingerprint
+        )
+        return Response(content=body, media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+def recommend_page_task(mood, health_conditions, offset, page_size, fingerprint):
+    """Body JSON satu halaman dari urutan lengkap yang di-cache (dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    current = recommender.catalog_fingerprint()
+    if fingerprint is not None and fingerprint != current:
+        raise HTTPException(
+            status_code=410,
+            detail="Cursor kedaluwarsa karena katalog berubah. Mulai lagi dari halaman pertama."
+        )
+    ranked = recommender.ranking(mood, health_conditions)
+    total = len(ranked[0])
+    end = offset + page_size
+    page_df = recommender.ranking_slice(ranked, offset, end)
+    return json_bytes({
+        "mood": mood,
+        "health_conditions": health_conditions,
+        "recommendations": food_item_dicts(page_df),
+        "offset": offset,
+        "total": total,
+        "next_cursor": encode_page_cursor(mood, health_conditions, end, current) if end < total else None,
+    })
+
+@app.post("/recommend/stream")
+async def stream_recommendations(request: RecommendationStreamRequest):
+    """Seluruh urutan rekomendasi sebagai NDJSON (satu FoodItem per baris) untuk export"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(
+            status_code=503,
+            detail="Food recommender belum dimuat. Cek status server."
+        )
+    if request.mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}"
+        )
+    if request.limit is not None and request.limit < 1:
+        raise HTTPException(status_code=400, detail="limit harus >= 1")
+
+    try:
+        ranked = await THREAD_EXECUTOR.run(recommender.ranking, request.mood, request.health_conditions)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+    total = len(ranked[0]) if request.limit is None else min(request.limit, len(ranked[0]))
+    # Generator sinkron: Starlette mengiterasinya di threadpool, bukan di event loop
+    return StreamingResponse(
+        ndjson_chunks(recommender, ranked, total),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(total)}
+    )
+
+def ndjson_chunks(recommender, ranked, total):
+    """Materialisasi dan serialisasi urutan per STREAM_CHUNK_SIZE baris"""
+    for start in range(0, total, STREAM_CHUNK_SIZE):
+        chunk_df = recommender.ranking_slice(ranked, start, min(start + STREAM_CHUNK_SIZE, total))
+        yield b''.join(json_bytes(item) + b'\n' for item in food_item_dicts(chunk_df))
+
+def mood_predictions(classifier, features):
+    """Satu forward pass untuk semua baris fitur -> list MoodPrediction"""
+    probabilities = classifier.predict_proba(features)
+    best = probabilities.argmax(axis=1)
+    return [
+        MoodPrediction(
+            mood=classifier.labels[i],
+            confidence=float(row[i]),
+            probabilities=dict(zip(classifier.labels, row.tolist()))
+        )
+        for i, row in zip(best.tolist(), probabilities)
+    ]
+
+def predict_mood_task(features):
+    """Forward pass classifier (dijalankan di executor)"""
+    return mood_predictions(serving_classifier(), features)
+
+def mood_request_features(request):
+    return encode_mood_features([getattr(request, feature) for feature in MOOD_CLASSIFIER_FEATURES])
+
+@app.post("/predict-mood", response_model=MoodPrediction)
+async def predict_mood(request: MoodPredictionRequest):
+    """Prediksi primary_mood dari kategori kalori/protein/lemak/karbohidrat"""
+    classifier = serving_classifier()
+    if classifier is None:
+        raise HTTPException(status_code=503, detail="Mood classifier belum dimuat. Cek status server.")
+    try:
+        features = mood_request_features(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return (await cpu_executor().run(predict_mood_task, [features]))[0]
+
+@app.post("/predict-mood/batch", response_model=BatchMoodPredictionResponse)
+async def predict_mood_batch(requests: List[MoodPredictionRequest]):
+    """Prediksi mood untuk banyak input sekaligus dalam satu forward pass"""
+    classifier = serving_classifier()
+    if classifier is None:
+        raise HTTPException(status_code=503, detail="Mood classifier belum dimuat. Cek status server.")
+    if len(requests) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch terlalu besar. Maksimal {MAX_BATCH_SIZE} request"
+        )
+
+    items = [BatchMoodPredictionItem(index=i) for i in range(len(requests))]
+    valid, features = [], []
+    for i, request in enumerate(requests):
+        try:
+            features.append(mood_request_features(request))
+            valid.append(i)
+        except ValueError as e:
+            items[i].status_code = 400
+            items[i].error = str(e)
+
+    if valid:
+        for i, prediction in zip(valid, await cpu_executor().run(predict_mood_task, features)):
+            items[i].result = prediction
+
+    failed = sum(1 for item in items if item.error is not None)
+    return BatchMoodPredictionResponse(results=items, total=len(items), failed=failed)
+
+FOOD_SEARCH_MAX_LIMIT = 100
+
+def search_foods_task(q, limit, offset):
+    """Lookup indeks nama (dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    results_df, total = recommender.search_foods(q, limit=limit, offset=offset)
+    results = [
+        FoodSearchResult(
+            id=food_id,
+            name=name,
+            match=match,
+            score=round(float(score), 4),
+            calories=calories,
+            proteins=proteins,
+            fat=fat,
+            carbohydrate=carbohydrate,
+            primary_mood=primary_mood
+        )
+        for food_id, name, match, score, calories, proteins, fat, carbohydrate, primary_mood in zip(
+            results_df.index, results_df['name'], results_df['match'], results_df['similarity_score'],
+            results_df['calories'], results_df['proteins'], results_df['fat'], results_df['carbohydrate'],
+            results_df['primary_mood']
+        )
+    ]
+    return FoodSearchResponse(query=q, total=total, limit=limit, offset=offset, results=results)
+
+@app.get("/foods/search", response_model=FoodSearchResponse)
+async def search_foods(q: str, limit: int = 10, offset: int = 0):
+    """Cari makanan berdasarkan nama (tanpa beda huruf besar/kecil dan diakritik, toleran typo)"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(status_code=503, detail="Dataset belum dimuat")
+    if not normalize_name(q):
+        raise HTTPException(status_code=400, detail="Query pencarian tidak boleh kosong")
+    if not 1 <= limit <= FOOD_SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit harus antara 1 dan {FOOD_SEARCH_MAX_LIMIT}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset tidak boleh negatif")
+    return await THREAD_EXECUTOR.run(search_foods_task, q, limit, offset)
+
+def query_foods_task(request):
+    """Filter rentang nutrisi (+ ranking jika ada mood), dijalankan di thread executor"""
+    recommender = serving_recommender()
+    results_df, total = recommender.query_foods(range_filters(request.filters), request.mood,
+                                                request.health_conditions, request.limit, request.offset)
+    results = [
+        FoodQueryResult(
+            id=food_id,
+            name=name,
+            calories=calories,
+            proteins=proteins,
+            fat=fat,
+            carbohydrate=carbohydrate,
+            primary_mood=primary_mood,
+            similarity_score=None if request.mood is None else float(score)
+        )
+        for food_id, name, calories, proteins, fat, carbohydrate, primary_mood, score in zip(
+            results_df.index, results_df['name'], results_df['calories'], results_df['proteins'],
+            results_df['fat'], results_df['carbohydrate'], results_df['primary_mood'], results_df['similarity_score']
+        )
+    ]
+    return FoodQueryResponse(total=total, limit=request.limit, offset=request.offset, results=results)
+
+@app.post("/foods/query", response_model=FoodQueryResponse)
+async def query_foods(request: FoodQueryRequest):
+    """Makanan dengan nutrisi/kategori dalam rentang tertentu, opsional diurutkan untuk satu mood"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(status_code=503, detail="Dataset belum dimuat")
+    if request.mood is not None and request.mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(status_code=400, detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}")
+    if request.mood is None and request.health_conditions:
+        # Tanpa mood tidak ada skor untuk diberi penalti kondisi; hasil tanpa filter kondisi menyesatkan
+        raise HTTPException(status_code=422, detail="health_conditions hanya bisa dipakai bersama mood")
+    if not 1 <= request.limit <= FOOD_SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit harus antara 1 dan {FOOD_SEARCH_MAX_LIMIT}")
+    if request.offset < 0:
+        raise HTTPException(status_code=400, detail="offset tidak boleh negatif")
+    try:
+        return await THREAD_EXECUTOR.run(query_foods_task, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+SIMILAR_FOODS_MAX_K = 100
+
+def similar_foods_task(food_id, k, mood, health_conditions):
+    """Lookup daftar tetangga (dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    row = recommender.food_position(food_id)
+    results_df, used_mood = recommender.similar_foods(row, k, mood, health_conditions)
+    food = recommender.foods_at([row])
+    results = [
+        FoodQueryResult(
+            id=neighbour_id,
+            name=name,
+            calories=calories,
+            proteins=proteins,
+            fat=fat,
+            carbohydrate=carbohydrate,
+            primary_mood=primary_mood,
+            similarity_score=round(float(score), 4)
+        )
+        for neighbour_id, name, calories, proteins, fat, carbohydrate, primary_mood, score in zip(
+            results_df.index, results_df['name'], results_df['calories'], results_df['proteins'],
+            results_df['fat'], results_df['carbohydrate'], results_df['primary_mood'], results_df['similarity_score']
+        )
+    ]
+    return SimilarFoodsResponse(id=food.index[0], name=food['name'].iloc[0], mood=used_mood,
+                                health_conditions=health_conditions, results=results)
+
+@app.get("/foods/{food_id}/similar", response_model=SimilarFoodsResponse)
+async def get_similar_foods(food_id: str, k: int = 10, mood: Optional[str] = None,
+                            health_conditions: Optional[List[str]] = Query(None)):
+    """Makanan paling mirip (ruang fitur rekomendasi), opsional dibatasi mood dan kondisi kesehatan"""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(status_code=503, detail="Dataset belum dimuat")
+    if mood is not None and mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(status_code=400, detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}")
+    if not 1 <= k <= SIMILAR_FOODS_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k harus antara 1 dan {SIMILAR_FOODS_MAX_K}")
+    try:
+        return await THREAD_EXECUTOR.run(similar_foods_task, food_id, k, mood, health_conditions)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Makanan dengan id {food_id} tidak ditemukan")
+
+MEAL_PLAN_MAX_DAYS = 31
+MEAL_PLAN_MAX_SNACKS = 3
+MEAL_PLAN_MAX_BUDGET_MS = 1000
+
+def meal_plan_task(request):
+    """Kandidat + solver meal plan (dijalankan di thread executor)"""
+    recommender = serving_recommender()
+    budget = (request.time_budget_ms if request.time_budget_ms is not None else MEAL_PLAN_BUDGET_MS) / 1000
+    candidates, plan, slots, targets = recommender.meal_plan(request.mood, request.days, request.health_conditions,
+                                                             request.snacks, request.targets, budget)
+    used = np.unique(plan.items)
+    chosen = candidates.iloc[used]
+    foods = dict(zip(used.tolist(), (
+        FoodQueryResult(
+            id=food_id,
+            name=name,
+            calories=calories,
+            proteins=proteins,
+            fat=fat,
+            carbohydrate=carbohydrate,
+            primary_mood=primary_mood,
+            similarity_score=float(score)
+        )
+        for food_id, name, calories, proteins, fat, carbohydrate, primary_mood, score in zip(
+            chosen.index, chosen['name'], chosen['calories'], chosen['proteins'],
+            chosen['fat'], chosen['carbohydrate'], chosen['primary_mood'], chosen['similarity_score']
+        )
+    )))
+    nutrients = candidates[list(MEAL_PLAN_NUTRIENTS)].to_numpy(dtype=np.float64)
+    days = []
+    for day, items in enumerate(plan.items, start=1):
+        totals = nutrients[items].sum(axis=0)
+        days.append(MealPlanDay(
+            day=day,
+            meals=[MealPlanMeal(slot=slot, food=foods[item]) for slot, item in zip(slots, items)],
+            totals={name: round(float(total), 6) for name, total in zip(MEAL_PLAN_NUTRIENTS, totals)},
+            deviation={name: round(float(total / target - 1), 4)
+                       for name, total, target in zip(MEAL_PLAN_NUTRIENTS, totals, targets)}
+        ))
+    return MealPlanResponse(
+        mood=request.mood,
+        health_conditions=request.health_conditions,
+        targets={name: round(float(target), 6) for name, target in zip(MEAL_PLAN_NUTRIENTS, targets)},
+        days=days,
+        solver=MealPlanSolverStats(
+            objective=round(plan.objective, 6),
+            iterations=plan.iterations,
+            kicks=plan.kicks,
+            converged=plan.converged,
+            elapsed_ms=round(plan.elapsed * 1000, 3),
+            candidates=len(candidates)
+        )
+    )
+
+@app.post("/meal-plan", response_model=MealPlanResponse)
+async def create_meal_plan(request: MealPlanRequest):
+    """Plan makan beberapa hari (sarapan, makan siang, makan malam, snack) untuk mood dan kondisi kesehatan.
+
+    targets memakai satuan katalog: nutrisi per makanan dinormalisasi 0-1, jadi target harian
+    paling besar jumlah slot per hari; nilai kkal/gram dijawab 422."""
+    recommender = serving_recommender()
+    if recommender is None or not recommender.is_loaded():
+        raise HTTPException(status_code=503, detail="Food recommender belum dimuat. Cek status server.")
+    if request.mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(status_code=400, detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}")
+    if not 1 <= request.days <= MEAL_PLAN_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days harus antara 1 dan {MEAL_PLAN_MAX_DAYS}")
+    if not 0 <= request.snacks <= MEAL_PLAN_MAX_SNACKS:
+        raise HTTPException(status_code=400, detail=f"snacks harus antara 0 dan {MEAL_PLAN_MAX_SNACKS}")
+    if request.time_budget_ms is not None and not 0 < request.time_budget_ms <= MEAL_PLAN_MAX_BUDGET_MS:
+        raise HTTPException(status_code=400, detail=f"time_budget_ms harus antara 0 dan {MEAL_PLAN_MAX_BUDGET_MS}")
+    if request.targets:
+        try:
+            recommender.check_meal_plan_targets(request.targets, len(meal_plan_slots(request.snacks)[0]))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        return await THREAD_EXECUTOR.run(meal_plan_task, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/users/{user_id}/feedback")
+async def record_user_feedback(user_id: str, request: UserFeedbackRequest, authorization: Optional[str] = Header(None)):
+    """Catat makanan yang disukai/dikonsumsi user (mis. diteruskan dari tabel food_recommendations
+    Supabase) ke store personalisasi; request /recommend berikutnya dengan user_id ini memakainya"""
+    require_feedback_token(authorization)
+    if USER_PREFERENCES is None:
+        raise HTTPException(status_code=503, detail="Personalisasi tidak aktif (NUTRIMOOD_USER_STORE_PATH kosong)")
+    if request.mood not in VALID_REQUEST_MOODS:
+        raise HTTPException(status_code=400, detail=f"Mood tidak valid. Pilih salah satu: {VALID_REQUEST_MOODS}")
+    if not 1 <= len(request.items) <= USER_FEEDBACK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"items harus berisi 1 sampai {USER_FEEDBACK_MAX_ITEMS} makanan")
+    empty = [item.food_name for item in request.items if not (item.is_liked or item.is_consumed)]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Makanan {empty[:5]} tanpa is_liked atau is_consumed")
+    recommender = serving_recommender()
+    if recommender is not None and recommender.is_loaded():
+        names = [item.food_name for item in request.items]
+        unknown = [name for name, row in zip(names, recommender.food_rows_by_name(names).tolist()) if row < 0]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Makanan {unknown[:5]} tidak ada di katalog")
+    feedback = [(item.food_name, item.is_liked, item.is_consumed) for item in request.items]
+    await THREAD_EXECUTOR.run(USER_PREFERENCES.record_feedback, user_id, request.mood, feedback)
+    return {"user_id": user_id, "recorded": len(feedback)}
+
+# Endpoint statis: body di-render sekali saat import, ETag dari isi body
+MOODS_BODY = json_bytes({
+    "moods": ["energizing", "relaxing", "focusing", "neutral"],
+    "description": {
+        "energizing": "Makanan untuk meningkatkan energi",
+        "relaxing": "Makanan untuk relaksasi",
+        "focusing": "Makanan untuk meningkatkan fokus",
+        "neutral": "Makanan netral"
+    }
+})
+MOODS_ETAG = strong_etag(MOODS_BODY)
+
+# Kondisi bawaan ditambah kondisi dari NUTRIMOOD_HEALTH_RULES_PATH
+_health_descriptions = {**HEALTH_CONDITION_DESCRIPTIONS, **{
+    condition: rule.get('description', HEALTH_CONDITION_DESCRIPTIONS.get(condition, condition))
+    for condition, rule in HEALTH_RULES.items()
+}}
+HEALTH_CONDITIONS_BODY = json_bytes({
+    "health_conditions": list(_health_descriptions),
+    "description": _health_descriptions
+})
+HEALTH_CONDITIONS_ETAG = strong_etag(HEALTH_CONDITIONS_BODY)
+
 @app.get("/moods")
-async def get_available_moods():
+async def get_available_moods(request: Request):
     """Daftar mood yang tersedia"""
-    return {
-        "moods": ["energizing", "relaxing", "focusing", "neutral"],
-        "description": {
-            "energizing": "Makanan untuk meningkatkan energi",
-            "relaxing": "Makanan untuk relaksasi", 
-            "focusing": "Makanan untuk meningkatkan fokus",
-            "neutral": "Makanan netral"
-        }
-    }
+    return cacheable_response(MOODS_BODY, MOODS_ETAG, request)
 
 @app.get("/health-conditions")
-async def get_available_health_conditions():
+async def get_available_health_conditions(request: Request):
     """Daftar kondisi kesehatan yang tersedia"""
-    return {
-        "health_conditions": ["diabetes", "hipertensi", "kolesterol", "obesitas", "alergi_gluten", "vegetarian"],
-        "description": {
-            "diabetes": "Kondisi diabetes mellitus",
-            "hipertensi": "Tekanan darah tinggi", 
-            "kolesterol": "Kolesterol tinggi",
-            "obesitas": "Kelebihan berat badan",
-            "alergi_gluten": "Alergi terhadap gluten",
-            "vegetarian": "Diet vegetarian"
-        }
-    }
+    return cacheable_response(HEALTH_CONDITIONS_BODY, HEALTH_CONDITIONS_ETAG, request)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,49 @@
+# tests/conftest.py
+"""Fixture bersama: app dengan model asli di models/, token admin/feedback dan store user sementara.
+
+Konfigurasi dibaca main saat import, jadi environment di-set sebelum main di-import.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_STORE_DIR = tempfile.mkdtemp(prefix='nutrimood-test-users-')
+
+ADMIN_TOKEN = 'test-admin-token'
+FEEDBACK_TOKEN = 'test-feedback-token'
+
+os.environ.update(
+    NUTRIMOOD_ADMIN_TOKEN=ADMIN_TOKEN,
+    NUTRIMOOD_USER_FEEDBACK_TOKEN=FEEDBACK_TOKEN,
+    NUTRIMOOD_USER_STORE_PATH=os.path.join(USER_STORE_DIR, 'user_store.sqlite'),
+    NUTRIMOOD_RELOAD_POLL_SECONDS='0',
+    NUTRIMOOD_LOG_LEVEL='WARNING',
+)
+os.chdir(BACKEND_DIR)  # path model relatif terhadap backend/
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def main_module():
+    import main
+    return main
+
+
+@pytest.fixture(scope='session')
+def client(main_module):
+    from fastapi.testclient import TestClient
+    with TestClient(main_module.app) as client:
+        yield client
+
+
+@pytest.fixture
+def admin_headers():
+    return {'Authorization': f'Bearer {ADMIN_TOKEN}'}
+
+
+@pytest.fixture
+def feedback_headers():
+    return {'Authorization': f'Bearer {FEEDBACK_TOKEN}'}
@@ -0,0 +1,46 @@
+# tests/test_auth.py
+import pytest
+
+ADMIN_ENDPOINTS = [
+    ('get', '/admin/reload', None),
+    ('post', '/admin/reload', None),
+    ('post', '/admin/foods', {'deletes': ['Tidak Ada']}),
+]
+FEEDBACK_BODY = {'items': [{'food_name': 'Roti Putih', 'is_liked': True}]}
+
+
+@pytest.mark.parametrize('method, path, body', ADMIN_ENDPOINTS)
+def test_admin_wrong_token_unauthorized(client, method, path, body):
+    for headers in ({}, {'Authorization': 'Bearer salah'}, {'Authorization': 'test-admin-token'}):
+        response = client.request(method, path, json=body, headers=headers)
+        assert response.status_code == 401
+        assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+@pytest.mark.parametrize('method, path, body', ADMIN_ENDPOINTS)
+def test_admin_disabled_without_token(client, main_module, monkeypatch, admin_headers, method, path, body):
+    monkeypatch.setattr(main_module, 'ADMIN_TOKEN', None)
+    assert client.request(method, path, json=body, headers=admin_headers).status_code == 404
+
+
+def test_admin_status_with_token(client, admin_headers):
+    response = client.get('/admin/reload', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()['version']
+
+
+def test_feedback_wrong_token_unauthorized(client, admin_headers):
+    for headers in ({}, {'Authorization': 'Bearer salah'}, admin_headers):
+        response = client.post('/users/u-auth/feedback', json=FEEDBACK_BODY, headers=headers)
+        assert response.status_code == 401
+
+
+def test_feedback_disabled_without_token(client, main_module, monkeypatch, feedback_headers):
+    monkeypatch.setattr(main_module, 'USER_FEEDBACK_TOKEN', None)
+    assert client.post('/users/u-auth/feedback', json=FEEDBACK_BODY, headers=feedback_headers).status_code == 404
+
+
+def test_feedback_with_token(client, feedback_headers):
+    response = client.post('/users/u-auth/feedback', json=FEEDBACK_BODY, headers=feedback_headers)
+    assert response.status_code == 200
+    assert response.json() == {'user_id': 'u-auth', 'recorded': 1}
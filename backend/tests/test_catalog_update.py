@@ -0,0 +1,40 @@
+# tests/test_catalog_update.py
+import pytest
+
+VALID = {'name': 'Makanan Test', 'calories': 0.2, 'proteins': 0.1, 'fat': 0.1, 'carbohydrate': 0.2,
+         'primary_mood': 'energizing', 'calorie_category': 'low', 'protein_category': 'low',
+         'fat_category': 'low', 'carb_category': 'low', 'nutrient_balance': 'balanced'}
+
+INVALID = [
+    {**VALID, 'primary_mood': 'sedih'},
+    {**VALID, 'calorie_category': 'raksasa'},
+    {**VALID, 'name': '   '},
+    {**VALID, 'calories': float('nan')},
+    {**VALID, 'kolom_asing': 1},
+]
+
+
+@pytest.mark.parametrize('upsert', INVALID)
+def test_invalid_upsert_keeps_snapshot(client, main_module, upsert):
+    before = main_module.serving_snapshot()
+    with pytest.raises(ValueError):
+        main_module.RELOADER.update([upsert], [])
+    assert main_module.serving_snapshot() is before
+    assert not main_module.RELOADER._lock.locked()
+
+
+def test_upsert_and_delete_same_name_rejected(client, main_module):
+    before = main_module.serving_snapshot()
+    name = before.recommender.food_df['name'].iloc[0]
+    with pytest.raises(ValueError):
+        main_module.RELOADER.update([{**VALID, 'name': name}], [name])
+    assert main_module.serving_snapshot() is before
+
+
+def test_invalid_upsert_over_http_returns_400(client, main_module, admin_headers):
+    before = client.get('/admin/reload', headers=admin_headers).json()['version']
+    response = client.post('/admin/foods', json={'upserts': [{**VALID, 'primary_mood': 'sedih'}]}, headers=admin_headers)
+    assert response.status_code == 400
+    assert client.get('/admin/reload', headers=admin_headers).json()['version'] == before
+    served = client.post('/recommend', json={'mood': 'energizing', 'top_n': 100}).json()['recommendations']
+    assert VALID['name'] not in [food['name'] for food in served]
@@ -0,0 +1,50 @@
+# tests/test_foods_query.py
+import pytest
+
+
+def test_health_conditions_without_mood_rejected(client):
+    response = client.post('/foods/query', json={'filters': {'calories': {'max': 0.3}},
+                                                 'health_conditions': ['diabetes']})
+    assert response.status_code == 422
+    assert 'mood' in response.json()['detail']
+
+
+def test_health_conditions_with_mood_ranked(client):
+    response = client.post('/foods/query', json={'filters': {'calories': {'max': 0.3}}, 'mood': 'energizing',
+                                                 'health_conditions': ['diabetes'], 'limit': 5})
+    assert response.status_code == 200
+    foods = response.json()['results']
+    assert foods and all(food['similarity_score'] is not None for food in foods)
+    assert all(food['calories'] <= 0.3 for food in foods)
+
+
+def test_library_rejects_health_conditions_without_mood(main_module, client):
+    with pytest.raises(ValueError):
+        main_module.serving_recommender().query_foods({'calories': (None, 0.3)}, None, ['diabetes'])
+
+
+@pytest.mark.parametrize('filters', [
+    {'calories': {'max': 300}},          # kkal, bukan nilai ternormalisasi
+    {'proteins': {'min': -0.5}},
+    {'carb_category': {'max': 9}},
+    {'fat_category': {'max': 'sangat_tinggi'}},
+    {'sodium': {'max': 0.5}},            # filter tidak dikenal
+    {'calories': {'min': 0.6, 'max': 0.2}},
+])
+def test_invalid_bounds_rejected(client, filters):
+    response = client.post('/foods/query', json={'filters': filters})
+    assert response.status_code == 400
+
+
+def test_physical_units_message_mentions_normalized(client):
+    detail = client.post('/foods/query', json={'filters': {'calories': {'max': 300}}}).json()['detail']
+    assert 'ternormalisasi' in detail
+
+
+def test_valid_bounds_filter_results(client):
+    response = client.post('/foods/query', json={'filters': {'calories': {'min': 0.1, 'max': 0.3},
+                                                             'carb_category': {'max': 'low'}}})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['total'] > 0
+    assert all(0.1 <= food['calories'] <= 0.3 for food in body['results'])
@@ -0,0 +1,32 @@
+# tests/test_meal_plan.py
+import pytest
+
+
+def plan(client, **body):
+    return client.post('/meal-plan', json={'mood': 'energizing', 'days': 2, 'time_budget_ms': 20, **body})
+
+
+def test_normalized_targets_accepted(client):
+    response = plan(client, targets={'calories': 0.37, 'proteins': 0.1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['targets']['calories'] == pytest.approx(0.37)
+    assert len(body['days']) == 2
+
+
+@pytest.mark.parametrize('targets', [{'calories': 2000, 'proteins': 60}, {'fat': 4.5}])
+def test_physical_unit_targets_rejected(client, targets):
+    response = plan(client, targets=targets)
+    assert response.status_code == 422
+    assert 'nilai ternormalisasi, bukan kkal/gram' in response.json()['detail']
+
+
+def test_range_scales_with_slots(client):
+    # 3 snack: 6 slot per hari, jadi 5 masih mungkin
+    assert plan(client, snacks=3, targets={'calories': 5}).status_code == 200
+    assert plan(client, snacks=0, targets={'calories': 5}).status_code == 422
+
+
+@pytest.mark.parametrize('targets', [{'sodium': 0.5}, {'calories': 0}, {'calories': -0.2}])
+def test_unknown_or_non_positive_targets_rejected(client, targets):
+    assert plan(client, targets=targets).status_code == 400
@@ -0,0 +1,37 @@
+# tests/test_recommend_cache.py
+PARAMS = {'mood': 'energizing', 'top_n': 5}
+
+
+def test_etag_round_trip(client):
+    first = client.get('/recommend', params=PARAMS)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert 'public' in first.headers['Cache-Control']
+
+    cached = client.get('/recommend', params=PARAMS, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.content == b''
+    assert cached.headers['ETag'] == etag
+
+    assert client.get('/recommend', params=PARAMS, headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert client.get('/recommend', params=PARAMS, headers={'If-None-Match': '"lain"'}).status_code == 200
+
+
+def test_etag_differs_per_request(client):
+    energizing = client.get('/recommend', params=PARAMS).headers['ETag']
+    relaxing = client.get('/recommend', params={**PARAMS, 'mood': 'relaxing'}).headers['ETag']
+    assert energizing != relaxing
+
+
+def test_post_matches_get(client):
+    get = client.get('/recommend', params=PARAMS)
+    post = client.post('/recommend', json=PARAMS)
+    assert post.json() == get.json()
+    assert post.headers['ETag'] == get.headers['ETag']
+
+
+def test_personalized_response_not_cacheable(client):
+    response = client.get('/recommend', params={**PARAMS, 'user_id': 'u-cache'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'private, no-store'
@@ -0,0 +1,58 @@
+# tests/test_recommend_pages.py
+import base64
+import json
+
+
+def decode(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+
+def encode(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def first_page(client):
+    response = client.post('/recommend/pages', json={'mood': 'energizing', 'page_size': 5})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_cursor_continues_ranking(client):
+    page = first_page(client)
+    following = client.post('/recommend/pages', json={'cursor': page['next_cursor'], 'page_size': 5}).json()
+    assert following['offset'] == 5
+    whole = client.post('/recommend/pages', json={'mood': 'energizing', 'page_size': 10}).json()
+    assert [food['name'] for food in page['recommendations'] + following['recommendations']] == \
+        [food['name'] for food in whole['recommendations']]
+
+
+def test_garbage_cursor_rejected(client):
+    for cursor in ('bukan-cursor', encode({'mood': 'energizing'}), encode(['energizing', None, 5])):
+        response = client.post('/recommend/pages', json={'cursor': cursor})
+        assert response.status_code == 400
+        assert response.json()['detail'] == "Cursor tidak valid"
+
+
+def test_tampered_offset_rejected(client):
+    mood, conditions, _, fingerprint = decode(first_page(client)['next_cursor'])
+    for offset in (-1, 'lima', 2.5):
+        response = client.post('/recommend/pages', json={'cursor': encode([mood, conditions, offset, fingerprint])})
+        assert response.status_code == 400
+
+
+def test_tampered_fingerprint_expired(client):
+    mood, conditions, offset, _ = decode(first_page(client)['next_cursor'])
+    response = client.post('/recommend/pages', json={'cursor': encode([mood, conditions, offset, 'katalog-lain'])})
+    assert response.status_code == 410
+
+
+def test_tampered_mood_rejected(client):
+    _, conditions, offset, fingerprint = decode(first_page(client)['next_cursor'])
+    response = client.post('/recommend/pages', json={'cursor': encode(['sedih', conditions, offset, fingerprint])})
+    assert response.status_code == 400
+
+
+def test_cursor_must_match_request(client):
+    cursor = first_page(client)['next_cursor']
+    response = client.post('/recommend/pages', json={'cursor': cursor, 'mood': 'relaxing'})
+    assert response.status_code == 400
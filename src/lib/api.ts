@@ -73,10 +73,17 @@ export const api = {
   recommend: async (
     data: FoodRecommendationRequest
   ): Promise<FoodRecommendationResponse> => {
-    const response = await apiRequest(API_CONFIG.ENDPOINTS.RECOMMEND, {
-      method: "POST",
-      body: JSON.stringify(data),
-    });
+    // GET so the browser/CDN can revalidate with the ETag (304) instead of recomputing
+    const params = new URLSearchParams({ mood: data.mood });
+    data.health_conditions?.forEach((condition) =>
+      params.append("health_conditions", condition)
+    );
+    if (data.top_n !== undefined) {
+      params.set("top_n", String(data.top_n));
+    }
+    const response = await apiRequest(
+      `${API_CONFIG.ENDPOINTS.RECOMMEND}?${params.toString()}`
+    );
     return response.json();
   },
 